@@ -0,0 +1,219 @@
+# activity_index.py - ИНДЕКС АКТИВНОСТИ ПО ДНЯМ (DAU/WAU/MAU)
+#
+# Каждому пользователю присваивается плотный номер бита, а на каждый день
+# хранится битовая карта (целое число Python) пользователей, активных в этот
+# день. Активные за период — объединение (|) карт нескольких дней и подсчёт
+# битов, без обхода всех пользователей и сравнения дат.
+#
+# Карта дня пополняется при каждом изменении активности (подписка на
+# persistence) и хранится на диске, поэтому история дневной активности
+# накапливается и переживает перезапуск. При старте индекс дополняется
+# днями first_seen и last_activity каждого пользователя: так в него
+# попадают первый день пользователя (когорта в cohorts.py) и активность,
+# не успевшая записаться до остановки. Дни между ними, прошедшие до
+# появления индекса, восстановить нельзя. Новый пользователь, пришедший
+# событием, тоже отмечается в день first_seen.
+#
+# Викторина и дуэли в bot.py обновляют last_activity без mark_dirty: записи
+# ActivityRecord сообщают об этом сами (compact.track_changes), остальные
+# находит фоновый поиск изменений (change_scan.py) не реже раза
+# в CHANGE_SCAN_INTERVAL, поэтому день отмечается и без touch_user().
+# Снимок статистики и экран когорт перед чтением вызывают sync_changes().
+
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityIndex:
+    """Битовые карты активных пользователей по дням"""
+
+    def __init__(self, path: Optional[Path] = None, keep_days: int = 400, delay: float = 30.0):
+        self.path = Path(path) if path else None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.keep_days = keep_days
+        self.delay = delay
+
+        self._bits: Dict[Hashable, int] = {}
+        self._users: List[Hashable] = []
+        self._days: Dict[int, int] = {}
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+
+    # ==============================
+    # ОБНОВЛЕНИЕ
+    # ==============================
+
+    def _bit(self, user_id: Hashable) -> int:
+        bit = self._bits.get(user_id)
+        if bit is None:
+            bit = self._bits[user_id] = len(self._users)
+            self._users.append(user_id)
+        return bit
+
+    def _mark(self, user_id: Hashable, when: datetime) -> bool:
+        """Поставить бит пользователя в карте дня; False, если уже стоял"""
+        day = when.date().toordinal()
+        mask = 1 << self._bit(user_id)
+        current = self._days.get(day, 0)
+        if current & mask:
+            return False
+        self._days[day] = current | mask
+        return True
+
+    def record(self, user_id: Hashable, when: Optional[datetime] = None):
+        """Отметить активность пользователя в день when (по умолчанию сегодня)"""
+        if self._mark(user_id, when or datetime.now()):
+            self._schedule_save()
+
+    def on_activity(self, user_id: Hashable, activity: Any):
+        """Обработчик изменений user_activities"""
+        if activity is None:
+            return
+        changed = False
+        if user_id not in self._bits and activity.first_seen:
+            changed = self._mark(user_id, activity.first_seen)
+        if activity.last_activity:
+            changed = self._mark(user_id, activity.last_activity) or changed
+        if changed:
+            self._schedule_save()
+
+    def seed(self, activities: Dict[Hashable, Any]):
+        """Дополнение индекса днями first_seen и last_activity всех пользователей"""
+        for user_id, activity in activities.items():
+            for when in (activity.first_seen, activity.last_activity):
+                if when:
+                    self._mark(user_id, when)
+        self._schedule_save()
+
+    # ==============================
+    # ЗАПРОСЫ
+    # ==============================
+
+    def _mask(self, start: date, end: date) -> int:
+        mask = 0
+        for day in range(start.toordinal(), end.toordinal() + 1):
+            mask |= self._days.get(day, 0)
+        return mask
+
+    def active_between(self, start: date, end: date) -> int:
+        """Уникальные пользователи, активные с start по end включительно"""
+        return self._mask(start, end).bit_count()
+
+    def active_last(self, days: int, today: Optional[date] = None) -> int:
+        """Уникальные пользователи за последние days дней, включая сегодня"""
+        today = today or date.today()
+        return self.active_between(today - timedelta(days=days - 1), today)
+
+    @property
+    def dau(self) -> int:
+        return self.active_last(1)
+
+    @property
+    def wau(self) -> int:
+        return self.active_last(7)
+
+    @property
+    def mau(self) -> int:
+        return self.active_last(30)
+
+    def users_between(self, start: date, end: date) -> List[Hashable]:
+        """Id пользователей, активных в периоде"""
+        mask = self._mask(start, end)
+        users = []
+        while mask:
+            low = mask & -mask
+            users.append(self._users[low.bit_length() - 1])
+            mask ^= low
+        return users
+
+    def daily(self, days: int, today: Optional[date] = None) -> List[Tuple[date, int]]:
+        """Дневная активность за последние days дней: [(день, активных)]"""
+        today = today or date.today()
+        history = []
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            history.append((day, self._days.get(day.toordinal(), 0).bit_count()))
+        return history
+
+    # ==============================
+    # ХРАНЕНИЕ
+    # ==============================
+
+    def _prune(self):
+        oldest = date.today().toordinal() - self.keep_days
+        for day in [day for day in self._days if day < oldest]:
+            del self._days[day]
+
+    def _payload(self) -> dict:
+        self._prune()
+        return {
+            "users": list(self._users),
+            "days": {str(day): format(mask, "x") for day, mask in self._days.items()},
+        }
+
+    def load(self) -> bool:
+        """Загрузка индекса с диска; False, если файла нет"""
+        if self.path is None or not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self._users = data["users"]
+        self._bits = {user_id: bit for bit, user_id in enumerate(self._users)}
+        self._days = {int(day): int(mask, 16) for day, mask in data["days"].items()}
+        return True
+
+    def save(self):
+        """Синхронная запись индекса"""
+        if self.path is not None:
+            write_json_atomic(self.path, self._payload())
+
+    def _schedule_save(self):
+        if self.path is None or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.delay, self._scheduled_save)
+
+    def _scheduled_save(self):
+        self._save_handle = None
+        payload = self._payload()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, write_json_atomic, self.path, payload)
+        future.add_done_callback(self._saved)
+
+    def _saved(self, future):
+        if future.exception() is not None:
+            logger.error(f"❌ Ошибка сохранения индекса активности: {future.exception()}")
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_index: Optional[ActivityIndex] = None
+
+
+def get_activity_index() -> ActivityIndex:
+    """Индекс активности, подписанный на изменения user_activities"""
+    global _index
+    if _index is None:
+        from bot import user_activities
+        from config import config
+        from persistence import get_persistence
+
+        _index = ActivityIndex(config.DATA_DIR / "activity_index.json", keep_days=config.ACTIVITY_INDEX_DAYS)
+        _index.load()
+        _index.seed(user_activities)
+        _index.save()
+        get_persistence().add_listener("user_activities", _index.on_activity)
+    return _index
@@ -1,16 +1,15 @@
 # admin_handlers.py - ПОЛНАЯ АДМИН-ПАНЕЛЬ (ИСПРАВЛЕННАЯ ВЕРСИЯ)
 
 import asyncio
+import bisect
 import json
-import csv
-import io
 import random
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from aiogram import Bot, Router, F
+from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, Document, FSInputFile, BufferedInputFile
+from aiogram.types import Message, CallbackQuery, Document, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -23,15 +22,87 @@ from bot import (
     user_active_duels, users_last_notification, debug_print,
     users_rating, user_activities, user_subscriptions,
     active_duels, waiting_duels, TOPICS, TOPIC_ORDER,
-    users_completed_topics, users_available_topics, save_data,
+    users_completed_topics, users_available_topics,
     is_premium, can_access_topic, load_themes
 )
 from notifications import get_notification_manager, send_test_notification
+from persistence import get_persistence
+from ledger import get_ledger
+from leaderboard import get_leaderboard
+from topic_index import get_topic_index
+from fsm_storage import setup_fsm_storage
+from user_search import get_user_search, setup_user_search
+from stats_snapshot import get_stats_cache
+from subscription_index import get_subscription_index
+from cohorts import get_cohort_engine
+from exports import write_csv, write_json, write_json_items, write_ndjson
+from export_jobs import DONE as EXPORT_DONE, FAILED as EXPORT_FAILED, format_size, get_export_queue
+from change_log import get_change_log
+from counters import get_dashboard_counters
 
 # Создаем роутер для админ-команд
 admin_router = Router()
 
 
+async def notify_subscriptions_expired(bot: Bot, user_ids):
+    """Сообщить пользователям, что Premium закончился"""
+    for user_id in user_ids:
+        try:
+            await bot.send_message(
+                user_id,
+                "⌛ <b>Premium закончился</b>\n\n"
+                "Срок вашей Premium подписки истёк, доступ переведён на бесплатный тариф.\n\n"
+                "Продлить подписку можно в разделе Premium.",
+                parse_mode="HTML",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[[InlineKeyboardButton(text="👑 Мой Premium", callback_data="premium_status")]]
+                )
+            )
+        except Exception as e:
+            debug_print(f"❌ Не удалось уведомить пользователя {user_id} об окончании Premium: {e}")
+        await asyncio.sleep(0.05)
+
+
+async def remind_subscriptions_expiring(bot: Bot, due):
+    """Напомнить пользователям о скором окончании Premium"""
+    for user_id, expires_at in due:
+        try:
+            await bot.send_message(
+                user_id,
+                "🔔 <b>Premium скоро закончится</b>\n\n"
+                f"📅 Подписка действует до {expires_at.strftime('%d.%m.%Y %H:%M')}.\n\n"
+                "Продлите её, чтобы не потерять доступ к Premium-темам.",
+                parse_mode="HTML",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[[InlineKeyboardButton(text="👑 Мой Premium", callback_data="premium_status")]]
+                )
+            )
+        except Exception as e:
+            debug_print(f"❌ Не удалось напомнить пользователю {user_id} о Premium: {e}")
+        await asyncio.sleep(0.05)
+
+
+@admin_router.startup()
+async def on_admin_startup(dispatcher: Dispatcher, bot: Bot = None):
+    """Журнал изменений должен видеть все изменения с момента запуска"""
+    # Диспетчер bot.py, в который включён admin_router: FSM на SQLite
+    # и профили отправителей для поиска пользователей
+    setup_fsm_storage(dispatcher)
+    setup_user_search(dispatcher)
+    get_change_log()
+    # Поиск изменений bot.py, сделанных без mark_dirty
+    get_persistence().start()
+    # Проверка сроков подписок: снятые тарифы и напоминания уходят пользователям
+    subscription_index = get_subscription_index()
+    if bot is not None:
+        subscription_index.add_expiry_listener(
+            lambda user_ids: asyncio.create_task(notify_subscriptions_expired(bot, user_ids))
+        )
+        subscription_index.add_reminder_listener(
+            lambda due: asyncio.create_task(remind_subscriptions_expiring(bot, due))
+        )
+
+
 def back_to_admin() -> InlineKeyboardMarkup:
     """Кнопка возврата в админ-панель"""
     builder = InlineKeyboardBuilder()
@@ -40,6 +111,17 @@ def back_to_admin() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def format_date(value, fmt: str, missing: str = "—") -> str:
+    """Дата в формате fmt; у ActivityRecord отсутствующая дата — None"""
+    return value.strftime(fmt) if value else missing
+
+
+def reload_themes():
+    """Перезагрузка тем со сбросом снимка статистики"""
+    load_themes()
+    get_stats_cache().invalidate()
+
+
 # ==============================
 # FSM СОСТОЯНИЯ ДЛЯ АДМИНА
 # ==============================
@@ -60,6 +142,7 @@ class AdminStates(StatesGroup):
     waiting_for_edit_theme = State()
     waiting_for_edit_theme_field = State()
     waiting_for_edit_theme_value = State()
+    waiting_for_transactions_period = State()
 
 
 # ==============================
@@ -75,51 +158,30 @@ async def admin_panel(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    # Собираем статистику
-    total_users = len(users_rating)
-    active_today = len([
-        a for a in user_activities.values()
-        if a.last_activity and a.last_activity.date() == datetime.now().date()
-    ])
-    active_week = len([
-        a for a in user_activities.values()
-        if a.last_activity and (datetime.now() - a.last_activity).days < 7
-    ])
-
-    premium_users = len([
-        u for u, s in user_subscriptions.items()
-        if s.is_active() and s.tier != SubscriptionTier.FREE
-    ])
-
-    active_duels_count = len([d for d in active_duels.values() if d.status == DuelStatus.IN_PROGRESS])
-    waiting_duels_count = len(waiting_duels)
-
+    # Счётчики обновляются событиями: чтение без обхода пользователей
+    await get_persistence().sync_changes()
+    counters = get_dashboard_counters()
+    ledger = get_ledger()
     total_questions = sum(len(t.get('questions', [])) for t in TOPICS.values())
 
-    # Рассчитываем доход
-    total_revenue = 0
-    for sub in user_subscriptions.values():
-        for transaction in sub.transaction_history:
-            total_revenue += transaction.get('amount', 0)
-
     text = (
         "🔧 <b>АДМИН-ПАНЕЛЬ</b>\n\n"
         f"👥 <b>Пользователи:</b>\n"
-        f"• Всего: {total_users}\n"
-        f"• Активных сегодня: {active_today}\n"
-        f"• Активных за неделю: {active_week}\n"
-        f"• Premium: {premium_users}\n\n"
+        f"• Всего: {len(users_rating)}\n"
+        f"• Активных сегодня: {counters.active_today}\n"
+        f"• Активных за неделю: {counters.active_week}\n"
+        f"• Premium: {len(get_subscription_index())}\n\n"
         f"📚 <b>Контент:</b>\n"
         f"• Тем: {len(TOPICS)}\n"
         f"• Вопросов: {total_questions}\n"
         f"• Порядок тем: {len(TOPIC_ORDER)}\n\n"
         f"⚔️ <b>Дуэли:</b>\n"
-        f"• Активных: {active_duels_count}\n"
-        f"• В ожидании: {waiting_duels_count}\n"
+        f"• Активных: {counters.active_duels}\n"
+        f"• В ожидании: {len(waiting_duels)}\n"
         f"• Всего в памяти: {len(active_duels)}\n\n"
         f"💰 <b>Финансы:</b>\n"
-        f"• Доход: {total_revenue}₽\n"
-        f"• Транзакций: {sum(len(s.transaction_history) for s in user_subscriptions.values())}\n\n"
+        f"• Доход: {ledger.total_revenue}₽\n"
+        f"• Транзакций: {ledger.total_count}\n\n"
         f"🕐 <b>Система:</b>\n"
         f"• Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
         f"• Токен: {'✅' if config.BOT_TOKEN else '❌'}\n"
@@ -232,18 +294,16 @@ async def admin_find_user_process(message: Message, state: FSMContext):
 
     query = message.text.strip()
     found_users = []
+    search = get_user_search()
 
     # Поиск по ID
     if query.isdigit():
         user_id = int(query)
         if user_id in users_rating:
             found_users.append(user_id)
-    # Поиск по username (имитация - в реальности нужно через API)
+    # Поиск по username, имени и фамилии
     else:
-        # Здесь можно добавить реальный поиск через API Telegram
-        for uid in users_rating:
-            found_users.append(uid)
-        found_users = found_users[:5]  # Ограничим 5 для примера
+        found_users = [user_id for user_id, _ in search.search(query, limit=10, among=users_rating)]
 
     if not found_users:
         await message.answer(
@@ -255,14 +315,14 @@ async def admin_find_user_process(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    # Показываем результаты поиска
+    # Показываем результаты поиска (только чтение: без создания подписок)
+    subscription_index = get_subscription_index()
     builder = InlineKeyboardBuilder()
     for user_id in found_users[:10]:
         rating = users_rating.get(user_id, 0)
-        sub = get_user_subscription(user_id)
-        premium = "👑" if sub.is_active() and sub.tier != SubscriptionTier.FREE else " "
+        premium = "👑" if subscription_index.is_premium(user_id) else " "
         builder.button(
-            text=f"{premium} ID: {user_id} | {rating} баллов",
+            text=f"{premium} {search.label(user_id)} | {rating} баллов",
             callback_data=f"admin:show_user:{user_id}"
         )
     builder.button(text="← Назад", callback_data="admin:users_menu")
@@ -304,6 +364,10 @@ async def admin_show_user(callback: CallbackQuery):
     total_duels = activity.duels_won + activity.duels_lost + activity.duels_drawn
     win_rate = (activity.duels_won / total_duels * 100) if total_duels > 0 else 0
 
+    # Баллы, начисленные bot.py без mark_dirty, — в таблицу лидеров до чтения
+    await get_persistence().sync_changes()
+    place = get_leaderboard().rank_of(user_id)
+
     if sub.is_active() and sub.tier != SubscriptionTier.FREE:
         premium_status = f"✅ Активен до {sub.expires_at.strftime('%d.%m.%Y')}"
         days_left = (sub.expires_at - datetime.now()).days
@@ -315,6 +379,7 @@ async def admin_show_user(callback: CallbackQuery):
         f"📊 <b>СТАТИСТИКА ПОЛЬЗОВАТЕЛЯ</b>\n\n"
         f"👤 <b>ID:</b> {user_id}\n"
         f"💰 <b>Баллы:</b> {rating}\n"
+        f"🏆 <b>Место в рейтинге:</b> {place or '—'} из {len(users_rating)}\n"
         f"👑 <b>Premium:</b> {premium_status}\n"
         f"📅 <b>Осталось дней:</b> {days_left}\n\n"
         f"📚 <b>Обучение:</b>\n"
@@ -331,8 +396,8 @@ async def admin_show_user(callback: CallbackQuery):
         f"• Win Rate: {win_rate:.1f}%\n"
         f"• ELO: {activity.elo_rating}\n\n"
         f"🔥 <b>Стрик:</b> {activity.daily_streak} дней\n"
-        f"📅 <b>В боте с:</b> {activity.first_seen.strftime('%d.%m.%Y')}\n"
-        f"🕐 <b>Последняя активность:</b> {activity.last_activity.strftime('%d.%m.%Y %H:%M')}"
+        f"📅 <b>В боте с:</b> {format_date(activity.first_seen, '%d.%m.%Y')}\n"
+        f"🕐 <b>Последняя активность:</b> {format_date(activity.last_activity, '%d.%m.%Y %H:%M')}"
     )
 
     builder = InlineKeyboardBuilder()
@@ -427,16 +492,21 @@ async def admin_ban_user_process(message: Message, state: FSMContext):
         get_user_activity(user_id).ban_reason = reason
         get_user_activity(user_id).banned_at = datetime.now()
 
+    persistence = get_persistence()
+    persistence.mark_dirty("user_activities", user_id)
+
     # Удаляем все активные дуэли пользователя
     if user_id in user_active_duels:
         duel_id = user_active_duels[user_id]
         if duel_id in active_duels:
             del active_duels[duel_id]
+            persistence.mark_dirty("active_duels", duel_id)
         if duel_id in waiting_duels:
             waiting_duels.remove(duel_id)
         del user_active_duels[user_id]
 
-    save_data()
+    persistence.schedule_save()
+    get_stats_cache().invalidate()
 
     # Уведомляем пользователя
     try:
@@ -518,7 +588,7 @@ async def admin_remove_premium_process(message: Message, state: FSMContext):
     old_tier = sub.tier.value
     sub.tier = SubscriptionTier.FREE
     sub.expires_at = None
-    save_data()
+    get_persistence().touch("user_subscriptions", target_user_id)
 
     # Уведомляем пользователя
     try:
@@ -593,6 +663,7 @@ async def admin_give_premium_user_id(message: Message, state: FSMContext):
 
     if target_user_id not in users_rating:
         users_rating[target_user_id] = 0
+        get_persistence().touch("users_rating", target_user_id)
         debug_print(f"👤 Создан новый пользователь {target_user_id} через админку")
 
     await state.update_data(target_user_id=target_user_id)
@@ -682,7 +753,7 @@ async def give_premium_to_user(message: Message, target_user_id: int, days: int,
         })
 
         user_subscriptions[target_user_id] = sub
-        save_data()
+        get_persistence().touch("user_subscriptions", target_user_id)
 
         text = (
             f"✅ <b>Premium выдан!</b>\n\n"
@@ -946,7 +1017,7 @@ async def admin_upload_theme_file(message: Message, state: FSMContext):
             json.dump(theme_data, f, ensure_ascii=False, indent=2)
 
         # Перезагружаем темы
-        load_themes()
+        reload_themes()
 
         await message.answer(
             f"✅ <b>Тема успешно загружена!</b>\n\n"
@@ -990,7 +1061,7 @@ async def admin_overwrite_theme(callback: CallbackQuery, state: FSMContext):
             json.dump(theme_data, f, ensure_ascii=False, indent=2)
 
         # Перезагружаем темы
-        load_themes()
+        reload_themes()
 
         await callback.message.edit_text(
             f"✅ <b>Тема успешно перезаписана!</b>\n\n"
@@ -1269,7 +1340,7 @@ async def admin_edit_theme_value(message: Message, state: FSMContext):
             json.dump(topic, f, ensure_ascii=False, indent=2)
 
         # Перезагружаем темы
-        load_themes()
+        reload_themes()
 
         await message.answer(
             result,
@@ -1311,7 +1382,7 @@ async def admin_toggle_premium_topic(callback: CallbackQuery):
         json.dump(topic, f, ensure_ascii=False, indent=2)
 
     # Перезагружаем темы
-    load_themes()
+    reload_themes()
 
     await callback.answer(f"✅ Premium статус: {'включен' if not current_status else 'выключен'}", show_alert=True)
     await admin_edit_theme_menu(callback, None)
@@ -1403,11 +1474,13 @@ async def admin_delete_theme_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
+    # Прогресс, выданный bot.py без mark_dirty, — в индекс до подсчёта
+    await get_persistence().sync_changes()
+    topic_index = get_topic_index()
     builder = InlineKeyboardBuilder()
     for topic_key in TOPIC_ORDER[:10]:
         topic = TOPICS[topic_key]
-        # Подсчитываем, сколько пользователей изучили эту тему
-        users_completed = sum(1 for u, topics in users_completed_topics.items() if topic_key in topics)
+        users_completed = topic_index.completed_count(topic_key)
         builder.button(
             text=f"{topic['emoji']} {topic['name']} ({users_completed} изучили)",
             callback_data=f"admin:confirm_delete:{topic_key}"
@@ -1438,14 +1511,22 @@ async def admin_confirm_delete(callback: CallbackQuery):
     if topic_key in TOPICS:
         topic_name = TOPICS[topic_key].get('name', topic_key)
 
-        # Удаляем из прогресса всех пользователей
-        for user_id in users_completed_topics:
-            if topic_key in users_completed_topics[user_id]:
-                users_completed_topics[user_id].remove(topic_key)
+        persistence = get_persistence()
+        await persistence.sync_changes()
+        topic_index = get_topic_index()
 
-        for user_id in users_available_topics:
-            if topic_key in users_available_topics[user_id]:
-                users_available_topics[user_id].remove(topic_key)
+        # Удаляем из прогресса только пользователей темы (по индексу)
+        sections = (
+            ("users_completed_topics", users_completed_topics, topic_index.completed_users(topic_key)),
+            ("users_available_topics", users_available_topics, topic_index.available_users(topic_key)),
+        )
+        for section, records, user_ids in sections:
+            for user_id in user_ids:
+                topics = records.get(user_id)
+                if topics and topic_key in topics:
+                    topics.remove(topic_key)
+                    # Индекс обновится через mark_dirty
+                    persistence.mark_dirty(section, user_id)
 
         # Удаляем тему
         del TOPICS[topic_key]
@@ -1460,7 +1541,8 @@ async def admin_confirm_delete(callback: CallbackQuery):
         except:
             pass
 
-        save_data()
+        persistence.schedule_save()
+        get_stats_cache().invalidate()
         await callback.answer(f"✅ Тема '{topic_name}' удалена!", show_alert=True)
 
     await admin_topics_menu(callback)
@@ -1626,11 +1708,9 @@ async def admin_sendall_confirm_premium(callback: CallbackQuery, state: FSMConte
         await callback.answer("❌ Сообщение не найдено", show_alert=True)
         return
 
-    premium_users = []
-    for user_id in users_rating:
-        sub = get_user_subscription(user_id)
-        if sub.is_active() and sub.tier != SubscriptionTier.FREE:
-            premium_users.append(user_id)
+    # Оплаты, прошедшие в bot.py без mark_dirty, должны попасть в индекс
+    await get_persistence().sync_changes()
+    premium_users = list(get_subscription_index().premium_ids())
 
     manager = get_notification_manager(callback.bot)
     if manager:
@@ -1698,6 +1778,7 @@ async def admin_stats_menu(callback: CallbackQuery):
 
     builder = InlineKeyboardBuilder()
     builder.button(text="📊 Статистика бота", callback_data="admin:stats")
+    builder.button(text="📈 Когорты и удержание", callback_data="admin:cohorts")
     builder.button(text="📤 Экспорт данных", callback_data="admin:export")
     builder.button(text="📈 Статистика уведомлений", callback_data="admin:notify_stats")
     builder.button(text="← Назад", callback_data="admin_panel")
@@ -1725,11 +1806,16 @@ async def admin_export_menu(callback: CallbackQuery):
 
     builder = InlineKeyboardBuilder()
     builder.button(text="👥 Пользователи (JSON)", callback_data="admin:export_users_json")
+    builder.button(text="👥 Пользователи (NDJSON)", callback_data="admin:export_users_ndjson:0:0")
+    builder.button(text="👥 Пользователи (NDJSON.gz)", callback_data="admin:export_users_ndjson:1:0")
     builder.button(text="👥 Пользователи (CSV)", callback_data="admin:export_users_csv")
+    builder.button(text="👥 Пользователи (CSV.gz)", callback_data="admin:export_users_csv_gz")
+    builder.button(text="🔖 Изменения пользователей (CSV)", callback_data="admin:export_users_delta")
     builder.button(text="📚 Темы (JSON)", callback_data="admin:export_topics_json")
     builder.button(text="⚔️ Дуэли (JSON)", callback_data="admin:export_duels_json")
     builder.button(text="📊 Полная статистика", callback_data="admin:export_stats")
     builder.button(text="💰 Транзакции", callback_data="admin:export_transactions")
+    builder.button(text="🗂 Задания экспорта", callback_data="admin:export_jobs")
     builder.button(text="← Назад", callback_data="admin:stats_menu")
     builder.adjust(1)
 
@@ -1737,31 +1823,49 @@ async def admin_export_menu(callback: CallbackQuery):
     await callback.answer()
 
 
-@admin_router.callback_query(F.data == "admin:export_users_csv")
-async def admin_export_users_csv(callback: CallbackQuery):
-    """Экспорт пользователей в CSV (ИСПРАВЛЕНО)"""
-    if callback.from_user.id != config.ADMIN_ID:
-        await callback.answer("⛔ Доступ запрещен", show_alert=True)
-        return
+USERS_CSV_HEADER = [
+    'User ID', 'Rating', 'Lessons', 'Questions', 'Correct',
+    'Accuracy %', 'Streak', 'ELO', 'Duels Won', 'Duels Lost',
+    'Duels Drawn', 'Premium', 'First Seen', 'Last Activity'
+]
+
+
+async def enqueue_export(callback: CallbackQuery, title: str, filename: str, build, compress: bool = False):
+    """Поставить экспорт в очередь заданий и ответить на нажатие"""
+    job = await get_export_queue().submit(
+        callback.bot, callback.message.chat.id, title, filename, build, compress, retry=callback.data
+    )
+    if job is None:
+        await callback.answer("⏳ Очередь экспорта заполнена, попробуйте позже", show_alert=True)
+    elif job.status == EXPORT_FAILED:
+        await callback.answer(f"❌ Экспорт не поставлен в очередь: {job.error}", show_alert=True)
+    else:
+        await callback.answer(f"📦 Экспорт #{job.id} поставлен в очередь", show_alert=False)
+    return job
+
 
-    await callback.answer("⏳ Генерирую CSV файл...", show_alert=False)
+def snapshot_users(job, user_ids, snapshot):
+    """Данные пользователей для построителя экспорта, частями по EXPORT_CHUNK_ROWS.
 
-    output = io.StringIO()
-    writer = csv.writer(output)
+    Вызывается в потоке построителя: каждая часть собирается функцией
+    snapshot в цикле событий (get_user_activity() и get_user_subscription()
+    создают недостающие записи), и в памяти построителя одна часть.
+    """
+    for start in range(0, len(user_ids), config.EXPORT_CHUNK_ROWS):
+        yield from job.call_in_loop(snapshot, user_ids[start:start + config.EXPORT_CHUNK_ROWS])
 
-    writer.writerow([
-        'User ID', 'Rating', 'Lessons', 'Questions', 'Correct',
-        'Accuracy %', 'Streak', 'ELO', 'Duels Won', 'Duels Lost',
-        'Duels Drawn', 'Premium', 'First Seen', 'Last Activity'
-    ])
 
-    for user_id in users_rating:
+def users_csv_rows(user_ids):
+    """Строки CSV для части пользователей (в цикле событий)"""
+    rows = []
+    for user_id in user_ids:
+        if user_id not in users_rating:
+            continue
         activity = get_user_activity(user_id)
         sub = get_user_subscription(user_id)
-
-        writer.writerow([
+        rows.append([
             user_id,
-            users_rating.get(user_id, 0),
+            users_rating[user_id],
             activity.lessons_completed,
             activity.questions_answered,
             activity.correct_answers,
@@ -1772,21 +1876,134 @@ async def admin_export_users_csv(callback: CallbackQuery):
             activity.duels_lost,
             activity.duels_drawn,
             sub.tier.value if sub.is_active() else 'inactive',
-            activity.first_seen.strftime('%Y-%m-%d %H:%M:%S'),
-            activity.last_activity.strftime('%Y-%m-%d %H:%M:%S')
+            format_date(activity.first_seen, '%Y-%m-%d %H:%M:%S', ''),
+            format_date(activity.last_activity, '%Y-%m-%d %H:%M:%S', '')
         ])
+    return rows
+
+
+@admin_router.callback_query(F.data.in_({"admin:export_users_csv", "admin:export_users_csv_gz"}))
+async def admin_export_users_csv(callback: CallbackQuery):
+    """Потоковый экспорт пользователей в CSV (по желанию gzip)"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
 
-    output.seek(0)
+    compress = callback.data.endswith("_gz")
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    # ИСПРАВЛЕНО: Используем BufferedInputFile вместо InputFile
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            file=io.BytesIO(output.getvalue().encode('utf-8')).getvalue(),
-            filename=f'users_export_{timestamp}.csv'
-        ),
-        caption=f"📊 Экспорт пользователей\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n👥 Всего: {len(users_rating)}"
+    # Изменения bot.py до метки должны попасть в журнал изменений раньше неё.
+    # Строки собираются позже, поэтому пользователь, изменённый после метки,
+    # попадёт и в этот файл, и в следующую выгрузку изменений
+    await get_persistence().sync_changes()
+    user_ids = list(users_rating)
+    mark = get_change_log().mark("full")
+
+    def build(export, job):
+        job.progress(0, len(user_ids))
+        rows = snapshot_users(job, user_ids, users_csv_rows)
+        write_csv(export, USERS_CSV_HEADER, rows, config.EXPORT_CHUNK_ROWS, job.progress)
+        job.note(f"🔖 Метка изменений: #{mark.number}")
+        job.manifest = {'export': mark.number, 'kind': mark.kind, 'seq': mark.seq, 'columns': USERS_CSV_HEADER}
+
+    await enqueue_export(callback, "Пользователи (CSV)", f'users_export_{timestamp}.csv', build, compress)
+
+
+@admin_router.callback_query(F.data == "admin:export_users_delta")
+async def admin_export_users_delta_menu(callback: CallbackQuery):
+    """Выбор экспорта, с которого выгружать изменения"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    await get_persistence().sync_changes()
+    change_log = get_change_log()
+    marks = change_log.marks[-8:][::-1]
+
+    text = (
+        "🔖 <b>ИЗМЕНЕНИЯ ПОЛЬЗОВАТЕЛЕЙ</b>\n\n"
+        "Выгружаются только пользователи, у которых после выбранного экспорта "
+        "изменились рейтинг, активность или подписка. Номер экспорта указан "
+        "в подписи и манифесте каждого файла.\n\n"
     )
+    if not marks:
+        text += "Экспортов пользователей в CSV ещё не было — начните с полного экспорта."
+
+    builder = InlineKeyboardBuilder()
+    for mark in marks:
+        changed = change_log.count_since(mark.seq)
+        kind = "полный" if mark.kind == "full" else "изменения"
+        text += f"#{mark.number} ({kind}) — {mark.created_at.replace('T', ' ')}, с тех пор изменено: {changed}\n"
+        builder.button(text=f"Δ с экспорта #{mark.number}", callback_data=f"admin:export_users_delta:{mark.number}")
+
+    builder.button(text="← Назад", callback_data="admin:export")
+    builder.adjust(2)
+
+    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    await callback.answer()
+
+
+@admin_router.callback_query(F.data.startswith("admin:export_users_delta:"))
+async def admin_export_users_delta(callback: CallbackQuery):
+    """Экспорт пользователей, изменившихся после экспорта N"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    change_log = get_change_log()
+    try:
+        base = change_log.get_mark(int(callback.data.split(":")[2]))
+    except ValueError:
+        base = None
+    if base is None:
+        await callback.answer("❌ Экспорт не найден", show_alert=True)
+        return
+
+    # Список изменённых и новая метка берутся одновременно, в цикле событий,
+    # после того как журнал получил изменения bot.py
+    await get_persistence().sync_changes()
+    user_ids = [user_id for user_id in change_log.changed_since(base.seq) if user_id in users_rating]
+    deleted = change_log.deleted_since(base.seq)
+    mark = change_log.mark("delta")
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    def build(export, job):
+        job.progress(0, len(user_ids))
+        rows = snapshot_users(job, user_ids, users_csv_rows)
+        write_csv(export, USERS_CSV_HEADER, rows, config.EXPORT_CHUNK_ROWS, job.progress)
+        job.note(f"🔖 Изменения с экспорта #{base.number}, метка: #{mark.number}")
+        if deleted:
+            job.note(f"🗑 Удалено пользователей: {len(deleted)}")
+        job.manifest = {
+            'export': mark.number,
+            'kind': mark.kind,
+            'since_export': base.number,
+            'since_seq': base.seq,
+            'seq': mark.seq,
+            'changed': export.rows,
+            'deleted': deleted,
+            'columns': USERS_CSV_HEADER
+        }
+
+    await enqueue_export(
+        callback, f"Изменения пользователей с #{base.number}", f'users_delta_{base.number}_{timestamp}.csv', build
+    )
+
+
+def user_export_record(user_id):
+    """Полные данные пользователя для JSON-экспортов (в цикле событий)"""
+    return {
+        'rating': users_rating.get(user_id, 0),
+        'activity': get_user_activity(user_id).to_dict(),
+        'subscription': get_user_subscription(user_id).to_dict(),
+        'completed_topics': list(users_completed_topics.get(user_id, set())),
+        'available_topics': list(users_available_topics.get(user_id, []))
+    }
+
+
+def users_json_records(user_ids):
+    """(user_id, запись) для части пользователей (в цикле событий)"""
+    return [(user_id, user_export_record(user_id)) for user_id in user_ids if user_id in users_rating]
 
 
 @admin_router.callback_query(F.data == "admin:export_users_json")
@@ -1796,31 +2013,65 @@ async def admin_export_users_json(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    await callback.answer("⏳ Генерирую JSON файл...", show_alert=False)
+    user_ids = list(users_rating)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    users_data = {}
-    for user_id in users_rating:
-        activity = get_user_activity(user_id)
-        sub = get_user_subscription(user_id)
+    def build(export, job):
+        job.progress(0, len(user_ids))
+        records = snapshot_users(job, user_ids, users_json_records)
+        write_json_items(export, records, config.EXPORT_CHUNK_ROWS, job.progress)
 
-        users_data[str(user_id)] = {
-            'rating': users_rating.get(user_id, 0),
-            'activity': activity.to_dict(),
-            'subscription': sub.to_dict(),
-            'completed_topics': list(users_completed_topics.get(user_id, set())),
-            'available_topics': users_available_topics.get(user_id, [])
-        }
+    await enqueue_export(callback, "Пользователи (JSON)", f'users_export_{timestamp}.json', build)
+
+
+def users_ndjson_records(user_ids):
+    """(user_id, запись) для части пользователей в NDJSON (в цикле событий)"""
+    return [(user_id, {'id': user_id, **record}) for user_id, record in users_json_records(user_ids)]
+
+
+@admin_router.callback_query(F.data.startswith("admin:export_users_ndjson:"))
+async def admin_export_users_ndjson(callback: CallbackQuery):
+    """Экспорт пользователей в NDJSON с курсором продолжения"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
 
+    # admin:export_users_ndjson:<gzip 0|1>:<курсор — последний выгруженный ID>
+    try:
+        _, _, compress, cursor = callback.data.split(":")
+        compress = compress == "1"
+        cursor = int(cursor)
+    except ValueError:
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+
+    # Пользователи по возрастанию ID — курсор однозначно задаёт продолжение
+    user_ids = sorted(users_rating)
+    start = bisect.bisect_right(user_ids, cursor)
+    remaining = len(user_ids) - start
+    # Одна запись сверх лимита показывает, что файл не последний
+    user_ids = user_ids[start:start + config.EXPORT_FILE_ROWS + 1]
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    json_data = json.dumps(users_data, ensure_ascii=False, indent=2)
 
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            file=json_data.encode('utf-8'),
-            filename=f'users_export_{timestamp}.json'
-        ),
-        caption=f"📊 Экспорт пользователей (JSON)\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n👥 Всего: {len(users_rating)}"
-    )
+    def build(export, job):
+        job.progress(0, min(config.EXPORT_FILE_ROWS, remaining))
+        write_ndjson(
+            export,
+            snapshot_users(job, user_ids, users_ndjson_records),
+            batch_size=config.EXPORT_CHUNK_ROWS,
+            limit=config.EXPORT_FILE_ROWS,
+            progress=job.progress
+        )
+        job.note(f"👥 В файле: {export.rows} из {remaining}")
+        if not export.complete:
+            job.note(f"➡️ Продолжение с ID > {export.cursor}")
+            job.add_button(
+                f"▶️ Следующие {min(config.EXPORT_FILE_ROWS, remaining - export.rows)}",
+                f"admin:export_users_ndjson:{int(compress)}:{export.cursor}"
+            )
+
+    title = "Пользователи (NDJSON)" if not cursor else f"Пользователи (NDJSON, ID > {cursor})"
+    await enqueue_export(callback, title, f'users_export_{timestamp}.ndjson', build, compress)
 
 
 @admin_router.callback_query(F.data == "admin:export_topics_json")
@@ -1830,24 +2081,18 @@ async def admin_export_topics_json(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    await callback.answer("⏳ Генерирую JSON файл...", show_alert=False)
-
     topics_data = {
-        'topics': TOPICS,
-        'order': TOPIC_ORDER,
+        'topics': dict(TOPICS),
+        'order': list(TOPIC_ORDER),
         'exported_at': datetime.now().isoformat()
     }
-
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    json_data = json.dumps(topics_data, ensure_ascii=False, indent=2)
 
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            file=json_data.encode('utf-8'),
-            filename=f'topics_export_{timestamp}.json'
-        ),
-        caption=f"📚 Экспорт тем\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n📚 Всего тем: {len(TOPICS)}"
-    )
+    def build(export, job):
+        write_json(export, topics_data)
+        export.rows = len(topics_data['topics'])
+
+    await enqueue_export(callback, "Темы (JSON)", f'topics_export_{timestamp}.json', build)
 
 
 @admin_router.callback_query(F.data == "admin:export_duels_json")
@@ -1857,22 +2102,13 @@ async def admin_export_duels_json(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    await callback.answer("⏳ Генерирую JSON файл...", show_alert=False)
-
-    duels_data = {}
-    for duel_id, duel in active_duels.items():
-        duels_data[duel_id] = duel.to_dict()
-
+    duels = list(active_duels.items())
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    json_data = json.dumps(duels_data, ensure_ascii=False, indent=2)
 
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            file=json_data.encode('utf-8'),
-            filename=f'duels_export_{timestamp}.json'
-        ),
-        caption=f"⚔️ Экспорт дуэлей\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n⚔️ Всего дуэлей: {len(active_duels)}"
-    )
+    def build(export, job):
+        write_json(export, {duel_id: duel.to_dict() for duel_id, duel in duels})
+
+    await enqueue_export(callback, "Дуэли (JSON)", f'duels_export_{timestamp}.json', build)
 
 
 @admin_router.callback_query(F.data == "admin:export_stats")
@@ -1882,99 +2118,363 @@ async def admin_export_stats(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    total_duels = sum(a.duels_won + a.duels_lost + a.duels_drawn for a in user_activities.values()) // 2
-    total_questions_answered = sum(a.questions_answered for a in user_activities.values())
-    total_correct = sum(a.correct_answers for a in user_activities.values())
+    snapshot = await get_stats_cache().get()
 
-    premium_users = []
-    for user_id in users_rating:
-        sub = get_user_subscription(user_id)
-        if sub.is_active() and sub.tier != SubscriptionTier.FREE:
-            premium_users.append({
-                'id': user_id,
-                'tier': sub.tier.value,
-                'expires': sub.expires_at.strftime('%Y-%m-%d') if sub.expires_at else 'never',
-                'rating': users_rating.get(user_id, 0)
-            })
+    premium_users = [
+        {
+            'id': user['id'],
+            'tier': user['tier'],
+            'expires': user['expires_at'].strftime('%Y-%m-%d') if user['expires_at'] else 'never',
+            'rating': user['rating']
+        }
+        for user in snapshot.premium_users[:100]
+    ]
 
     stats = {
-        'generated_at': datetime.now().isoformat(),
+        'generated_at': snapshot.generated_at.isoformat(),
         'users': {
-            'total': len(users_rating),
-            'premium': len(premium_users),
-            'active_today': len(
-                [a for a in user_activities.values() if a.last_activity.date() == datetime.now().date()]),
-            'active_week': len([a for a in user_activities.values() if (datetime.now() - a.last_activity).days < 7])
+            'total': snapshot.total_users,
+            'premium': len(snapshot.premium_users),
+            'active_today': snapshot.active_today,
+            'active_week': snapshot.active_week,
+            'active_month': snapshot.active_month,
+            'daily_active': [
+                {'date': day.isoformat(), 'users': users} for day, users in snapshot.daily_active
+            ]
         },
         'content': {
-            'topics': len(TOPICS),
-            'questions': sum(len(t.get('questions', [])) for t in TOPICS.values())
+            'topics': snapshot.topics,
+            'questions': snapshot.topic_questions
         },
         'duels': {
-            'total': total_duels,
-            'active': len([d for d in active_duels.values() if d.status == DuelStatus.IN_PROGRESS]),
-            'waiting': len(waiting_duels)
+            'total': snapshot.total_duels,
+            'active': snapshot.duels_active,
+            'waiting': snapshot.duels_waiting
         },
         'learning': {
-            'total_questions': total_questions_answered,
-            'correct_answers': total_correct,
-            'accuracy': round((total_correct / total_questions_answered * 100), 2) if total_questions_answered else 0,
-            'total_lessons': sum(a.lessons_completed for a in user_activities.values())
+            'total_questions': snapshot.questions,
+            'correct_answers': snapshot.correct,
+            'accuracy': round(snapshot.accuracy, 2),
+            'total_lessons': snapshot.lessons
         },
-        'premium_users': premium_users[:100]
+        'premium_users': premium_users
     }
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f'stats_export_{timestamp}.json'
     filepath = Path(config.STATS_DIR) / filename
 
-    # Создаем директорию если её нет
-    filepath.parent.mkdir(parents=True, exist_ok=True)
-
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(stats, f, ensure_ascii=False, indent=2)
+    def build(export, job):
+        write_json(export, stats)
+
+        # Копия остаётся в архиве статистики
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    await enqueue_export(callback, "Полная статистика", filename, build)
+
+
+TRANSACTIONS_CSV_HEADER = ['User ID', 'Date', 'Product', 'Amount', 'Expires At', 'Admin ID']
+
+TRANSACTION_PERIODS = {
+    "all": "Всё время",
+    "today": "Сегодня",
+    "7d": "7 дней",
+    "30d": "30 дней",
+    "month": "Этот месяц",
+    "prev": "Прошлый месяц",
+}
+
+
+def transactions_period(token: str):
+    """(первый день, последний день, подпись) периода; для всего времени дни None"""
+    today = datetime.now().date()
+    if token == "all":
+        return None, None, TRANSACTION_PERIODS[token]
+    if token == "today":
+        return today, today, TRANSACTION_PERIODS[token]
+    if token in ("7d", "30d"):
+        return today - timedelta(days=int(token[:-1]) - 1), today, TRANSACTION_PERIODS[token]
+    if token == "month":
+        return today.replace(day=1), today, TRANSACTION_PERIODS[token]
+    if token == "prev":
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end, TRANSACTION_PERIODS[token]
+
+    # Свой период: ГГГГММДД-ГГГГММДД
+    start, end = (datetime.strptime(part, '%Y%m%d').date() for part in token.split("-"))
+    return start, end, f"{start.strftime('%d.%m.%Y')} — {end.strftime('%d.%m.%Y')}"
+
+
+def transactions_bounds(start, end):
+    """Полуинтервал [start, end) журнала для дней периода"""
+    if start is None:
+        return None, None
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+async def transactions_export_screen(token: str, product: str):
+    """Экран выбора периода и продукта для экспорта транзакций"""
+    # Оплаты, прошедшие в bot.py без mark_dirty, должны попасть в журнал
+    await get_persistence().sync_changes()
+    ledger = get_ledger()
+    start, end, label = transactions_period(token)
+    start_at, end_at = transactions_bounds(start, end)
+    product_id = product or None
+
+    count = ledger.count_between(start_at, end_at, product_id)
+    if product_id is None:
+        revenue = ledger.revenue_between(start, end)[0] if start else ledger.total_revenue
+    elif start is None:
+        revenue = ledger.product_totals().get(product_id, (0, 0))[0]
+    else:
+        revenue = sum(entry.amount for entry in ledger.entries(start_at, end_at, product_id))
 
-    await callback.message.answer_document(
-        document=FSInputFile(filepath),
-        caption=f"📊 Полная статистика бота\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+    text = (
+        "💰 <b>ЭКСПОРТ ТРАНЗАКЦИЙ</b>\n\n"
+        f"📅 Период: {label}\n"
+        f"📦 Продукт: {product or 'все'}\n\n"
+        f"💳 Транзакций: {count}\n"
+        f"💵 Сумма: {revenue}\n\n"
+        "В манифесте к файлу — итоги по дням."
     )
 
+    builder = InlineKeyboardBuilder()
+    for period, period_label in TRANSACTION_PERIODS.items():
+        mark = "• " if period == token else ""
+        builder.button(text=f"{mark}{period_label}", callback_data=f"admin:export_tx:{period}:{product}")
+    builder.button(text="📅 Свой период", callback_data=f"admin:export_tx_custom:{product}")
+
+    # Продукты с длинным id не помещаются в callback_data (64 байта)
+    products = [
+        option for option in [""] + [product_id for product_id in ledger.products() if product_id]
+        if len(f"admin:export_tx_go:{token}:{option}".encode('utf-8')) <= 64
+    ]
+    for option in products:
+        mark = "• " if option == product else ""
+        builder.button(text=f"{mark}📦 {option or 'Все продукты'}", callback_data=f"admin:export_tx:{token}:{option}")
+
+    builder.button(text=f"📤 Экспортировать ({count})", callback_data=f"admin:export_tx_go:{token}:{product}")
+    builder.button(text="← Назад", callback_data="admin:export")
+    builder.adjust(2, 2, 2, 1, *([2] * (len(products) // 2) + [1] * (len(products) % 2)), 1)
+    return text, builder.as_markup()
+
+
+def parse_transactions_token(data: str):
+    """admin:export_tx*:<период>:<продукт> -> (период, продукт) или None"""
+    try:
+        _, _, token, product = data.split(":", 3)
+        transactions_period(token)
+    except ValueError:
+        return None
+    return token, product
+
 
 @admin_router.callback_query(F.data == "admin:export_transactions")
 async def admin_export_transactions(callback: CallbackQuery):
-    """Экспорт транзакций"""
+    """Экспорт транзакций: выбор периода и продукта"""
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    await callback.answer("⏳ Генерирую отчет...", show_alert=False)
+    text, markup = await transactions_export_screen("month", "")
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
 
-    output = io.StringIO()
-    writer = csv.writer(output)
 
-    writer.writerow(['User ID', 'Date', 'Product', 'Amount', 'Expires At', 'Admin ID'])
+@admin_router.callback_query(F.data.startswith("admin:export_tx:"))
+async def admin_export_transactions_filter(callback: CallbackQuery):
+    """Смена периода или продукта"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
 
-    for user_id, sub in user_subscriptions.items():
-        for transaction in sub.transaction_history:
-            writer.writerow([
-                user_id,
-                transaction.get('purchased_at', ''),
-                transaction.get('product_id', ''),
-                transaction.get('amount', 0),
-                transaction.get('expires_at', ''),
-                transaction.get('admin_id', '')
-            ])
-
-    output.seek(0)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    parsed = parse_transactions_token(callback.data)
+    if parsed is None:
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
 
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            file=io.BytesIO(output.getvalue().encode('utf-8')).getvalue(),
-            filename=f'transactions_export_{timestamp}.csv'
-        ),
-        caption=f"💰 Экспорт транзакций\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n💳 Всего транзакций: {sum(len(s.transaction_history) for s in user_subscriptions.values())}"
+    text, markup = await transactions_export_screen(*parsed)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    except Exception:
+        pass  # Выбор не изменился
+    await callback.answer()
+
+
+@admin_router.callback_query(F.data.startswith("admin:export_tx_custom:"))
+async def admin_export_transactions_custom(callback: CallbackQuery, state: FSMContext):
+    """Ввод своего периода"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    product = callback.data.split(":", 2)[2]
+    await state.set_state(AdminStates.waiting_for_transactions_period)
+    await state.update_data(transactions_product=product)
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="❌ Отмена", callback_data=f"admin:export_tx:month:{product}")
+
+    await callback.message.edit_text(
+        "📅 <b>СВОЙ ПЕРИОД</b>\n\n"
+        "Введите даты через дефис или одну дату:\n\n"
+        "📌 <b>Примеры:</b>\n"
+        "• 01.09.2026-30.09.2026\n"
+        "• 15.10.2026\n\n"
+        "❌ Отправьте /cancel для отмены",
+        reply_markup=builder.as_markup(),
+        parse_mode="HTML"
     )
+    await callback.answer()
+
+
+@admin_router.message(AdminStates.waiting_for_transactions_period)
+async def admin_export_transactions_custom_process(message: Message, state: FSMContext):
+    """Обработка своего периода"""
+    if message.from_user.id != config.ADMIN_ID:
+        return
+
+    data = await state.get_data()
+    product = data.get('transactions_product', '')
+
+    if message.text == "/cancel":
+        await state.clear()
+        text, markup = await transactions_export_screen("month", product)
+        await message.answer(text, reply_markup=markup, parse_mode="HTML")
+        return
+
+    try:
+        parts = [datetime.strptime(part.strip(), '%d.%m.%Y').date() for part in message.text.split("-")]
+        if len(parts) not in (1, 2):
+            raise ValueError
+        start, end = min(parts), max(parts)
+    except (ValueError, AttributeError):
+        await message.answer("❌ Неверный формат. Пример: 01.09.2026-30.09.2026")
+        return
+
+    await state.clear()
+    text, markup = await transactions_export_screen(f"{start:%Y%m%d}-{end:%Y%m%d}", product)
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+@admin_router.callback_query(F.data.startswith("admin:export_tx_go:"))
+async def admin_export_transactions_go(callback: CallbackQuery):
+    """Экспорт транзакций за период с итогами по дням"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    parsed = parse_transactions_token(callback.data)
+    if parsed is None:
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+    token, product = parsed
+    start, end, label = transactions_period(token)
+
+    # Оплаты bot.py без mark_dirty — в журнал до выборки
+    await get_persistence().sync_changes()
+    # Журнал упорядочен по дате: читается только срез периода (и продукта)
+    entries = list(get_ledger().entries(*transactions_bounds(start, end), product or None))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    def build(export, job):
+        daily = {}
+
+        def rows():
+            for entry in entries:
+                transaction = entry.transaction
+                day = datetime.fromtimestamp(entry.ts).date().isoformat() if entry.ts else ''
+                totals = daily.setdefault(day, [0, 0])
+                totals[0] += entry.amount
+                totals[1] += 1
+                yield [
+                    entry.user_id,
+                    transaction.get('purchased_at', ''),
+                    transaction.get('product_id', ''),
+                    transaction.get('amount', 0),
+                    transaction.get('expires_at', ''),
+                    transaction.get('admin_id', '')
+                ]
+
+        job.progress(0, len(entries))
+        write_csv(export, TRANSACTIONS_CSV_HEADER, rows(), config.EXPORT_CHUNK_ROWS, job.progress)
+
+        revenue = sum(entry.amount for entry in entries)
+        job.note(f"💵 Сумма: {revenue} | 📆 Дней с оплатами: {len(daily)}")
+        job.manifest = {
+            'period': {
+                'start': start.isoformat() if start else None,
+                'end': end.isoformat() if end else None
+            },
+            'product_id': product or None,
+            'revenue': revenue,
+            'daily': [
+                {'date': day, 'revenue': day_revenue, 'transactions': count}
+                for day, (day_revenue, count) in daily.items()
+            ],
+            'columns': TRANSACTIONS_CSV_HEADER
+        }
+
+    title = f"Транзакции: {label}" + (f", {product}" if product else "")
+    await enqueue_export(callback, title, f'transactions_export_{timestamp}.csv', build)
+
+
+@admin_router.callback_query(F.data == "admin:export_jobs")
+async def admin_export_jobs(callback: CallbackQuery):
+    """Завершённые задания экспорта с повторным скачиванием"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    queue = get_export_queue()
+    jobs = queue.finished()
+
+    text = "🗂 <b>ЗАДАНИЯ ЭКСПОРТА</b>\n\n"
+    if queue.pending:
+        text += f"⏳ В очереди и в работе: {queue.pending}\n\n"
+    if not jobs:
+        text += "Завершённых заданий пока нет"
+
+    builder = InlineKeyboardBuilder()
+    for job in jobs:
+        finished = job.finished_at.strftime('%d.%m %H:%M') if job.finished_at else ''
+        if job.status == EXPORT_DONE:
+            text += f"✅ #{job.id} {job.title} — {finished}, {job.rows} строк, {format_size(job.size)}\n"
+            builder.button(text=f"📥 #{job.id} {job.title}", callback_data=f"admin:export_job:{job.id}")
+        else:
+            text += f"❌ #{job.id} {job.title} — {finished}, ошибка\n"
+
+    builder.button(text="🔄 Обновить", callback_data="admin:export_jobs")
+    builder.button(text="← Назад", callback_data="admin:export")
+    builder.adjust(1)
+
+    try:
+        await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    except Exception:
+        pass  # Список не изменился
+    await callback.answer()
+
+
+@admin_router.callback_query(F.data.startswith("admin:export_job:"))
+async def admin_export_job_resend(callback: CallbackQuery):
+    """Повторная отправка готового экспорта"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    try:
+        job_id = int(callback.data.split(":")[2])
+        sent = await get_export_queue().resend(callback.bot, callback.message.chat.id, job_id)
+    except Exception as e:
+        debug_print(f"❌ Ошибка повторной отправки экспорта: {e}")
+        sent = False
+
+    if sent:
+        await callback.answer()
+    else:
+        await callback.answer("❌ Файл недоступен, запустите экспорт заново", show_alert=True)
 
 
 # ==============================
@@ -2387,13 +2887,17 @@ async def admin_duels_end_all(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
+    persistence = get_persistence()
+
     count = 0
     for duel_id, duel in list(active_duels.items()):
         if duel.status == DuelStatus.IN_PROGRESS:
             duel.status = DuelStatus.COMPLETED
+            persistence.mark_dirty("active_duels", duel_id)
             count += 1
 
-    save_data()
+    persistence.schedule_save()
+    get_stats_cache().invalidate()
     await callback.answer(f"✅ Завершено {count} дуэлей!", show_alert=True)
     await admin_duels_menu(callback)
 
@@ -2405,6 +2909,7 @@ async def admin_duels_clear_waiting(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
+    persistence = get_persistence()
     count = len(waiting_duels)
 
     for duel_id in waiting_duels[:]:
@@ -2413,9 +2918,11 @@ async def admin_duels_clear_waiting(callback: CallbackQuery):
             if duel.player1_id in user_active_duels:
                 del user_active_duels[duel.player1_id]
             del active_duels[duel_id]
+            persistence.mark_dirty("active_duels", duel_id)
 
     waiting_duels.clear()
-    save_data()
+    persistence.schedule_save()
+    get_stats_cache().invalidate()
 
     await callback.answer(f"✅ Очищено {count} ожидающих дуэлей!", show_alert=True)
     await admin_duels_menu(callback)
@@ -2428,29 +2935,33 @@ async def admin_duels_detailed_stats(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    total_duels = sum(a.duels_won + a.duels_lost + a.duels_drawn for a in user_activities.values()) // 2
-    total_wins = sum(a.duels_won for a in user_activities.values())
-    total_losses = sum(a.duels_lost for a in user_activities.values())
-    total_draws = sum(a.duels_drawn for a in user_activities.values())
+    stats = await get_stats_cache().get()
 
     # Безопасное вычисление процента побед
-    win_rate = (total_wins / total_duels * 100) if total_duels > 0 else 0
-
-    top_elo = sorted(user_activities.items(), key=lambda x: x[1].elo_rating, reverse=True)[:5]
+    win_rate = (stats.duels_won / stats.total_duels * 100) if stats.total_duels > 0 else 0
 
     text = (
         "📊 <b>ДЕТАЛЬНАЯ СТАТИСТИКА ДУЭЛЕЙ</b>\n\n"
         f"🎯 <b>Общая статистика:</b>\n"
-        f"• Всего дуэлей: {total_duels}\n"
-        f"• Побед: {total_wins}\n"
-        f"• Поражений: {total_losses}\n"
-        f"• Ничьих: {total_draws}\n"
+        f"• Всего дуэлей: {stats.total_duels}\n"
+        f"• Побед: {stats.duels_won}\n"
+        f"• Поражений: {stats.duels_lost}\n"
+        f"• Ничьих: {stats.duels_drawn}\n"
         f"• Win Rate: {win_rate:.1f}%\n\n"
         f"🏆 <b>Топ-5 по ELO:</b>\n"
     )
 
-    for i, (user_id, activity) in enumerate(top_elo, 1):
-        text += f"{i}. ID: {user_id} - {activity.elo_rating} ELO\n"
+    for i, (user_id, elo) in enumerate(stats.top_elo, 1):
+        text += f"{i}. ID: {user_id} - {elo} ELO\n"
+
+    if stats.elo_median is not None:
+        text += (
+            f"\n📈 <b>Распределение ELO:</b>\n"
+            f"• Медиана: {stats.elo_median}\n"
+            f"• Топ-10% от: {stats.elo_p90}\n"
+        )
+        for low, count in stats.elo_histogram[-5:]:
+            text += f"• {low}–{low + 49}: {count}\n"
 
     await callback.message.edit_text(text, reply_markup=back_to_admin(), parse_mode="HTML")
     await callback.answer()
@@ -2467,33 +2978,36 @@ async def admin_premium_menu(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    premium_users = []
-    for user_id, sub in user_subscriptions.items():
-        if sub.is_active() and sub.tier != SubscriptionTier.FREE:
-            days_left = (sub.expires_at - datetime.now()).days if sub.expires_at else 9999
-            premium_users.append({
-                'id': user_id,
-                'tier': sub.tier.value,
-                'days_left': days_left,
-                'rating': users_rating.get(user_id, 0)
-            })
+    now = datetime.now()
+    await get_persistence().sync_changes()
+    # Индекс уже упорядочен по сроку: читаем только первые 10
+    subscription_index = get_subscription_index()
+    premium_subs = subscription_index.by_expiry(limit=10, now=now)
+    total_premium = len(subscription_index)
 
-    # Сортируем по оставшимся дням
-    premium_users.sort(key=lambda x: x['days_left'])
+    premium_users = [
+        {
+            'id': user_id,
+            'tier': tier.value,
+            'days_left': (expires_at - now).days if expires_at else 9999,
+            'rating': users_rating.get(user_id, 0)
+        }
+        for user_id, tier, expires_at in premium_subs[:10]
+    ]
 
     text = (
         "👑 <b>УПРАВЛЕНИЕ PREMIUM</b>\n\n"
-        f"📊 <b>Всего Premium пользователей:</b> {len(premium_users)}\n\n"
+        f"📊 <b>Всего Premium пользователей:</b> {total_premium}\n\n"
     )
 
     if premium_users:
         text += "<b>Активные подписки:</b>\n"
-        for user in premium_users[:10]:
+        for user in premium_users:
             days_text = f"{user['days_left']} дн." if user['days_left'] < 9999 else "Lifetime"
             text += f"• ID: {user['id']} | {user['tier']} | Осталось: {days_text} | Баллы: {user['rating']}\n"
 
-        if len(premium_users) > 10:
-            text += f"...и еще {len(premium_users) - 10} пользователей\n"
+        if total_premium > 10:
+            text += f"...и еще {total_premium - 10} пользователей\n"
     else:
         text += "❌ Нет активных Premium подписок\n"
 
@@ -2516,30 +3030,15 @@ async def admin_premium_stats(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    total_revenue = 0
-    premium_count = 0
-    pro_count = 0
-    lifetime_count = 0
-
-    for sub in user_subscriptions.values():
-        for transaction in sub.transaction_history:
-            total_revenue += transaction.get('amount', 0)
-
-        if sub.is_active():
-            if sub.tier == SubscriptionTier.PREMIUM:
-                premium_count += 1
-            elif sub.tier == SubscriptionTier.PRO:
-                pro_count += 1
-                if sub.expires_at and (sub.expires_at - datetime.now()).days > 365:
-                    lifetime_count += 1
+    stats = await get_stats_cache().get()
 
     text = (
         "📊 <b>СТАТИСТИКА PREMIUM</b>\n\n"
-        f"💰 <b>Общий доход:</b> {total_revenue}₽\n"
-        f"👑 <b>Premium подписок:</b> {premium_count}\n"
-        f"💎 <b>Pro подписок:</b> {pro_count}\n"
-        f"♾ <b>Lifetime:</b> {lifetime_count}\n\n"
-        f"📅 <b>Средний чек:</b> {total_revenue // max(1, premium_count + pro_count)}₽\n"
+        f"💰 <b>Общий доход:</b> {stats.total_revenue}₽\n"
+        f"👑 <b>Premium подписок:</b> {stats.premium_count}\n"
+        f"💎 <b>Pro подписок:</b> {stats.pro_count}\n"
+        f"♾ <b>Lifetime:</b> {stats.lifetime_count}\n\n"
+        f"📅 <b>Средний чек:</b> {stats.total_revenue // max(1, stats.premium_count + stats.pro_count)}₽\n"
     )
 
     builder = InlineKeyboardBuilder()
@@ -2691,7 +3190,7 @@ async def admin_edit_points_amount(message: Message, state: FSMContext):
             change_text = f"={amount}"
             new_value = amount
 
-        save_data()
+        get_persistence().touch("users_rating", user_id)
 
         result_text = (
             f"✅ <b>Баллы изменены!</b>\n\n"
@@ -2820,6 +3319,10 @@ async def admin_stats_by_id_show(message: Message, state: FSMContext):
     total_duels = activity.duels_won + activity.duels_lost + activity.duels_drawn
     win_rate = (activity.duels_won / total_duels * 100) if total_duels > 0 else 0
 
+    # Баллы, начисленные bot.py без mark_dirty, — в таблицу лидеров до чтения
+    await get_persistence().sync_changes()
+    place = get_leaderboard().rank_of(user_id)
+
     if sub.is_active() and sub.tier != SubscriptionTier.FREE:
         premium_status = f"✅ Активен до {sub.expires_at.strftime('%d.%m.%Y')}"
         days_left = (sub.expires_at - datetime.now()).days
@@ -2831,6 +3334,7 @@ async def admin_stats_by_id_show(message: Message, state: FSMContext):
         f"📊 <b>СТАТИСТИКА ПОЛЬЗОВАТЕЛЯ</b>\n\n"
         f"👤 <b>ID:</b> {user_id}\n"
         f"💰 <b>Баллы:</b> {rating}\n"
+        f"🏆 <b>Место в рейтинге:</b> {place or '—'} из {len(users_rating)}\n"
         f"👑 <b>Premium:</b> {premium_status}\n"
         f"📅 <b>Осталось дней:</b> {days_left}\n\n"
         f"📚 <b>Обучение:</b>\n"
@@ -2847,8 +3351,8 @@ async def admin_stats_by_id_show(message: Message, state: FSMContext):
         f"• Win Rate: {win_rate:.1f}%\n"
         f"• ELO: {activity.elo_rating}\n\n"
         f"🔥 <b>Стрик:</b> {activity.daily_streak} дней\n"
-        f"📅 <b>В боте с:</b> {activity.first_seen.strftime('%d.%m.%Y')}\n"
-        f"🕐 <b>Последняя активность:</b> {activity.last_activity.strftime('%d.%m.%Y %H:%M')}"
+        f"📅 <b>В боте с:</b> {format_date(activity.first_seen, '%d.%m.%Y')}\n"
+        f"🕐 <b>Последняя активность:</b> {format_date(activity.last_activity, '%d.%m.%Y %H:%M')}"
     )
 
     builder = InlineKeyboardBuilder()
@@ -2901,16 +3405,9 @@ async def admin_export_user(callback: CallbackQuery):
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
 
-    activity = get_user_activity(user_id)
-    sub = get_user_subscription(user_id)
-
     user_data = {
         'user_id': user_id,
-        'rating': users_rating.get(user_id, 0),
-        'activity': activity.to_dict(),
-        'subscription': sub.to_dict(),
-        'completed_topics': list(users_completed_topics.get(user_id, set())),
-        'available_topics': users_available_topics.get(user_id, []),
+        **user_export_record(user_id),
         'exported_at': datetime.now().isoformat()
     }
 
@@ -2931,23 +3428,31 @@ async def admin_export_user(callback: CallbackQuery):
 # ТОП-100 ПОЛЬЗОВАТЕЛЕЙ
 # ==============================
 
-@admin_router.callback_query(F.data == "admin:top_100")
+@admin_router.callback_query(F.data.startswith("admin:top_100"))
 async def admin_top_100(callback: CallbackQuery):
-    """Топ-100 пользователей"""
+    """Топ-100 пользователей (по 20 на странице)"""
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    sorted_users = sorted(users_rating.items(), key=lambda x: x[1], reverse=True)[:100]
-
-    text = "🏆 <b>ТОП-100 ПОЛЬЗОВАТЕЛЕЙ</b>\n\n"
+    try:
+        page = int(callback.data.split(":")[2])
+    except (IndexError, ValueError):
+        page = 0
 
-    page = 0
     per_page = 20
+    pages = 100 // per_page
+    page = max(0, min(page, pages - 1))
     start = page * per_page
-    end = start + per_page
 
-    for i, (user_id, rating) in enumerate(sorted_users[start:end], start + 1):
+    # Баллы, начисленные bot.py без mark_dirty, — в таблицу лидеров до чтения
+    await get_persistence().sync_changes()
+    leaderboard = get_leaderboard()
+    page_users = leaderboard.page(start, per_page)
+
+    text = f"🏆 <b>ТОП-100 ПОЛЬЗОВАТЕЛЕЙ</b> (стр. {page + 1}/{pages})\n\n"
+
+    for i, (user_id, rating) in enumerate(page_users, start + 1):
         activity = get_user_activity(user_id)
         sub = get_user_subscription(user_id)
 
@@ -2959,10 +3464,16 @@ async def admin_top_100(callback: CallbackQuery):
     text += f"\n📊 Всего пользователей: {len(users_rating)}"
 
     builder = InlineKeyboardBuilder()
-    builder.button(text="📤 Экспорт в CSV", callback_data="admin:export_users_csv")
-    builder.button(text="📤 Экспорт в JSON", callback_data="admin:export_users_json")
-    builder.button(text="← Назад", callback_data="admin:users_menu")
-    builder.adjust(1)
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"admin:top_100:{page - 1}"))
+    if page < pages - 1 and start + per_page < len(users_rating):
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"admin:top_100:{page + 1}"))
+    if navigation:
+        builder.row(*navigation)
+    builder.row(InlineKeyboardButton(text="📤 Экспорт в CSV", callback_data="admin:export_users_csv"))
+    builder.row(InlineKeyboardButton(text="📤 Экспорт в JSON", callback_data="admin:export_users_json"))
+    builder.row(InlineKeyboardButton(text="← Назад", callback_data="admin:users_menu"))
 
     await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
     await callback.answer()
@@ -2979,31 +3490,26 @@ async def admin_stats(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
 
-    total_duels = sum(a.duels_won + a.duels_lost + a.duels_drawn for a in user_activities.values()) // 2
-    total_questions_answered = sum(a.questions_answered for a in user_activities.values())
-    total_correct = sum(a.correct_answers for a in user_activities.values())
-
-    premium_users = len([u for u, s in user_subscriptions.items() if s.is_active() and s.tier != SubscriptionTier.FREE])
-    active_today = len([a for a in user_activities.values() if a.last_activity.date() == datetime.now().date()])
-    active_week = len([a for a in user_activities.values() if (datetime.now() - a.last_activity).days < 7])
+    stats = await get_stats_cache().get()
 
     text = (
         "📊 <b>СТАТИСТИКА БОТА</b>\n\n"
         f"👥 <b>Пользователи:</b>\n"
-        f"• Всего: {len(users_rating)}\n"
-        f"• Активных сегодня: {active_today}\n"
-        f"• Активных за неделю: {active_week}\n"
-        f"• Premium: {premium_users}\n\n"
+        f"• Всего: {stats.total_users}\n"
+        f"• Активных сегодня: {stats.active_today}\n"
+        f"• Активных за неделю: {stats.active_week}\n"
+        f"• Активных за месяц: {stats.active_month}\n"
+        f"• Premium: {len(stats.premium_users)}\n\n"
         f"📚 <b>Обучение:</b>\n"
-        f"• Всего уроков: {sum(a.lessons_completed for a in user_activities.values())}\n"
-        f"• Всего ответов: {total_questions_answered}\n"
-        f"• Правильных: {total_correct}\n"
-        f"• Общая точность: {(total_correct / total_questions_answered * 100) if total_questions_answered else 0:.1f}%\n\n"
+        f"• Всего уроков: {stats.lessons}\n"
+        f"• Всего ответов: {stats.questions}\n"
+        f"• Правильных: {stats.correct}\n"
+        f"• Общая точность: {stats.accuracy:.1f}%\n\n"
         f"⚔️ <b>Дуэли:</b>\n"
-        f"• Всего дуэлей: {total_duels}\n"
-        f"• Активных: {len([d for d in active_duels.values() if d.status == DuelStatus.IN_PROGRESS])}\n"
-        f"• В очереди: {len(waiting_duels)}\n"
-        f"• Средний ELO: {sum(a.elo_rating for a in user_activities.values()) // max(1, len(user_activities))}\n"
+        f"• Всего дуэлей: {stats.total_duels}\n"
+        f"• Активных: {stats.duels_active}\n"
+        f"• В очереди: {stats.duels_waiting}\n"
+        f"• Средний ELO: {stats.avg_elo}\n"
     )
 
     builder = InlineKeyboardBuilder()
@@ -3013,6 +3519,74 @@ async def admin_stats(callback: CallbackQuery):
     await callback.answer()
 
 
+# ==============================
+# КОГОРТЫ И УДЕРЖАНИЕ
+# ==============================
+
+@admin_router.callback_query(F.data == "admin:cohorts")
+async def admin_cohorts(callback: CallbackQuery):
+    """Удержание и конверсии по неделям прихода"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    # Активность bot.py без mark_dirty — в индекс дней и когорты до отчёта
+    await get_persistence().sync_changes()
+    rows = get_cohort_engine().report(limit=8)
+
+    text = (
+        "📈 <b>КОГОРТЫ ПО НЕДЕЛЕ ПРИХОДА</b>\n\n"
+        "Удержание: доля когорты, активной через 1, 2 и 4 недели.\n"
+        "Конверсия: 📚 уроки, ⚔️ дуэли, 👑 оплата.\n\n"
+    )
+
+    if rows:
+        for row in reversed(rows):
+            retention = " · ".join(
+                f"W{week} {row.retention[week]:.0f}%" for week in (1, 2, 4) if week < len(row.retention)
+            )
+            text += (
+                f"<b>{row.week.strftime('%d.%m.%Y')}</b> — {row.size} чел.\n"
+                f"• {retention or 'первая неделя'}\n"
+                f"• 📚 {row.lessons:.0f}% | ⚔️ {row.duels:.0f}% | 👑 {row.premium:.1f}%\n\n"
+            )
+    else:
+        text += "❌ Нет данных об активности\n"
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📥 Полный отчёт (CSV)", callback_data="admin:export_cohorts")
+    builder.button(text="🔄 Обновить", callback_data="admin:cohorts")
+    builder.button(text="← Назад", callback_data="admin:stats_menu")
+    builder.adjust(1)
+
+    try:
+        await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    except Exception:
+        pass  # Текст не изменился
+    await callback.answer()
+
+
+@admin_router.callback_query(F.data == "admin:export_cohorts")
+async def admin_export_cohorts(callback: CallbackQuery):
+    """Экспорт когортного отчёта в CSV"""
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+
+    # Отчёт считается в цикле событий: движок когорт не потокобезопасен
+    await get_persistence().sync_changes()
+    engine = get_cohort_engine()
+    rows = len(engine.report())
+    csv_text = engine.to_csv()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    def build(export, job):
+        export.write(csv_text)
+        export.add_rows(rows)
+
+    await enqueue_export(callback, "Когорты и удержание", f'cohorts_{timestamp}.csv', build)
+
+
 # ==============================
 # ПЕРЕЗАГРУЗКА ТЕМ
 # ==============================
@@ -3025,7 +3599,7 @@ async def admin_reload(callback: CallbackQuery):
         return
 
     try:
-        load_themes()
+        reload_themes()
         await callback.answer(f"✅ Темы перезагружены! Загружено {len(TOPICS)} тем", show_alert=True)
     except Exception as e:
         await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
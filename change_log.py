@@ -0,0 +1,253 @@
+# change_log.py - ОТСЛЕЖИВАНИЕ ИЗМЕНЕНИЙ ПОЛЬЗОВАТЕЛЕЙ ДЛЯ ДЕЛЬТА-ЭКСПОРТА
+#
+# Каждое изменение рейтинга, активности или подписки пользователя (события
+# persistence) получает следующий номер последовательности seq, и у
+# пользователя запоминается номер последнего изменения. Пары (seq, user_id)
+# лежат в отсортированном списке, поэтому «изменившиеся после seq S» — срез
+# списка, а не обход всех пользователей.
+#
+# Каждый экспорт пользователей записывает метку — номер экспорта и seq на
+# момент снимка. Запрос «изменения с экспорта N» выдаёт пользователей,
+# изменённых после метки N, и удалённых за это время.
+#
+# События приходят и от mark_dirty(), и от поиска изменений persistence
+# (change_scan.py), который находит правки bot.py в обход сохранения;
+# экраны дельта-экспорта перед чтением вызывают sync_changes().
+#
+# Изменения, сделанные до остановки, но не успевшие попасть в сохранённое
+# состояние (аварийная остановка), при запуске берутся из persistence:
+# restore() оставляет в restored ключи, восстановленные из журнала записи
+# (reconcile). Такие пользователи отмечаются изменёнными ещё раз — лишняя
+# строка в дельте безопаснее потерянной.
+#
+# Дельты запрашиваются только от хранимых меток (последние KEEP_MARKS),
+# поэтому изменения и удаления не новее самой старой метки отбрасываются:
+# память растёт с числом изменений между метками, а не со временем работы.
+#
+# Состояние сохраняется в DATA_DIR/change_log.json с задержкой
+# CHANGE_LOG_SAVE_DELAY: в цикле событий словари только копируются,
+# остальное делается в потоке записи. Пользователи, существовавшие до
+# включения отслеживания или не менявшиеся с самой старой метки, имеют seq 0.
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+from sortedcontainers import SortedList
+
+from persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Разделы, изменения которых попадают в дельту
+TRACKED_SECTIONS = ("users_rating", "user_activities", "user_subscriptions")
+
+KEEP_MARKS = 50  # Меток экспорта в истории
+
+
+class ExportMark(NamedTuple):
+    """Метка экспорта: всё до seq включительно уже выгружено"""
+    number: int
+    seq: int
+    created_at: str
+    kind: str  # full или delta
+
+
+class ChangeLog:
+    """Номера последних изменений пользователей и метки экспортов"""
+
+    def __init__(self, path: Optional[Path] = None, delay: float = 10.0):
+        self.path = Path(path) if path else None
+        self.delay = delay
+        self.seq = 0
+        self.marks: List[ExportMark] = []
+
+        self._changed: Dict[Hashable, int] = {}
+        self._order = SortedList()  # (seq, user_id)
+        self._deleted: Dict[Hashable, int] = {}
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+
+    # ==============================
+    # СОБЫТИЯ
+    # ==============================
+
+    def _touch(self, user_id: Hashable):
+        self.seq += 1
+        old = self._changed.get(user_id)
+        if old is not None:
+            self._order.remove((old, user_id))
+        self._changed[user_id] = self.seq
+        self._order.add((self.seq, user_id))
+        self._deleted.pop(user_id, None)
+        self._schedule_save()
+
+    def on_change(self, section: str, user_id: Hashable, value: Any):
+        """Обработчик изменений разделов пользователя"""
+        if value is not None:
+            self._touch(user_id)
+
+    def on_rating(self, user_id: Hashable, value: Any):
+        """users_rating: удаление записи — удаление пользователя"""
+        if value is not None:
+            self._touch(user_id)
+        else:
+            self._delete(user_id)
+
+    def _delete(self, user_id: Hashable):
+        self.seq += 1
+        old = self._changed.pop(user_id, None)
+        if old is not None:
+            self._order.remove((old, user_id))
+        self._deleted[user_id] = self.seq
+        self._schedule_save()
+
+    def listener(self, section: str):
+        """Обработчик событий persistence для раздела"""
+        if section == "users_rating":
+            return self.on_rating
+        return lambda user_id, value: self.on_change(section, user_id, value)
+
+    def reconcile(self, restored: Iterable[Hashable], users: Dict[Hashable, Any]) -> int:
+        """Отметить пользователей, восстановленных при запуске из журнала записи
+
+        Пользователь без рейтинга в users считается удалённым.
+        Возвращает число отмеченных пользователей.
+        """
+        changed, deleted = set(), set()
+        for user_id in restored:
+            (changed if user_id in users else deleted).add(user_id)
+        for user_id in sorted(changed, key=str):
+            self._touch(user_id)
+        for user_id in sorted(deleted, key=str):
+            self._delete(user_id)
+
+        if changed or deleted:
+            logger.info(f"🔖 Изменений пользователей с прошлого запуска: {len(changed)}, удалено: {len(deleted)}")
+        self._schedule_save()
+        return len(changed) + len(deleted)
+
+    # ==============================
+    # МЕТКИ И ДЕЛЬТЫ
+    # ==============================
+
+    def mark(self, kind: str) -> ExportMark:
+        """Записать метку экспорта на текущий seq"""
+        number = self.marks[-1].number + 1 if self.marks else 1
+        mark = ExportMark(number, self.seq, datetime.now().isoformat(timespec="seconds"), kind)
+        self.marks.append(mark)
+        del self.marks[:-KEEP_MARKS]
+        self._prune()
+        self._schedule_save()
+        return mark
+
+    def _prune(self):
+        """Забыть изменения и удаления, не новее самой старой метки"""
+        oldest = self.marks[0].seq
+        while self._order and self._order[0][0] <= oldest:
+            _, user_id = self._order.pop(0)
+            del self._changed[user_id]
+        for user_id in [user_id for user_id, seq in self._deleted.items() if seq <= oldest]:
+            del self._deleted[user_id]
+
+    def get_mark(self, number: int) -> Optional[ExportMark]:
+        for mark in self.marks:
+            if mark.number == number:
+                return mark
+        return None
+
+    def changed_since(self, seq: int) -> List[Hashable]:
+        """Пользователи с изменениями после seq, в порядке изменений"""
+        return [user_id for _, user_id in self._order.irange((seq, float("inf")), inclusive=(False, True))]
+
+    def count_since(self, seq: int) -> int:
+        return len(self._order) - self._order.bisect_right((seq, float("inf")))
+
+    def deleted_since(self, seq: int) -> List[Hashable]:
+        return [user_id for user_id, deleted in self._deleted.items() if deleted > seq]
+
+    def last_change(self, user_id: Hashable) -> int:
+        return self._changed.get(user_id, 0)
+
+    # ==============================
+    # ХРАНЕНИЕ
+    # ==============================
+
+    def _state(self) -> tuple:
+        """Копия состояния для записи (в цикле событий)"""
+        return self.seq, dict(self._changed), dict(self._deleted), list(self.marks)
+
+    @staticmethod
+    def _write(path: Path, state: tuple):
+        """Запись копии состояния (в потоке)"""
+        seq, changed, deleted, marks = state
+        write_json_atomic(path, {
+            "seq": seq,
+            "changed": {str(user_id): number for user_id, number in changed.items()},
+            "deleted": {str(user_id): number for user_id, number in deleted.items()},
+            "marks": [list(mark) for mark in marks],
+        })
+
+    def load(self) -> bool:
+        """Загрузка состояния с диска; False, если файла нет"""
+        if self.path is None or not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.seq = data.get("seq", 0)
+        self._changed = {int(user_id): seq for user_id, seq in data.get("changed", {}).items()}
+        self._order = SortedList((seq, user_id) for user_id, seq in self._changed.items())
+        self._deleted = {int(user_id): seq for user_id, seq in data.get("deleted", {}).items()}
+        self.marks = [ExportMark(*mark) for mark in data.get("marks", [])]
+        return True
+
+    def save(self):
+        """Синхронная запись состояния"""
+        if self.path is not None:
+            self._write(self.path, self._state())
+
+    def _schedule_save(self):
+        if self.path is None or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.delay, self._scheduled_save)
+
+    def _scheduled_save(self):
+        self._save_handle = None
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self._write, self.path, self._state())
+        future.add_done_callback(self._saved)
+
+    def _saved(self, future):
+        if future.exception() is not None:
+            logger.error(f"❌ Ошибка сохранения журнала изменений: {future.exception()}")
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_log: Optional[ChangeLog] = None
+
+
+def get_change_log() -> ChangeLog:
+    """Журнал изменений, дополненный восстановленными записями и подписанный на разделы пользователей"""
+    global _log
+    if _log is None:
+        from config import config
+        from persistence import get_persistence
+
+        _log = ChangeLog(config.DATA_DIR / "change_log.json", delay=config.CHANGE_LOG_SAVE_DELAY)
+        _log.load()
+
+        persistence = get_persistence()
+        restored = set().union(*(persistence.restored.get(section, ()) for section in TRACKED_SECTIONS))
+        _log.reconcile(restored, persistence.sources["users_rating"])
+        for section in TRACKED_SECTIONS:
+            persistence.add_listener(section, _log.listener(section))
+    return _log
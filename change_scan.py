@@ -0,0 +1,145 @@
+# change_scan.py - ПОИСК ИЗМЕНЕНИЙ В ОБХОД MARK_DIRTY
+#
+# Обработчики bot.py (викторина, дуэли, оплата) меняют словари состояния
+# напрямую и не вызывают mark_dirty(), поэтому журнал, SQLite-хранилище
+# и подписчики persistence (индексы, журнал изменений) их не видят.
+# Записи ActivityRecord сообщают о правках сами (compact.track_changes),
+# а для остальных ChangeScanner раз в CHANGE_SCAN_INTERVAL сверяет
+# отпечаток каждой записи с запомненным: изменённые и удалённые записи
+# проходят через менеджер сохранения как обычные изменения.
+#
+# Отпечаток дешёвый и без сериализации: число — само число, список тем —
+# его кортеж, объект — кортеж значений его полей, где вложенные списки
+# и словари (история транзакций) заменены длиной. Обход идёт только в фоне,
+# в event loop пачками по batch записей с передачей управления между
+# пачками; чтения админки его не ждут. Первый обход только запоминает
+# отпечатки.
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from persistence import PersistenceManager
+
+logger = logging.getLogger(__name__)
+
+# Отпечаток записей, которые сообщают об изменениях сами: проверяется только удаление
+TRACKED = 0
+
+_CONTAINERS = (list, dict, set, frozenset, tuple)
+
+
+def fingerprint(value: Any) -> int:
+    """Отпечаток записи для сравнения в пределах процесса"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return hash(value)
+    if isinstance(value, (set, frozenset)):
+        return hash(frozenset(value))
+    if isinstance(value, (list, tuple)):
+        return hash(tuple(value))
+
+    fields = getattr(value, "__dict__", None)
+    if fields is None:
+        return hash(repr(value))
+    state = tuple(len(v) if isinstance(v, _CONTAINERS) else v for v in fields.values())
+    try:
+        return hash(state)
+    except TypeError:
+        return hash(repr(state))
+
+
+class ChangeScanner:
+    """Отпечатки записей разделов и фоновый поиск записей, изменённых без mark_dirty"""
+
+    def __init__(self, manager: "PersistenceManager", sections: Iterable[str],
+                 interval: float = 60.0, batch: int = 2000, tracked: Tuple[type, ...] = ()):
+        self.manager = manager
+        self.sections = [section for section in sections if section in manager.sources]
+        self.interval = interval
+        self.batch = batch
+        self.tracked = tracked
+        self.seeded = False
+        self.scans = 0
+        self.found = 0
+
+        self._digests: Dict[str, Dict[Hashable, int]] = {section: {} for section in self.sections}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _fingerprint(self, value: Any) -> int:
+        if self.tracked and isinstance(value, self.tracked):
+            return TRACKED
+        return fingerprint(value)
+
+    def remember(self, section: str, key: Hashable, value: Any):
+        """Запись помечена через mark_dirty: обновить её отпечаток"""
+        digests = self._digests.get(section)
+        if digests is None:
+            return
+        if value is None:
+            digests.pop(key, None)
+        else:
+            digests[key] = self._fingerprint(value)
+
+    def start(self):
+        """Запуск периодического обхода в текущем event loop"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def _loop(self):
+        await self.scan()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.error(f"❌ Ошибка поиска изменений: {e}")
+
+    async def scan(self) -> int:
+        """Обход всех разделов; возвращает число найденных изменений"""
+        async with self._lock:
+            found = 0
+            for section in self.sections:
+                found += await self._scan_section(section)
+            if not self.seeded:
+                self.seeded = True
+                return 0
+
+            self.scans += 1
+            self.found += found
+            if found:
+                logger.info(f"🔎 Найдено изменений в обход сохранения: {found}")
+                self.manager.schedule_save()
+            return found
+
+    async def _scan_section(self, section: str) -> int:
+        source = self.manager.sources[section]
+        digests = self._digests[section]
+        keys = list(source)
+        found = 0
+
+        for start in range(0, len(keys), self.batch):
+            if start:
+                await asyncio.sleep(0)
+            for key in keys[start:start + self.batch]:
+                value = source.get(key)
+                if value is None:
+                    continue
+                digest = self._fingerprint(value)
+                if digests.get(key) == digest:
+                    continue
+                digests[key] = digest
+                if self.seeded:
+                    self.manager.mark_changed(section, key, value)
+                    found += 1
+
+        # Записи, удалённые из словаря
+        for key in [key for key in digests if key not in source]:
+            del digests[key]
+            if self.seeded:
+                self.manager.mark_changed(section, key, None)
+                found += 1
+        return found
@@ -0,0 +1,236 @@
+# cohorts.py - КОГОРТНЫЙ АНАЛИЗ УДЕРЖАНИЯ
+#
+# Пользователи группируются в когорты по неделе first_seen (неделя
+# начинается с понедельника). Для каждой когорты считаются:
+#   • удержание — доля когорты, активная на 0, 1, 2... неделе после прихода
+#     (по дневным картам индекса активности, activity_index.py),
+#   • конверсия в уроки и дуэли — доля когорты с хотя бы одним уроком/дуэлью,
+#   • конверсия в Premium — доля когорты с хотя бы одной оплатой.
+#
+# Расчёт инкрементальный: завершённая неделя обрабатывается один раз,
+# и её столбец дописывается к кешу удержания каждой когорты. Текущая
+# неделя пересчитывается при чтении (не больше семи дневных карт).
+# Размеры когорт и конверсии обновляются событиями persistence.
+# Удержание прошлых недель не пересчитывается задним числом, а история
+# ограничена сроком хранения индекса активности (ACTIVITY_INDEX_DAYS).
+
+import csv
+import io
+import logging
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Флаги конверсии пользователя
+LESSONS = 1
+DUELS = 2
+PREMIUM = 4
+
+
+def week_of(day: date) -> int:
+    """Ordinal понедельника недели, в которую попадает день"""
+    return day.toordinal() - day.weekday()
+
+
+class CohortRow(NamedTuple):
+    """Строка когортного отчёта"""
+    week: date  # Понедельник недели прихода
+    size: int
+    retention: List[float]  # % когорты, активной на неделе 0, 1, 2...
+    lessons: float  # % с хотя бы одним уроком
+    duels: float  # % с хотя бы одной дуэлью
+    premium: float  # % с хотя бы одной оплатой
+
+
+class CohortEngine:
+    """Когорты по неделе прихода с кешем удержания"""
+
+    def __init__(self, activity_index: Any):
+        self.activity_index = activity_index
+        self._reset()
+
+    def _reset(self):
+        self._cohort_of: Dict[Hashable, int] = {}
+        self._flags: Dict[Hashable, int] = {}
+        self._sizes: Counter = Counter()
+        self._converted: Dict[int, Counter] = {LESSONS: Counter(), DUELS: Counter(), PREMIUM: Counter()}
+
+        # Кеш удержания: когорта -> активных на завершённых неделях 0, 1, 2...
+        self._retention: Dict[int, List[int]] = {}
+        # Первая ещё не обработанная неделя
+        self._next_week: Optional[int] = None
+
+    # ==============================
+    # СОБЫТИЯ
+    # ==============================
+
+    def _set_flags(self, user_id: Hashable, flags: int, mask: int):
+        """Установить биты mask флагов пользователя в значения из flags"""
+        old = self._flags.get(user_id, 0)
+        new = (old & ~mask) | (flags & mask)
+        if new == old:
+            return
+        if new:
+            self._flags[user_id] = new
+        else:
+            self._flags.pop(user_id, None)
+
+        cohort = self._cohort_of.get(user_id)
+        if cohort is not None:
+            for flag, counter in self._converted.items():
+                if (old ^ new) & flag:
+                    counter[cohort] += 1 if new & flag else -1
+
+    def _join(self, user_id: Hashable, cohort: Optional[int]):
+        old = self._cohort_of.pop(user_id, None)
+        flags = self._flags.get(user_id, 0)
+        if old is not None:
+            self._sizes[old] -= 1
+            for flag, counter in self._converted.items():
+                if flags & flag:
+                    counter[old] -= 1
+        if cohort is not None:
+            self._cohort_of[user_id] = cohort
+            self._sizes[cohort] += 1
+            for flag, counter in self._converted.items():
+                if flags & flag:
+                    counter[cohort] += 1
+            self._retention.setdefault(cohort, [])
+
+    def on_activity(self, user_id: Hashable, activity: Any):
+        """Обработчик изменений user_activities"""
+        if activity is None:
+            self._join(user_id, None)
+            self._set_flags(user_id, 0, LESSONS | DUELS)
+            return
+
+        if user_id not in self._cohort_of and activity.first_seen:
+            self._join(user_id, week_of(activity.first_seen.date()))
+
+        flags = 0
+        if activity.lessons_completed:
+            flags |= LESSONS
+        if activity.duels_won or activity.duels_lost or activity.duels_drawn:
+            flags |= DUELS
+        self._set_flags(user_id, flags, LESSONS | DUELS)
+
+    def on_subscription(self, user_id: Hashable, sub: Any):
+        """Обработчик изменений user_subscriptions"""
+        history = sub.transaction_history if sub is not None else []
+        paid = any((transaction.get('amount', 0) or 0) > 0 for transaction in history)
+        self._set_flags(user_id, PREMIUM if paid else 0, PREMIUM)
+
+    def rebuild(self, activities: Dict[Hashable, Any], subscriptions: Dict[Hashable, Any]):
+        """Полная сборка когорт и конверсий"""
+        self._reset()
+        for user_id, sub in subscriptions.items():
+            self.on_subscription(user_id, sub)
+        for user_id, activity in activities.items():
+            self.on_activity(user_id, activity)
+
+    # ==============================
+    # УДЕРЖАНИЕ
+    # ==============================
+
+    def _week_counts(self, week: int) -> Counter:
+        """Активные на неделе пользователи по когортам"""
+        monday = date.fromordinal(week)
+        active = self.activity_index.users_between(monday, monday + timedelta(days=6))
+        cohort_of = self._cohort_of
+        return Counter(cohort_of[user_id] for user_id in active if user_id in cohort_of)
+
+    def _advance(self, today: date):
+        """Обработать завершённые недели, которые ещё не попали в кеш"""
+        current = week_of(today)
+        if self._next_week is None:
+            first = min(self._retention, default=current)
+            # Раньше срока хранения индекса данных об активности нет
+            oldest = week_of(today - timedelta(days=self.activity_index.keep_days))
+            self._next_week = max(first, oldest)
+
+        while self._next_week < current:
+            week = self._next_week
+            counts = self._week_counts(week)
+            for cohort, retention in self._retention.items():
+                if cohort > week:
+                    continue
+                offset = (week - cohort) // 7
+                # Недели вне истории индекса считаются нулевыми
+                retention.extend([0] * (offset - len(retention)))
+                if len(retention) == offset:
+                    retention.append(counts.get(cohort, 0))
+            self._next_week = week + 7
+
+    def report(self, limit: Optional[int] = None, today: Optional[date] = None) -> List[CohortRow]:
+        """Когорты по возрастанию недели (последние limit)"""
+        today = today or date.today()
+        self._advance(today)
+        current = week_of(today)
+        current_counts = self._week_counts(current)
+
+        cohorts = sorted(cohort for cohort, size in self._sizes.items() if size > 0)
+        if limit:
+            cohorts = cohorts[-limit:]
+
+        rows = []
+        for cohort in cohorts:
+            size = self._sizes[cohort]
+            weeks = (current - cohort) // 7
+            counts = self._retention.get(cohort, [])[:weeks]
+            counts = counts + [0] * (weeks - len(counts)) + [current_counts.get(cohort, 0)]
+            rows.append(CohortRow(
+                week=date.fromordinal(cohort),
+                size=size,
+                retention=[count / size * 100 for count in counts],
+                lessons=self._converted[LESSONS][cohort] / size * 100,
+                duels=self._converted[DUELS][cohort] / size * 100,
+                premium=self._converted[PREMIUM][cohort] / size * 100,
+            ))
+        return rows
+
+    def to_csv(self, today: Optional[date] = None) -> str:
+        """Отчёт по всем когортам в CSV"""
+        rows = self.report(today=today)
+        horizon = max((len(row.retention) for row in rows), default=0)
+
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(
+            ['Cohort Week', 'Users', 'Lessons %', 'Duels %', 'Premium %']
+            + [f'Week {offset}' for offset in range(horizon)]
+        )
+        for row in rows:
+            writer.writerow(
+                [row.week.isoformat(), row.size, f"{row.lessons:.1f}", f"{row.duels:.1f}", f"{row.premium:.1f}"]
+                + [f"{value:.1f}" for value in row.retention]
+            )
+        return output.getvalue()
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_engine: Optional[CohortEngine] = None
+
+
+def get_cohort_engine() -> CohortEngine:
+    """Когортный анализ, подписанный на изменения активности и подписок"""
+    global _engine
+    if _engine is None:
+        from bot import user_activities, user_subscriptions
+        from activity_index import get_activity_index
+        from persistence import get_persistence
+
+        started = time.perf_counter()
+        _engine = CohortEngine(get_activity_index())
+        _engine.rebuild(user_activities, user_subscriptions)
+
+        persistence = get_persistence()
+        persistence.add_listener("user_activities", _engine.on_activity)
+        persistence.add_listener("user_subscriptions", _engine.on_subscription)
+        logger.info(f"📈 Когорты построены за {(time.perf_counter() - started) * 1000:.0f} мс")
+    return _engine
@@ -0,0 +1,238 @@
+# compact.py - КОМПАКТНОЕ ПРЕДСТАВЛЕНИЕ АКТИВНОСТИ ПОЛЬЗОВАТЕЛЯ
+#
+# ActivityRecord повторяет атрибуты UserActivity, но хранит их в __slots__
+# без словаря экземпляра, а даты — целыми epoch-секундами. first_seen
+# и last_activity по-прежнему читаются и присваиваются как datetime,
+# поэтому карточка пользователя и экспорты работают без изменений.
+# Отсутствующая дата хранится как 0 и читается как None.
+#
+# Поля блокировки (is_banned, ban_reason, banned_at) — тоже слоты, но
+# заполняются только при блокировке: как и у UserActivity, hasattr()
+# до блокировки возвращает False.
+#
+# get_persistence() при запуске заменяет загруженные bot.py объекты
+# UserActivity на ActivityRecord (compact_activities, COMPACT_ACTIVITIES)
+# и восстанавливает записи с диска сразу в этом виде. Пользователи,
+# которых bot.py создаёт позже, остаются UserActivity до следующего
+# запуска: модули статистики принимают оба типа. Подключение в самом
+# bot.py (при загрузке данных) делает то же без перестройки:
+#     user_activities = {int(k): ActivityRecord.from_dict(v) for k, v in data.items()}
+#
+# После загрузки persistence включает track_changes(): каждое присваивание
+# атрибута записи сообщает её user_id, поэтому правки bot.py в обход
+# mark_dirty() попадают в сохранение и индексы без поиска по всем записям.
+
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+
+def to_epoch(value: Any) -> int:
+    """datetime, ISO-строка или число в целые epoch-секунды"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(str(value)).timestamp())
+
+
+def from_epoch(value: int) -> Optional[datetime]:
+    """epoch-секунды в datetime; 0 — даты нет"""
+    return datetime.fromtimestamp(value) if value else None
+
+
+def to_iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+class ActivityRecord:
+    """Активность пользователя без __dict__: счётчики и epoch-даты в слотах"""
+
+    __slots__ = (
+        "user_id",
+        "lessons_completed",
+        "questions_answered",
+        "correct_answers",
+        "daily_streak",
+        "elo_rating",
+        "duels_won",
+        "duels_lost",
+        "duels_drawn",
+        "first_seen_ts",
+        "last_activity_ts",
+        "is_banned",
+        "ban_reason",
+        "banned_at_ts",
+    )
+
+    # Поля, которые сохраняются как есть
+    COUNTERS = __slots__[1:9]
+    # Необязательные поля блокировки
+    BAN_FIELDS = ("is_banned", "ban_reason", "banned_at")
+
+    def __init__(self, user_id: int = 0, elo_rating: int = 1000):
+        now = int(time.time())
+        self.user_id = user_id
+        self.lessons_completed = 0
+        self.questions_answered = 0
+        self.correct_answers = 0
+        self.daily_streak = 0
+        self.elo_rating = elo_rating
+        self.duels_won = 0
+        self.duels_lost = 0
+        self.duels_drawn = 0
+        self.first_seen_ts = now
+        self.last_activity_ts = now
+
+    # ==============================
+    # ДАТЫ
+    # ==============================
+
+    @property
+    def first_seen(self) -> Optional[datetime]:
+        return from_epoch(self.first_seen_ts)
+
+    @first_seen.setter
+    def first_seen(self, value):
+        self.first_seen_ts = to_epoch(value)
+
+    @property
+    def last_activity(self) -> Optional[datetime]:
+        return from_epoch(self.last_activity_ts)
+
+    @last_activity.setter
+    def last_activity(self, value):
+        self.last_activity_ts = to_epoch(value)
+
+    @property
+    def banned_at(self) -> Optional[datetime]:
+        # До блокировки слот пуст и чтение даёт AttributeError, как у UserActivity
+        return from_epoch(self.banned_at_ts)
+
+    @banned_at.setter
+    def banned_at(self, value):
+        self.banned_at_ts = to_epoch(value)
+
+    def touch(self, now: Optional[float] = None):
+        """Отметить активность пользователя"""
+        self.last_activity_ts = int(now if now is not None else time.time())
+
+    # ==============================
+    # ВЫЧИСЛЯЕМЫЕ ПОЛЯ
+    # ==============================
+
+    @property
+    def accuracy(self) -> float:
+        """Процент правильных ответов"""
+        if self.questions_answered == 0:
+            return 0.0
+        return self.correct_answers / self.questions_answered * 100
+
+    @property
+    def total_duels(self) -> int:
+        return self.duels_won + self.duels_lost + self.duels_drawn
+
+    # ==============================
+    # СЕРИАЛИЗАЦИЯ
+    # ==============================
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь в формате UserActivity.to_dict() (даты в ISO)"""
+        data = {name: getattr(self, name) for name in self.COUNTERS}
+        data["user_id"] = self.user_id
+        data["first_seen"] = to_iso(self.first_seen)
+        data["last_activity"] = to_iso(self.last_activity)
+        if hasattr(self, "is_banned"):
+            data["is_banned"] = self.is_banned
+        if hasattr(self, "ban_reason"):
+            data["ban_reason"] = self.ban_reason
+        if hasattr(self, "banned_at_ts"):
+            data["banned_at"] = to_iso(self.banned_at)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ActivityRecord":
+        """Запись из словаря UserActivity.to_dict() или ActivityRecord.to_dict()"""
+        record = cls(data.get("user_id", 0))
+        for name in cls.COUNTERS:
+            if name in data:
+                setattr(record, name, int(data[name]))
+        # Ключ со значением None — даты нет, отсутствующий ключ — текущее время
+        if "first_seen" in data:
+            record.first_seen_ts = to_epoch(data["first_seen"])
+        if "last_activity" in data:
+            record.last_activity_ts = to_epoch(data["last_activity"])
+        record.set_ban(data)
+        return record
+
+    def set_ban(self, data: Dict[str, Any]):
+        """Перенести поля блокировки, которые есть в data"""
+        if "is_banned" in data:
+            self.is_banned = bool(data["is_banned"])
+        if "ban_reason" in data:
+            self.ban_reason = data["ban_reason"]
+        if "banned_at" in data:
+            self.banned_at = data["banned_at"]
+
+    @classmethod
+    def from_row(cls, row) -> "ActivityRecord":
+        """Запись из строки значений в порядке __slots__ (двоичный снимок)"""
+        record = cls.__new__(cls)
+        (record.user_id, record.lessons_completed, record.questions_answered, record.correct_answers,
+         record.daily_streak, record.elo_rating, record.duels_won, record.duels_lost, record.duels_drawn,
+         record.first_seen_ts, record.last_activity_ts) = row
+        return record
+
+    @classmethod
+    def from_activity(cls, activity: Any, user_id: int = 0) -> "ActivityRecord":
+        """Преобразование обычного UserActivity в компактную запись"""
+        record = cls(getattr(activity, "user_id", user_id))
+        for name in cls.COUNTERS:
+            setattr(record, name, getattr(activity, name, getattr(record, name)))
+        if hasattr(activity, "first_seen"):
+            record.first_seen_ts = to_epoch(activity.first_seen)
+        if hasattr(activity, "last_activity"):
+            record.last_activity_ts = to_epoch(activity.last_activity)
+        record.set_ban({name: getattr(activity, name) for name in cls.BAN_FIELDS if hasattr(activity, name)})
+        return record
+
+    def __repr__(self):
+        return f"ActivityRecord(user_id={self.user_id}, elo={self.elo_rating}, lessons={self.lessons_completed})"
+
+
+# ==============================
+# ОТСЛЕЖИВАНИЕ ИЗМЕНЕНИЙ
+# ==============================
+
+def track_changes(callback: Callable[[ActivityRecord], None]):
+    """Сообщать о каждом присваивании атрибута записи: callback(record)
+
+    Включается после загрузки состояния, чтобы сборка записей при старте
+    не платила за вызов.
+    """
+    def tracked_setattr(record, name, value):
+        object.__setattr__(record, name, value)
+        callback(record)
+
+    ActivityRecord.__setattr__ = tracked_setattr
+
+
+def untrack_changes():
+    """Отключить отслеживание (тесты, скрипты)"""
+    if "__setattr__" in ActivityRecord.__dict__:
+        del ActivityRecord.__setattr__
+
+
+def compact_activities(activities: Dict[int, Any]) -> int:
+    """Замена UserActivity на ActivityRecord в словаре на месте; возвращает число замен"""
+    replaced = 0
+    for user_id, activity in activities.items():
+        if not isinstance(activity, ActivityRecord):
+            activity = activities[user_id] = ActivityRecord.from_activity(activity, user_id)
+            replaced += 1
+        # По user_id запись сообщает о своих изменениях (track_changes)
+        if activity.user_id != user_id:
+            activity.user_id = user_id
+    return replaced
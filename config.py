@@ -1,6 +1,7 @@
 # config.py - КОНФИГУРАЦИЯ ДЕМО-БОТА
 
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -26,6 +27,48 @@ class Config:
     WEBHOOK_PATH = "/webhook"
     WEBHOOK_URL = None  # Будет установлен автоматически
 
+    # Хранение данных
+    DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "shards")  # shards | sqlite
+    PERSIST_SHARDS = int(os.getenv("PERSIST_SHARDS", 64))  # Шардов на раздел
+    PERSIST_DELAY = float(os.getenv("PERSIST_DELAY", 2.0))  # Окно объединения сохранений, сек
+    JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "1") == "1"
+    JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", 8 * 1024 * 1024))
+    JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", 600))  # сек
+    BOT_DATA_FILE = Path(os.getenv("BOT_DATA_FILE")) if os.getenv("BOT_DATA_FILE") else None  # Файл, из которого bot.py грузит состояние
+    SNAPSHOT_PATH = DATA_DIR / "state.snap"
+    COMPACT_ACTIVITIES = os.getenv("COMPACT_ACTIVITIES", "1") == "1"  # Хранить активность в ActivityRecord (compact.py)
+    SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 3600))  # Мин. интервал перезаписи снимка, сек (0 — выкл.)
+    CHANGE_SCAN_INTERVAL = float(os.getenv("CHANGE_SCAN_INTERVAL", 60))  # Поиск изменений без mark_dirty, сек (0 — выкл.)
+    CHANGE_SCAN_BATCH = int(os.getenv("CHANGE_SCAN_BATCH", 2000))  # Записей между передачами управления
+    SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", 300))  # Проверка сроков подписок, сек
+    SUBSCRIPTION_REMIND_DAYS = float(os.getenv("SUBSCRIPTION_REMIND_DAYS", 3))  # Напоминание до окончания, дней (0 — выкл.)
+
+    # FSM-хранилище
+    FSM_DB_PATH = DATA_DIR / "fsm.sqlite3"
+    FSM_TTL = float(os.getenv("FSM_TTL", 24 * 3600))  # Срок жизни сессии по умолчанию, сек
+    FSM_STATE_TTLS = {
+        "DemoStates": 2 * 3600,  # Брошенный урок или квиз
+        "AdminStates": 3600,  # Незавершённый диалог админки
+    }
+    FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", 600))  # Период очистки, сек
+
+    # Индексы статистики
+    ACTIVITY_INDEX_DAYS = int(os.getenv("ACTIVITY_INDEX_DAYS", 400))  # Хранить дневную активность, дней
+    STATS_SNAPSHOT_TTL = int(os.getenv("STATS_SNAPSHOT_TTL", 60))  # Пересчёт снимка статистики, секунд
+
+    # Экспорт
+    EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", 8 * 1024 * 1024))  # Байт в памяти до сброса на диск
+    EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 1000))  # Строк между передачами управления
+    EXPORT_FILE_ROWS = int(os.getenv("EXPORT_FILE_ROWS", 100000))  # Записей NDJSON в одном файле
+    EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 2))  # Одновременно выполняемых заданий экспорта
+    EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", 10))  # Заданий в очереди, сверх — отказ
+    EXPORT_PROGRESS_INTERVAL = float(os.getenv("EXPORT_PROGRESS_INTERVAL", 3.0))  # Секунд между обновлениями прогресса
+    EXPORT_KEEP_JOBS = int(os.getenv("EXPORT_KEEP_JOBS", 20))  # Завершённых заданий в списке
+    EXPORT_PART_SIZE = int(os.getenv("EXPORT_PART_SIZE", 45 * 1024 * 1024))  # Байт в части (лимит загрузки Bot API — 50 МБ)
+    EXPORT_COMPRESS_SIZE = int(os.getenv("EXPORT_COMPRESS_SIZE", 5 * 1024 * 1024))  # Сжимать gzip файлы крупнее, байт (0 — не сжимать)
+    CHANGE_LOG_SAVE_DELAY = float(os.getenv("CHANGE_LOG_SAVE_DELAY", 10.0))  # Задержка записи журнала изменений, секунд
+
     def __init__(self):
         # Валидация
         if not self.BOT_TOKEN:
@@ -0,0 +1,152 @@
+# counters.py - СЧЁТЧИКИ ГЛАВНОЙ АДМИН-ПАНЕЛИ
+#
+# admin_panel показывает несколько чисел, и ради них не нужен ни снимок
+# статистики, ни обход пользователей. Счётчики один раз строятся из
+# состояния, а затем обновляются событиями persistence (add_listener):
+# изменение активности и статуса дуэли. Premium берётся из индекса
+# подписок (subscription_index.py), доход и число транзакций — из журнала
+# транзакций (ledger.py): оба тоже поддерживаются событиями.
+#
+# Активные считаются по дню последней активности: у каждого дня окна
+# (WINDOW дней, включая сегодня) — множество пользователей, так что
+# «сегодня» и «за неделю» — длины множеств. При смене дня (rollover)
+# дни, вышедшие из окна, отбрасываются вместе с их пользователями;
+# проверка выполняется при каждом событии и чтении.
+
+import logging
+import time
+from collections import Counter
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+from compact import ActivityRecord
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 7  # Дней в окне «активных за неделю»
+
+
+def _activity_day(activity: Any) -> Optional[int]:
+    """Порядковый номер дня последней активности (None — даты нет)"""
+    if isinstance(activity, ActivityRecord):
+        ts = activity.last_activity_ts
+        return date.fromtimestamp(ts).toordinal() if ts else None
+    last = activity.last_activity
+    return last.date().toordinal() if last else None
+
+
+class DashboardCounters:
+    """Поддерживаемые событиями счётчики для admin_panel"""
+
+    def __init__(self, in_progress: Any, clock: Callable[[], date] = date.today):
+        self.in_progress = in_progress
+        self.clock = clock
+        self._today = clock().toordinal()
+        # Активность: день последней активности пользователя (только дни окна)
+        self._user_day: Dict[Hashable, int] = {}
+        self._day_users: Dict[int, Set[Hashable]] = {}
+        # Дуэли: статус по дуэли и число дуэлей в статусе
+        self._duel_status: Dict[Hashable, Any] = {}
+        self._statuses: Counter = Counter()
+
+    # ==============================
+    # СМЕНА ДНЯ
+    # ==============================
+
+    def _roll(self):
+        """Отбросить дни, вышедшие из окна"""
+        today = self.clock().toordinal()
+        if today == self._today:
+            return
+        self._today = today
+        oldest = today - WINDOW + 1
+        for day in [day for day in self._day_users if day < oldest]:
+            for user_id in self._day_users.pop(day):
+                del self._user_day[user_id]
+
+    # ==============================
+    # СОБЫТИЯ
+    # ==============================
+
+    def on_activity(self, user_id: Hashable, activity: Any):
+        """Активность пользователя изменена (None — удалена)"""
+        self._roll()
+        old_day = self._user_day.pop(user_id, None)
+        if old_day is not None:
+            users = self._day_users[old_day]
+            users.discard(user_id)
+            if not users:
+                del self._day_users[old_day]
+
+        day = _activity_day(activity) if activity is not None else None
+        if day is not None and self._today - WINDOW < day <= self._today:
+            self._user_day[user_id] = day
+            self._day_users.setdefault(day, set()).add(user_id)
+
+    def on_duel(self, duel_id: Hashable, duel: Any):
+        """Статус дуэли изменён (None — дуэль удалена)"""
+        old = self._duel_status.pop(duel_id, None)
+        if old is not None:
+            self._statuses[old] -= 1
+
+        if duel is not None:
+            self._duel_status[duel_id] = duel.status
+            self._statuses[duel.status] += 1
+
+    def rebuild(self, activities: Dict[Hashable, Any], duels: Dict[Hashable, Any]):
+        """Полный пересчёт из состояния бота"""
+        self._today = self.clock().toordinal()
+        self._user_day = {}
+        self._day_users = {}
+        self._duel_status = {}
+        self._statuses = Counter()
+        for user_id, activity in activities.items():
+            self.on_activity(user_id, activity)
+        for duel_id, duel in duels.items():
+            self.on_duel(duel_id, duel)
+
+    # ==============================
+    # ЧТЕНИЕ
+    # ==============================
+
+    def active_since(self, days: int) -> int:
+        """Пользователи, активные за последние days дней (не больше WINDOW), включая сегодня"""
+        self._roll()
+        return sum(len(self._day_users.get(day, ())) for day in range(self._today - days + 1, self._today + 1))
+
+    @property
+    def active_today(self) -> int:
+        return self.active_since(1)
+
+    @property
+    def active_week(self) -> int:
+        return self.active_since(WINDOW)
+
+    @property
+    def active_duels(self) -> int:
+        return self._statuses.get(self.in_progress, 0)
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_counters: Optional[DashboardCounters] = None
+
+
+def get_dashboard_counters() -> DashboardCounters:
+    """Счётчики админ-панели, подписанные на изменения состояния бота"""
+    global _counters
+    if _counters is None:
+        from bot import DuelStatus, user_activities, active_duels
+        from persistence import get_persistence
+
+        started = time.perf_counter()
+        _counters = DashboardCounters(DuelStatus.IN_PROGRESS)
+        _counters.rebuild(user_activities, active_duels)
+
+        persistence = get_persistence()
+        persistence.add_listener("user_activities", _counters.on_activity)
+        persistence.add_listener("active_duels", _counters.on_duel)
+        logger.info(f"📟 Счётчики админ-панели построены за {(time.perf_counter() - started) * 1000:.0f} мс")
+    return _counters
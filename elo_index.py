@@ -0,0 +1,129 @@
+# elo_index.py - ИНДЕКС ELO-РЕЙТИНГА ДУЭЛЕЙ
+#
+# Отсортированный список (ELO, user_id) и гистограмма по корзинам шириной
+# BUCKET обновляются при изменении активности (итог дуэли меняет
+# elo_rating). За логарифмическое время индекс отвечает на запросы:
+#   • топ-N по ELO,
+#   • перцентиль игрока и ELO на заданном перцентиле,
+#   • игроки в пределах ±X ELO (подбор соперника).
+#
+# Итоги дуэлей bot.py записывает без mark_dirty: о них сообщают сами записи
+# ActivityRecord (compact.track_changes) или фоновый поиск изменений
+# (change_scan.py), а снимок статистики перед чтением вызывает sync_changes(),
+# так что топ по ELO берётся из индекса, а не из SQLite.
+
+import logging
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+logger = logging.getLogger(__name__)
+
+BUCKET = 50  # Ширина корзины гистограммы, ELO
+
+
+class EloIndex:
+    """Сортированный индекс ELO с гистограммой"""
+
+    def __init__(self):
+        self._order = SortedList()
+        self._elo: Dict[Hashable, int] = {}
+        self._buckets: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self._elo)
+
+    def update(self, user_id: Hashable, elo: Optional[int]):
+        """Новый ELO игрока (None — игрок удалён)"""
+        old = self._elo.pop(user_id, None)
+        if old is not None:
+            self._order.remove((old, user_id))
+            bucket = old // BUCKET
+            self._buckets[bucket] -= 1
+            if not self._buckets[bucket]:
+                del self._buckets[bucket]
+        if elo is not None:
+            self._elo[user_id] = elo
+            self._order.add((elo, user_id))
+            self._buckets[elo // BUCKET] += 1
+
+    def on_activity(self, user_id: Hashable, activity: Any):
+        """Обработчик изменений user_activities"""
+        elo = activity.elo_rating if activity is not None else None
+        if elo != self._elo.get(user_id):
+            self.update(user_id, elo)
+
+    def rebuild(self, activities: Dict[Hashable, Any]):
+        """Полная сборка из user_activities"""
+        self._elo = {user_id: activity.elo_rating for user_id, activity in activities.items()}
+        self._order = SortedList((elo, user_id) for user_id, elo in self._elo.items())
+        self._buckets = Counter(elo // BUCKET for elo in self._elo.values())
+
+    # ==============================
+    # ЗАПРОСЫ
+    # ==============================
+
+    def top(self, limit: int) -> List[Tuple[Hashable, int]]:
+        """Лучшие по ELO: [(user_id, elo)]"""
+        return [(user_id, elo) for elo, user_id in self._order.islice(-limit, reverse=True)] if limit else []
+
+    def percentile(self, elo: int) -> float:
+        """Доля игроков с ELO ниже заданного, %"""
+        if not self._elo:
+            return 0.0
+        return self._order.bisect_left((elo, float("-inf"))) / len(self._elo) * 100
+
+    def percentile_of(self, user_id: Hashable) -> Optional[float]:
+        elo = self._elo.get(user_id)
+        return self.percentile(elo) if elo is not None else None
+
+    def elo_at(self, percentile: float) -> Optional[int]:
+        """ELO на заданном перцентиле (50 — медиана)"""
+        if not self._order:
+            return None
+        position = min(len(self._order) - 1, int(len(self._order) * percentile / 100))
+        return self._order[position][0]
+
+    def within(self, elo: int, delta: int, limit: Optional[int] = None,
+               exclude: Iterable[Hashable] = ()) -> List[Tuple[Hashable, int]]:
+        """Игроки с ELO в [elo - delta, elo + delta], ближайшие первыми"""
+        excluded = set(exclude)
+        players = [
+            (user_id, rating)
+            for rating, user_id in self._order.irange((elo - delta, float("-inf")), (elo + delta, float("inf")))
+            if user_id not in excluded
+        ]
+        players.sort(key=lambda player: abs(player[1] - elo))
+        return players[:limit] if limit else players
+
+    def opponents_for(self, user_id: Hashable, delta: int, limit: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """Соперники для игрока в пределах ±delta ELO"""
+        elo = self._elo.get(user_id)
+        if elo is None:
+            return []
+        return self.within(elo, delta, limit, exclude=(user_id,))
+
+    def histogram(self) -> List[Tuple[int, int]]:
+        """Распределение ELO: [(нижняя граница корзины, игроков)]"""
+        return [(bucket * BUCKET, count) for bucket, count in sorted(self._buckets.items())]
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_index: Optional[EloIndex] = None
+
+
+def get_elo_index() -> EloIndex:
+    """Индекс ELO, подписанный на изменения user_activities"""
+    global _index
+    if _index is None:
+        from bot import user_activities
+        from persistence import get_persistence
+
+        _index = EloIndex()
+        _index.rebuild(user_activities)
+        get_persistence().add_listener("user_activities", _index.on_activity)
+    return _index
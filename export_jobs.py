@@ -0,0 +1,438 @@
+# export_jobs.py - ОЧЕРЕДЬ ФОНОВЫХ ЗАДАНИЙ ЭКСПОРТА
+#
+# Обработчик экспорта не строит файл сам, а ставит задание в очередь
+# (submit) и сразу отвечает. Задания выполняют несколько воркеров:
+#   • файл строится в потоке ограниченного пула (EXPORT_WORKERS), поэтому
+#     большой экспорт не занимает цикл событий,
+#   • сообщение о задании редактируется с прогрессом не чаще раза
+#     в EXPORT_PROGRESS_INTERVAL секунд,
+#   • готовый файл отправляется админу, а file_id от Telegram сохраняется:
+#     завершённые задания можно просмотреть и скачать повторно без
+#     пересборки файла (список переживает перезапуск),
+#   • экспорт больше EXPORT_PART_SIZE приходит нумерованными частями
+#     (exports.py), сжатие включается само после EXPORT_COMPRESS_SIZE,
+#   • если частей несколько или построитель заполнил job.manifest, вслед
+#     за файлами отправляется манифест JSON с числом строк, размером
+#     и SHA-256 каждой части.
+#
+# Построитель задания — функция build(export, job), которая пишет данные
+# в SpooledExport и сообщает прогресс через job.progress(). Он выполняется
+# в потоке и не трогает словари bot.py напрямую: данные он получает частями
+# через job.call_in_loop() — функция выполняется в цикле событий, а поток
+# ждёт её результата. Часть — простые строки и словари только с нужными
+# полями, поэтому память построителя не растёт с числом пользователей.
+#
+# Место в очереди занимается сразу (put_nowait), до отправки сообщения
+# о задании, так что проверка заполненности и постановка не разделены
+# ожиданием. Воркер берёт задание только после отправки сообщения; если
+# отправить его не удалось, submit() возвращает задание с ошибкой,
+# и воркер его пропускает.
+
+import asyncio
+import html
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+
+from exports import SPOOL_SIZE, SpooledExport
+from persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATUS_ICONS = {QUEUED: "🕐", RUNNING: "⏳", DONE: "✅", FAILED: "❌"}
+
+
+def format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} МБ"
+    return f"{size / 1024:.1f} КБ"
+
+
+class ExportJob:
+    """Задание экспорта и его состояние"""
+
+    def __init__(self, job_id: int, title: str, filename: str, chat_id: int,
+                 build: Optional[Callable[[SpooledExport, "ExportJob"], None]] = None,
+                 compress: bool = False, bot: Any = None, retry: Optional[str] = None):
+        self.id = job_id
+        self.title = title
+        self.filename = filename
+        self.chat_id = chat_id
+        self.build = build
+        self.compress = compress
+        self.bot = bot
+        # callback_data для повтора задания после ошибки
+        self.retry = retry
+        # Сообщение о задании отправлено (или не отправлено) — можно выполнять
+        self.posted: Optional[asyncio.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.status = QUEUED
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.message_id: Optional[int] = None
+
+        # Прогресс: обработано и всего (None — неизвестно)
+        self.done = 0
+        self.total: Optional[int] = None
+
+        self.rows = 0
+        self.size = 0
+        self.parts = 1
+        # file_id отправленных документов: файл и, если есть, манифест
+        self.file_ids: List[str] = []
+        self.sent_name: Optional[str] = None
+        self.error: Optional[str] = None
+
+        # Дополнения построителя: строки подписи и кнопки под файлом
+        self.notes: List[str] = []
+        self.buttons: List[Tuple[str, str]] = []
+        self.manifest: Optional[dict] = None
+
+    # ==============================
+    # ВЫЗЫВАЕТСЯ ИЗ ПОСТРОИТЕЛЯ
+    # ==============================
+
+    def progress(self, done: int, total: Optional[int] = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def note(self, line: str):
+        self.notes.append(line)
+
+    def add_button(self, text: str, callback_data: str):
+        self.buttons.append((text, callback_data))
+
+    def call_in_loop(self, func: Callable[..., Any], *args) -> Any:
+        """Выполнить func(*args) в цикле событий и дождаться результата"""
+        async def call():
+            return func(*args)
+
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    # ==============================
+    # ОТОБРАЖЕНИЕ
+    # ==============================
+
+    def status_text(self) -> str:
+        text = f"{STATUS_ICONS[self.status]} <b>Экспорт #{self.id}:</b> {self.title}\n"
+        if self.status == QUEUED:
+            text += "В очереди..."
+        elif self.status == RUNNING:
+            if self.total:
+                text += f"Готово {self.done * 100 // self.total}% ({self.done} из {self.total})"
+            else:
+                text += f"Обработано: {self.done}"
+        elif self.status == DONE:
+            text += f"Готово: {self.rows} строк, {format_size(self.size)}"
+        else:
+            text += f"Ошибка: {html.escape(str(self.error))}"
+        return text
+
+    def caption(self) -> str:
+        lines = [
+            f"📦 {self.title} (#{self.id})",
+            f"📅 {(self.finished_at or datetime.now()).strftime('%d.%m.%Y %H:%M')}",
+            f"📄 Строк: {self.rows} | 💾 {format_size(self.size)}",
+        ]
+        if self.parts > 1:
+            lines.append(f"🧩 Частей: {self.parts}")
+        return "\n".join(lines + self.notes)
+
+    def reply_markup(self) -> Optional[InlineKeyboardMarkup]:
+        if not self.buttons:
+            return None
+        return InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=data)] for text, data in self.buttons]
+        )
+
+    def status_markup(self) -> Optional[InlineKeyboardMarkup]:
+        if self.status != FAILED or not self.retry:
+            return None
+        return InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text="🔁 Повторить", callback_data=self.retry)]]
+        )
+
+    # ==============================
+    # СОХРАНЕНИЕ
+    # ==============================
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "filename": self.sent_name or self.filename,
+            "chat_id": self.chat_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "rows": self.rows,
+            "size": self.size,
+            "parts": self.parts,
+            "file_ids": self.file_ids,
+            "error": self.error,
+            "notes": self.notes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExportJob":
+        job = cls(data["id"], data["title"], data["filename"], data["chat_id"])
+        job.sent_name = data["filename"]
+        job.status = data["status"]
+        job.created_at = datetime.fromisoformat(data["created_at"])
+        job.finished_at = datetime.fromisoformat(data["finished_at"]) if data.get("finished_at") else None
+        job.rows = data.get("rows", 0)
+        job.size = data.get("size", 0)
+        job.parts = data.get("parts", 1)
+        job.file_ids = data.get("file_ids", [])
+        job.error = data.get("error")
+        job.notes = data.get("notes", [])
+        return job
+
+
+class ExportQueue:
+    """Ограниченная очередь заданий экспорта с пулом воркеров"""
+
+    def __init__(self, workers: int = 2, queue_size: int = 10, progress_interval: float = 3.0,
+                 keep: int = 20, path: Optional[Path] = None, spool_size: int = SPOOL_SIZE,
+                 part_size: Optional[int] = None, compress_size: Optional[int] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.progress_interval = progress_interval
+        self.keep = keep
+        self.path = Path(path) if path else None
+        self.spool_size = spool_size
+        self.part_size = part_size
+        self.compress_size = compress_size
+
+        self.jobs: "OrderedDict[int, ExportJob]" = OrderedDict()
+        self._next_id = 1
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+
+    # ==============================
+    # ПОСТАНОВКА В ОЧЕРЕДЬ
+    # ==============================
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, bot: Any, chat_id: int, title: str, filename: str,
+                     build: Callable[[SpooledExport, ExportJob], None], compress: bool = False,
+                     retry: Optional[str] = None) -> Optional[ExportJob]:
+        """Поставить задание в очередь; None, если очередь заполнена.
+
+        Если сообщение о задании отправить не удалось, возвращается
+        задание со статусом FAILED.
+        """
+        self._start()
+        job = ExportJob(self._next_id, title, filename, chat_id, build, compress, bot, retry)
+        job.posted = asyncio.Event()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return None
+        self._next_id += 1
+        self.jobs[job.id] = job
+
+        try:
+            message = await bot.send_message(chat_id, job.status_text(), parse_mode="HTML")
+            job.message_id = message.message_id
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            job.finished_at = datetime.now()
+            job.build = job.bot = None
+            logger.error(f"❌ Экспорт #{job.id} ({job.title}) не поставлен в очередь: {e}")
+            self._trim()
+            self.save()
+        finally:
+            job.posted.set()
+        return job
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status in (QUEUED, RUNNING))
+
+    # ==============================
+    # ВЫПОЛНЕНИЕ
+    # ==============================
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await job.posted.wait()
+                if job.status == QUEUED:
+                    await self._run(job)
+            except Exception as e:
+                logger.error(f"❌ Ошибка задания экспорта #{job.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _build(self, job: ExportJob, export: SpooledExport):
+        """Выполняется в потоке пула"""
+        job.build(export, job)
+        export.finish()
+        if job.manifest is not None or len(export.parts) > 1:
+            job.manifest = {**export.manifest(), **(job.manifest or {})}
+
+    async def _run(self, job: ExportJob):
+        job.status = RUNNING
+        job.loop = asyncio.get_running_loop()
+        await self._edit(job)
+        reporter = asyncio.create_task(self._report(job))
+        export = SpooledExport(job.filename, job.compress, self.spool_size, self.part_size, self.compress_size)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._build, job, export)
+            job.rows, job.size, job.parts = export.rows, export.size, len(export.parts)
+            job.finished_at = datetime.now()
+
+            job.file_ids = []
+            for number, part in enumerate(export.parts, 1):
+                caption = job.caption()
+                if job.parts > 1:
+                    caption += f"\n🧩 Часть {number} из {job.parts}: {part.filename}"
+                message = await job.bot.send_document(
+                    job.chat_id,
+                    document=part.input_file(),
+                    caption=caption,
+                    reply_markup=job.reply_markup() if number == job.parts else None
+                )
+                job.file_ids.append(message.document.file_id)
+            job.sent_name = export.filename
+
+            if job.manifest is not None:
+                message = await job.bot.send_document(
+                    job.chat_id,
+                    document=BufferedInputFile(
+                        json.dumps(job.manifest, ensure_ascii=False, indent=2, default=str).encode("utf-8"),
+                        filename=f"{job.filename}.manifest.json"
+                    )
+                )
+                job.file_ids.append(message.document.file_id)
+            job.status = DONE
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            job.finished_at = datetime.now()
+            logger.error(f"❌ Экспорт #{job.id} ({job.title}) не выполнен: {e}")
+        finally:
+            export.close()
+            reporter.cancel()
+            job.build = job.loop = None
+            job.bot, bot = None, job.bot
+
+        await self._edit(job, bot)
+        self._trim()
+        self.save()
+
+    async def _report(self, job: ExportJob):
+        """Редкие обновления сообщения с прогрессом"""
+        shown = job.done
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if job.done != shown:
+                shown = job.done
+                await self._edit(job)
+
+    async def _edit(self, job: ExportJob, bot: Any = None):
+        bot = bot or job.bot
+        if bot is None or job.message_id is None:
+            return
+        try:
+            await bot.edit_message_text(
+                job.status_text(), chat_id=job.chat_id, message_id=job.message_id,
+                reply_markup=job.status_markup(), parse_mode="HTML"
+            )
+        except Exception as e:
+            # Сообщение не изменилось или удалено — прогресс не критичен
+            logger.debug(f"Статус экспорта #{job.id} не обновлён: {e}")
+
+    # ==============================
+    # ЗАВЕРШЁННЫЕ ЗАДАНИЯ
+    # ==============================
+
+    def finished(self, limit: Optional[int] = None) -> List[ExportJob]:
+        """Завершённые задания, новые первыми"""
+        jobs = [job for job in reversed(self.jobs.values()) if job.status in (DONE, FAILED)]
+        return jobs[:limit] if limit else jobs
+
+    def get(self, job_id: int) -> Optional[ExportJob]:
+        return self.jobs.get(job_id)
+
+    async def resend(self, bot: Any, chat_id: int, job_id: int) -> bool:
+        """Повторная отправка готовых файлов по file_id"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status != DONE or not job.file_ids:
+            return False
+        for number, file_id in enumerate(job.file_ids):
+            await bot.send_document(chat_id, document=file_id, caption=job.caption() if number == 0 else None)
+        return True
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[job_id]
+
+    def load(self) -> bool:
+        if self.path is None or not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data.get("jobs", []):
+            job = ExportJob.from_dict(item)
+            self.jobs[job.id] = job
+        self._next_id = max(data.get("next_id", 1), max(self.jobs, default=0) + 1)
+        return True
+
+    def save(self):
+        if self.path is None:
+            return
+        jobs = [job.to_dict() for job in self.jobs.values() if job.status in (DONE, FAILED)]
+        try:
+            write_json_atomic(self.path, {"next_id": self._next_id, "jobs": jobs})
+        except OSError as e:
+            logger.error(f"❌ Ошибка сохранения списка экспортов: {e}")
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_queue: Optional[ExportQueue] = None
+
+
+def get_export_queue() -> ExportQueue:
+    """Очередь экспорта с настройками из конфигурации"""
+    global _queue
+    if _queue is None:
+        from config import config
+
+        _queue = ExportQueue(
+            workers=config.EXPORT_WORKERS,
+            queue_size=config.EXPORT_QUEUE_SIZE,
+            progress_interval=config.EXPORT_PROGRESS_INTERVAL,
+            keep=config.EXPORT_KEEP_JOBS,
+            path=config.DATA_DIR / "export_jobs.json",
+            spool_size=config.EXPORT_SPOOL_SIZE,
+            part_size=config.EXPORT_PART_SIZE,
+            compress_size=config.EXPORT_COMPRESS_SIZE
+        )
+        _queue.load()
+    return _queue
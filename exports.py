@@ -0,0 +1,309 @@
+# exports.py - ПОТОКОВЫЙ ЭКСПОРТ ДАННЫХ
+#
+# Строки экспорта берутся из генератора и сразу пишутся в
+# SpooledTemporaryFile: небольшой файл остаётся в памяти, большой уходит
+# на диск, поэтому пиковое потребление памяти не зависит от числа строк.
+# По желанию поток сжимается gzip на лету. Запись выполняется в потоке
+# пула заданий экспорта (export_jobs.py) и каждые chunk_rows строк
+# сообщает прогресс, а готовый файл отправляется в Telegram кусками
+# (SpooledInputFile).
+#
+# Большие экспорты не упираются в лимит загрузки Bot API:
+#   • несжатая часть, выросшая до compress_size байт, переводится на gzip
+#     (уже записанное сжимается, дальше запись идёт через gzip),
+#   • часть, достигшая part_size байт, закрывается на границе строки, и
+#     запись продолжается в следующую нумерованную часть. Части CSV и NDJSON
+#     самостоятельны (у каждой части CSV свой заголовок), части документа
+#     JSON склеиваются по порядку.
+# Манифест экспорта (manifest()) перечисляет части с числом строк, размером
+# и SHA-256. Объект JSON из пар ключ-значение (write_json_items) пишется
+# по записи, не собираясь в памяти.
+#
+# NDJSON-экспорт пишет по записи на строку пачками и запоминает курсор —
+# ключ последней записанной записи. Записи идут по возрастанию ключа,
+# поэтому прерванный или ограниченный по размеру экспорт продолжается
+# с курсора следующим файлом.
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram.types import InputFile
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SIZE = 8 * 1024 * 1024  # Байт в памяти до сброса на диск
+CHUNK_ROWS = 1000  # Строк между отчётами о прогрессе
+JSON_CHUNKS = 10000  # Фрагментов JSON между проверками размера части
+
+# Склейка частей: самостоятельные файлы или один документ по кускам
+INDEPENDENT = "independent"
+CONCAT = "concat"
+
+Progress = Optional[Callable[[int], None]]
+
+
+class ExportPart:
+    """Одна часть экспорта в SpooledTemporaryFile"""
+
+    def __init__(self, filename: str, compress: bool = False, spool_size: int = SPOOL_SIZE):
+        self.filename = filename
+        self.spool_size = spool_size
+        self.compressed = False
+        self.rows = 0
+        self.size = 0
+        self.sha256: Optional[str] = None
+
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._gzip: Optional[gzip.GzipFile] = None
+        self.text = io.TextIOWrapper(self._spool, encoding="utf-8", newline="", write_through=True)
+        if compress:
+            self.compress()
+
+    @property
+    def written(self) -> int:
+        """Байт в файле части (для gzip — уже сжатых)"""
+        return self._spool.tell()
+
+    def compress(self):
+        """Перевести часть на gzip, сжав уже записанное"""
+        if self.compressed:
+            return
+        self.text.flush()
+        raw = self.text.detach()
+        raw.seek(0)
+
+        self._spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self._gzip = gzip.GzipFile(filename=self.filename, fileobj=self._spool, mode="wb")
+        shutil.copyfileobj(raw, self._gzip)
+        raw.close()
+
+        self.text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="", write_through=True)
+        self.compressed = True
+        self.filename += ".gz"
+
+    def finish(self):
+        """Дописать сжатый поток, посчитать размер и SHA-256"""
+        self.text.flush()
+        self.text.detach()
+        if self._gzip is not None:
+            self._gzip.close()
+        self.size = self._spool.tell()
+
+        digest = hashlib.sha256()
+        self._spool.seek(0)
+        while chunk := self._spool.read(1024 * 1024):
+            digest.update(chunk)
+        self.sha256 = digest.hexdigest()
+        self._spool.seek(0)
+
+    def rewind(self):
+        self._spool.seek(0)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._spool.read(size)
+
+    def input_file(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "SpooledInputFile":
+        return SpooledInputFile(self, chunk_size=chunk_size)
+
+    def close(self):
+        self._spool.close()
+
+
+class SpooledExport:
+    """Файл экспорта из одной или нескольких частей с необязательным gzip"""
+
+    def __init__(self, filename: str, compress: bool = False, spool_size: int = SPOOL_SIZE,
+                 part_size: Optional[int] = None, compress_size: Optional[int] = None):
+        self.filename = filename
+        self.compress = compress
+        self.spool_size = spool_size
+        self.part_size = part_size
+        self.compress_size = compress_size
+        self.join = INDEPENDENT
+
+        self.rows = 0
+        self.size = 0
+        # Ключ последней записанной записи и признак, что источник исчерпан
+        self.cursor: Optional[Any] = None
+        self.complete = False
+
+        self.parts: List[ExportPart] = []
+        self._new_part()
+
+    def __enter__(self) -> "SpooledExport":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _new_part(self):
+        self.parts.append(ExportPart(self.filename, self.compress, self.spool_size))
+
+    @property
+    def part(self) -> ExportPart:
+        return self.parts[-1]
+
+    @property
+    def text(self) -> io.TextIOWrapper:
+        return self.part.text
+
+    def write(self, data: str):
+        self.part.text.write(data)
+
+    def add_rows(self, count: int):
+        self.part.rows += count
+        self.rows += count
+
+    def split(self) -> bool:
+        """Проверить размер части перед следующей строкой; True — начата новая часть"""
+        part = self.part
+        if self.compress_size and not part.compressed and part.written >= self.compress_size:
+            part.compress()
+        if not self.part_size or part.written < self.part_size:
+            return False
+
+        part.finish()
+        # Раз экспорт дорос до нескольких частей, следующие сразу сжимаем
+        self.compress = self.compress or part.compressed
+        self._new_part()
+        return True
+
+    def finish(self) -> "SpooledExport":
+        """Закрыть последнюю часть и пронумеровать части"""
+        self.part.finish()
+        if len(self.parts) > 1:
+            name, ext = os.path.splitext(self.filename)
+            for number, part in enumerate(self.parts, 1):
+                part.filename = f"{name}_part{number:02d}{ext}" + (".gz" if part.compressed else "")
+        else:
+            self.filename = self.part.filename
+        self.size = sum(part.size for part in self.parts)
+        return self
+
+    def manifest(self) -> dict:
+        """Описание экспорта: части, строки, размеры и контрольные суммы"""
+        parts = []
+        for part in self.parts:
+            item = {"file": part.filename, "size": part.size, "sha256": part.sha256}
+            if self.join == INDEPENDENT:
+                item["rows"] = part.rows
+            parts.append(item)
+        return {
+            "file": self.filename,
+            "rows": self.rows,
+            "size": self.size,
+            "compression": "gzip" if any(part.compressed for part in self.parts) else None,
+            "join": self.join,
+            "parts": parts,
+        }
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+
+
+class SpooledInputFile(InputFile):
+    """Загрузка готовой части экспорта в Telegram кусками"""
+
+    def __init__(self, part: ExportPart, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=part.filename, chunk_size=chunk_size)
+        self.part = part
+
+    async def read(self, bot: "Bot") -> AsyncGenerator[bytes, None]:
+        self.part.rewind()
+        while chunk := self.part.read(self.chunk_size):
+            yield chunk
+
+
+def write_csv(export: SpooledExport, header: Sequence[Any], rows: Iterable[Sequence[Any]],
+              chunk_rows: int = CHUNK_ROWS, progress: Progress = None) -> int:
+    """Записать заголовок и строки из генератора; число записанных строк"""
+    writer = csv.writer(export)
+    writer.writerow(header)
+    written = 0
+    for row in rows:
+        if written == chunk_rows:
+            export.add_rows(written)
+            written = 0
+            if progress:
+                progress(export.rows)
+            if export.split():
+                writer.writerow(header)
+        writer.writerow(row)
+        written += 1
+    export.add_rows(written)
+    export.complete = True
+    return export.rows
+
+
+def write_ndjson(export: SpooledExport, records: Iterable[Tuple[Any, dict]], batch_size: int = CHUNK_ROWS,
+                 limit: Optional[int] = None, progress: Progress = None) -> int:
+    """Записать (ключ, запись) по одной JSON-строке, не больше limit строк"""
+    def flush(batch, key):
+        export.split()
+        export.write("\n".join(batch) + "\n")
+        export.add_rows(len(batch))
+        export.cursor = key
+
+    batch = []
+    last_key = None
+    for key, record in records:
+        if limit is not None and export.rows + len(batch) >= limit:
+            break
+        batch.append(json.dumps(record, ensure_ascii=False, default=str))
+        last_key = key
+        if len(batch) >= batch_size:
+            flush(batch, last_key)
+            batch = []
+            if progress:
+                progress(export.rows)
+    else:
+        export.complete = True
+
+    if batch:
+        flush(batch, last_key)
+    return export.rows
+
+
+def write_json(export: SpooledExport, data: Any):
+    """Записать документ JSON; при делении на части куски склеиваются по порядку"""
+    export.join = CONCAT
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=2, default=str)
+    for count, chunk in enumerate(encoder.iterencode(data), 1):
+        if count % JSON_CHUNKS == 0:
+            export.split()
+        export.write(chunk)
+    export.add_rows(len(data) if isinstance(data, (dict, list)) else 1)
+    export.complete = True
+
+
+def write_json_items(export: SpooledExport, items: Iterable[Tuple[Any, Any]],
+                     chunk_rows: int = CHUNK_ROWS, progress: Progress = None) -> int:
+    """Записать объект JSON из пар (ключ, значение) по одной, не собирая его в памяти"""
+    export.join = CONCAT
+    export.write("{")
+    count = 0
+    for count, (key, value) in enumerate(items, 1):
+        if count % chunk_rows == 0:
+            export.add_rows(chunk_rows)
+            if progress:
+                progress(export.rows)
+            export.split()
+        body = json.dumps(value, ensure_ascii=False, indent=2, default=str).replace("\n", "\n  ")
+        export.write(f"{',' if count > 1 else ''}\n  {json.dumps(str(key), ensure_ascii=False)}: {body}")
+    export.write("\n}" if count else "}")
+    export.add_rows(count % chunk_rows)
+    export.complete = True
+    return export.rows
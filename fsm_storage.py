@@ -0,0 +1,213 @@
+# fsm_storage.py - ХРАНИЛИЩЕ FSM НА SQLITE С TTL
+#
+# Замена MemoryStorage: состояние и данные FSM каждого пользователя
+# хранятся строкой SQLite, поэтому прогресс урока и квиза переживает
+# перезапуск и редеплой, а память не растёт с числом пользователей.
+#
+# У каждой записи есть срок жизни (expires_at), он продлевается при
+# каждом изменении. Брошенные сессии (пользователь открыл тему и ушёл)
+# перестают читаться по истечении срока и удаляются фоновой очисткой.
+# Срок задаётся по группе состояний: например, DemoStates живут 2 часа.
+#
+# Подключение в bot.py (диспетчер, который обслуживает admin_router):
+#     from fsm_storage import get_fsm_storage
+#     dp = Dispatcher(storage=get_fsm_storage())
+# Если диспетчер создан без storage, хранилище подключает при запуске
+# admin_router (setup_fsm_storage).
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    bot_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    thread_id INTEGER NOT NULL,
+    destiny TEXT NOT NULL,
+    state TEXT,
+    data TEXT,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm (expires_at);
+"""
+
+KEY_WHERE = "bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?"
+
+
+def _key(key: StorageKey) -> Tuple[int, int, int, int, str]:
+    # NULL в первичном ключе SQLite не совпадает сам с собой, поэтому без темы — 0
+    return key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище на SQLite со сроком жизни записей"""
+
+    def __init__(self, path: Path, ttl: float = 24 * 3600,
+                 state_ttls: Optional[Dict[str, float]] = None,
+                 sweep_interval: float = 600.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.state_ttls = state_ttls or {}
+        self.sweep_interval = sweep_interval
+
+        # Все операции с базой идут в одном рабочем потоке по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm")
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._sweeper: Optional[asyncio.Task] = None
+
+    # ==============================
+    # СРОК ЖИЗНИ
+    # ==============================
+
+    def ttl_for(self, state: Optional[str]) -> float:
+        """Срок жизни записи: по состоянию, по его группе или по умолчанию"""
+        if state:
+            if state in self.state_ttls:
+                return self.state_ttls[state]
+            group = state.split(":", 1)[0]
+            if group in self.state_ttls:
+                return self.state_ttls[group]
+        return self.ttl
+
+    async def _run(self, func, *args):
+        if self._sweeper is None and self.sweep_interval:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # ==============================
+    # ОПЕРАЦИИ В РАБОЧЕМ ПОТОКЕ
+    # ==============================
+
+    def _read(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        row = self._conn.execute(
+            f"SELECT state, data FROM fsm WHERE {KEY_WHERE} AND expires_at > ?",
+            (*_key(key), time.time())
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    def _write(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        with self._conn:
+            if state is None and not data:
+                self._conn.execute(f"DELETE FROM fsm WHERE {KEY_WHERE}", _key(key))
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fsm (bot_id, chat_id, user_id, thread_id, destiny, state, data, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*_key(key), state, json.dumps(data, ensure_ascii=False) if data else None,
+                 time.time() + self.ttl_for(state))
+            )
+
+    def _set_state(self, key: StorageKey, state: Optional[str]):
+        _, data = self._read(key)
+        self._write(key, state, data)
+
+    def _set_data(self, key: StorageKey, data: Dict[str, Any]):
+        state, _ = self._read(key)
+        self._write(key, state, data)
+
+    def _update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        state, current = self._read(key)
+        current.update(data)
+        self._write(key, state, current)
+        return current
+
+    def sweep(self) -> int:
+        """Удаление истёкших записей; возвращает число удалённых"""
+        with self._conn:
+            return self._conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    # ==============================
+    # ИНТЕРФЕЙС BASESTORAGE
+    # ==============================
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._run(self._set_state, key, state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._run(self._read, key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(self._set_data, key, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._run(self._read, key)
+        return data
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Чтение и запись одной операцией рабочего потока, без гонки между ними
+        current = await self._run(self._update_data, key, data.copy())
+        return current.copy()
+
+    async def _sweep_loop(self):
+        """Фоновая очистка брошенных сессий"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await asyncio.get_running_loop().run_in_executor(self._executor, self.sweep)
+                if removed:
+                    logger.info(f"🧹 Удалено истёкших FSM-сессий: {removed}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки FSM: {e}")
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown(wait=True)
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_storage: Optional[SQLiteStorage] = None
+
+
+def get_fsm_storage() -> SQLiteStorage:
+    """FSM-хранилище с настройками из конфигурации"""
+    global _storage
+    if _storage is None:
+        from config import config
+
+        _storage = SQLiteStorage(
+            config.FSM_DB_PATH,
+            ttl=config.FSM_TTL,
+            state_ttls=config.FSM_STATE_TTLS,
+            sweep_interval=config.FSM_SWEEP_INTERVAL
+        )
+    return _storage
+
+
+def setup_fsm_storage(dispatcher) -> BaseStorage:
+    """Подключить SQLiteStorage к диспетчеру, созданному с MemoryStorage
+
+    Вызывается до приёма апдейтов (при запуске). Другое хранилище,
+    переданное в Dispatcher(storage=...), не заменяется.
+    """
+    fsm = dispatcher.fsm
+    if isinstance(fsm.storage, MemoryStorage):
+        fsm.storage = get_fsm_storage()
+        logger.info(f"💾 FSM-сессии хранятся в {fsm.storage.path}")
+    return fsm.storage
@@ -0,0 +1,126 @@
+# journal.py - ЖУРНАЛ ИЗМЕНЕНИЙ (WRITE-AHEAD LOG)
+#
+# Каждое изменение записи дописывается в конец журнала одной строкой JSON.
+# Периодически журнал "запечатывается" в сегмент, его записи переносятся
+# в снимок (шарды persistence.py), после чего сегмент удаляется.
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only журнал изменений записей"""
+
+    CURRENT = "journal.log"
+
+    def __init__(self, root: Path, fsync: bool = True):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.fsync_enabled = fsync
+        self._truncate_torn_tail(self.root / self.CURRENT)
+        self._file = open(self.root / self.CURRENT, "a", encoding="utf-8")
+
+    @staticmethod
+    def _truncate_torn_tail(path: Path, block: int = 64 * 1024):
+        """Отрезать оборванную последнюю строку, чтобы новые записи начинались с новой строки"""
+        if not path.exists():
+            return
+        with open(path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # Ищем последний перевод строки с конца файла
+            pos = end
+            keep = 0
+            while pos > 0:
+                start = max(0, pos - block)
+                f.seek(start)
+                chunk = f.read(pos - start)
+                index = chunk.rfind(b"\n")
+                if index != -1:
+                    keep = start + index + 1
+                    break
+                pos = start
+
+            f.truncate(keep)
+        logger.warning(f"⚠️ Отрезана оборванная запись журнала в {path.name}: {end - keep} байт")
+
+    @property
+    def size(self) -> int:
+        """Размер текущего файла журнала в байтах"""
+        return self._file.tell()
+
+    def append(self, section: str, key: Hashable, value: Any = None, deleted: bool = False):
+        """Дописать изменение записи (или её удаление)"""
+        record = {"t": int(time.time()), "s": section, "k": key}
+        if deleted:
+            record["d"] = 1
+        else:
+            record["v"] = value
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def flush_buffer(self):
+        """Передать буфер журнала ОС (быстро, вызывается в event loop)"""
+        self._file.flush()
+
+    def fsync(self):
+        """Дождаться записи журнала на диск (можно вызывать из рабочего потока)"""
+        if self.fsync_enabled:
+            os.fsync(self._file.fileno())
+
+    def sync(self):
+        """Сбросить буфер журнала на диск"""
+        self.flush_buffer()
+        self.fsync()
+
+    def _segment_number(self, path: Path) -> int:
+        return int(path.name.split(".")[1])
+
+    def segments(self) -> List[Path]:
+        """Запечатанные сегменты в порядке записи"""
+        return sorted(self.root.glob("journal.*.log"), key=self._segment_number)
+
+    def rotate(self) -> Path:
+        """Запечатать текущий журнал в сегмент и начать новый"""
+        self._file.close()
+
+        sealed = self.segments()
+        number = self._segment_number(sealed[-1]) + 1 if sealed else 1
+        segment = self.root / f"journal.{number:06d}.log"
+        os.replace(self.root / self.CURRENT, segment)
+
+        self._file = open(self.root / self.CURRENT, "a", encoding="utf-8")
+        return segment
+
+    def discard(self, segments: List[Path]):
+        """Удалить сегменты, уже перенесённые в снимок"""
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Все записи журнала: сначала сегменты, затем текущий файл"""
+        self._file.flush()
+        for path in self.segments() + [self.root / self.CURRENT]:
+            if not path.exists():
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная строка в сегменте (текущий файл чинится при открытии)
+                        logger.warning(f"⚠️ Пропущена повреждённая запись журнала в {path.name}")
+
+    def close(self):
+        self.sync()
+        self._file.close()
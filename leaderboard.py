@@ -0,0 +1,83 @@
+# leaderboard.py - ТАБЛИЦА ЛИДЕРОВ ПО БАЛЛАМ
+#
+# Отсортированный список (SortedList) пар (-баллы, user_id) поддерживается
+# при каждом изменении рейтинга, поэтому вместо сортировки всего
+# users_rating на каждый просмотр:
+#   • место пользователя — O(log n),
+#   • топ-K и страница по смещению — O(log n + K).
+# При равных баллах выше пользователь с меньшим id, как в SQLite-хранилище.
+#
+# Таблица обновляется только событиями users_rating. Баллы, начисленные
+# в bot.py без mark_dirty, доходят сюда через поиск изменений persistence
+# (change_scan.py) с задержкой до CHANGE_SCAN_INTERVAL; экраны админки
+# перед чтением вызывают sync_changes().
+
+import logging
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """Рейтинг пользователей с поиском места и постраничным чтением"""
+
+    def __init__(self):
+        self._order = SortedList()
+        self._ratings: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ratings)
+
+    def update(self, user_id: Hashable, rating: Optional[int]):
+        """Новый рейтинг пользователя (None — пользователь удалён)"""
+        old = self._ratings.pop(user_id, None)
+        if old is not None:
+            self._order.remove((-old, user_id))
+        if rating is not None:
+            self._ratings[user_id] = rating
+            self._order.add((-rating, user_id))
+
+    def rebuild(self, ratings: Dict[Hashable, int]):
+        """Полная сборка из users_rating"""
+        self._ratings = dict(ratings)
+        self._order = SortedList((-rating, user_id) for user_id, rating in ratings.items())
+
+    def rank_of(self, user_id: Hashable) -> Optional[int]:
+        """Место пользователя (с 1) или None, если его нет в рейтинге"""
+        rating = self._ratings.get(user_id)
+        if rating is None:
+            return None
+        return self._order.index((-rating, user_id)) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[Hashable, int]]:
+        """Пользователи с места offset + 1: [(user_id, баллы)]"""
+        return [(user_id, -rating) for rating, user_id in self._order.islice(offset, offset + limit)]
+
+    def top(self, limit: int) -> List[Tuple[Hashable, int]]:
+        return self.page(0, limit)
+
+    def count_above(self, rating: int) -> int:
+        """Число пользователей с баллами строго больше rating"""
+        return self._order.bisect_left((-rating, float("-inf")))
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_leaderboard: Optional[Leaderboard] = None
+
+
+def get_leaderboard() -> Leaderboard:
+    """Таблица лидеров, подписанная на изменения users_rating"""
+    global _leaderboard
+    if _leaderboard is None:
+        from bot import users_rating
+        from persistence import get_persistence
+
+        _leaderboard = Leaderboard()
+        _leaderboard.rebuild(users_rating)
+        get_persistence().add_listener("users_rating", _leaderboard.update)
+    return _leaderboard
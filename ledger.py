@@ -0,0 +1,234 @@
+# ledger.py - ЖУРНАЛ ТРАНЗАКЦИЙ С ДНЕВНЫМИ ПРЕФИКСНЫМИ СУММАМИ
+#
+# Все транзакции из transaction_history подписок собраны в один список,
+# упорядоченный по purchased_at. Для дней с транзакциями поддерживаются
+# нарастающие суммы дохода и числа транзакций, для продуктов — итоги.
+#
+# Общий доход — последний элемент префиксных сумм, доход за период —
+# разность двух префиксов (двоичный поиск по дням), а транзакции периода
+# читаются срезом списка без обхода всех подписок. Для каждого продукта
+# ведётся свой упорядоченный по дате список, поэтому выборка по продукту
+# за период тоже срез, а не фильтрация всех транзакций периода.
+#
+# Журнал пополняется событиями user_subscriptions: новые записи истории
+# дописываются в конец, а редкое сокращение истории пересобирает журнал.
+# Оплаты bot.py делает без mark_dirty, их события приходят от поиска
+# изменений persistence (change_scan.py); экраны транзакций перед чтением
+# вызывают sync_changes().
+
+import bisect
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerEntry(NamedTuple):
+    """Транзакция журнала"""
+    ts: float  # purchased_at, epoch
+    user_id: Hashable
+    product_id: str
+    amount: int
+    transaction: dict  # Исходная запись transaction_history
+
+
+def _purchased_ts(transaction: dict) -> float:
+    value = transaction.get('purchased_at')
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Ledger:
+    """Упорядоченный по дате журнал транзакций с префиксными суммами"""
+
+    def __init__(self):
+        # Сколько записей истории каждого пользователя уже в журнале
+        self._user_count: Dict[Hashable, int] = {}
+        self._reset()
+
+    def _reset(self):
+        self._entries: List[LedgerEntry] = []
+        self._ts: List[float] = []
+
+        # Дни с транзакциями (ordinal) и нарастающие итоги по ним
+        self._days: List[int] = []
+        self._day_revenue: List[int] = []
+        self._day_count: List[int] = []
+
+        # Итоги по продуктам: product_id -> [доход, транзакций]
+        self._products: Dict[str, List[int]] = {}
+        # Транзакции каждого продукта по возрастанию даты
+        self._product_entries: Dict[str, List[LedgerEntry]] = {}
+        self._product_ts: Dict[str, List[float]] = {}
+
+    # ==============================
+    # ПОПОЛНЕНИЕ
+    # ==============================
+
+    def _add(self, user_id: Hashable, transaction: dict):
+        amount = transaction.get('amount', 0) or 0
+        product_id = transaction.get('product_id', '') or ''
+        entry = LedgerEntry(_purchased_ts(transaction), user_id, product_id, amount, transaction)
+
+        self._insert(self._entries, self._ts, entry)
+        self._insert(
+            self._product_entries.setdefault(product_id, []), self._product_ts.setdefault(product_id, []), entry
+        )
+
+        day = datetime.fromtimestamp(entry.ts).date().toordinal() if entry.ts else 0
+        position = bisect.bisect_left(self._days, day)
+        if position == len(self._days) or self._days[position] != day:
+            # Новый день: его префикс равен префиксу предыдущего дня
+            self._days.insert(position, day)
+            self._day_revenue.insert(position, self._day_revenue[position - 1] if position else 0)
+            self._day_count.insert(position, self._day_count[position - 1] if position else 0)
+        # Обычно это последний день, и цикл делает одну итерацию
+        for i in range(position, len(self._days)):
+            self._day_revenue[i] += amount
+            self._day_count[i] += 1
+
+        totals = self._products.setdefault(product_id, [0, 0])
+        totals[0] += amount
+        totals[1] += 1
+
+    @staticmethod
+    def _insert(entries: List[LedgerEntry], ts: List[float], entry: LedgerEntry):
+        if not ts or entry.ts >= ts[-1]:
+            entries.append(entry)
+            ts.append(entry.ts)
+        else:
+            position = bisect.bisect_right(ts, entry.ts)
+            entries.insert(position, entry)
+            ts.insert(position, entry.ts)
+
+    def on_subscription(self, user_id: Hashable, sub: Any):
+        """Обработчик изменений user_subscriptions (None — подписка удалена)"""
+        history = sub.transaction_history if sub is not None else []
+        known = self._user_count.get(user_id, 0)
+
+        if len(history) < known:
+            # История сократилась (удаление пользователя, ручная правка)
+            self._retract(user_id)
+            known = 0
+
+        for transaction in history[known:]:
+            self._add(user_id, transaction)
+        if history:
+            self._user_count[user_id] = len(history)
+        else:
+            self._user_count.pop(user_id, None)
+
+    def _retract(self, user_id: Hashable):
+        entries = [entry for entry in self._entries if entry.user_id != user_id]
+        self._user_count.pop(user_id, None)
+        self._rebuild(entries)
+
+    def _rebuild(self, entries: List[LedgerEntry]):
+        self._reset()
+        for entry in sorted(entries, key=lambda e: e.ts):
+            self._add(entry.user_id, entry.transaction)
+
+    def rebuild(self, subscriptions: Dict[Hashable, Any]):
+        """Полная сборка журнала из подписок"""
+        entries = []
+        self._user_count = {}
+        for user_id, sub in subscriptions.items():
+            history = sub.transaction_history
+            if history:
+                self._user_count[user_id] = len(history)
+            for transaction in history:
+                entries.append(LedgerEntry(_purchased_ts(transaction), user_id, '', 0, transaction))
+        self._rebuild(entries)
+
+    # ==============================
+    # ЗАПРОСЫ
+    # ==============================
+
+    @property
+    def total_revenue(self) -> int:
+        return self._day_revenue[-1] if self._day_revenue else 0
+
+    @property
+    def total_count(self) -> int:
+        return self._day_count[-1] if self._day_count else 0
+
+    def _prefix_before(self, day: int) -> Tuple[int, int]:
+        position = bisect.bisect_left(self._days, day)
+        if not position:
+            return 0, 0
+        return self._day_revenue[position - 1], self._day_count[position - 1]
+
+    def revenue_between(self, start: date, end: date) -> Tuple[int, int]:
+        """Доход и число транзакций с start по end включительно"""
+        revenue_end, count_end = self._prefix_before(end.toordinal() + 1)
+        revenue_start, count_start = self._prefix_before(start.toordinal())
+        return revenue_end - revenue_start, count_end - count_start
+
+    def daily_totals(self, start: date, end: date) -> List[Tuple[date, int, int]]:
+        """Итоги по дням периода, где были транзакции: [(день, доход, транзакций)]"""
+        first = bisect.bisect_left(self._days, start.toordinal())
+        last = bisect.bisect_right(self._days, end.toordinal())
+        totals = []
+        for i in range(first, last):
+            revenue = self._day_revenue[i] - (self._day_revenue[i - 1] if i else 0)
+            count = self._day_count[i] - (self._day_count[i - 1] if i else 0)
+            totals.append((date.fromordinal(self._days[i]), revenue, count))
+        return totals
+
+    def products(self) -> List[str]:
+        """Продукты, по которым были транзакции"""
+        return sorted(self._products)
+
+    def product_totals(self) -> Dict[str, Tuple[int, int]]:
+        """Доход и число транзакций по продуктам"""
+        return {product_id: (revenue, count) for product_id, (revenue, count) in self._products.items()}
+
+    def entries(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                product_id: Optional[str] = None) -> Iterator[LedgerEntry]:
+        """Транзакции в полуинтервале [start, end) по возрастанию даты"""
+        entries, ts = self._slice(product_id)
+        first, last = self._bounds(ts, start, end)
+        for i in range(first, last):
+            yield entries[i]
+
+    def count_between(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      product_id: Optional[str] = None) -> int:
+        """Число транзакций в [start, end) без их обхода"""
+        first, last = self._bounds(self._slice(product_id)[1], start, end)
+        return last - first
+
+    def _slice(self, product_id: Optional[str]) -> Tuple[List[LedgerEntry], List[float]]:
+        if product_id is None:
+            return self._entries, self._ts
+        return self._product_entries.get(product_id, []), self._product_ts.get(product_id, [])
+
+    @staticmethod
+    def _bounds(ts: List[float], start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+        first = bisect.bisect_left(ts, start.timestamp()) if start else 0
+        last = bisect.bisect_left(ts, end.timestamp()) if end else len(ts)
+        return first, max(first, last)
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_ledger: Optional[Ledger] = None
+
+
+def get_ledger() -> Ledger:
+    """Журнал транзакций, подписанный на изменения подписок"""
+    global _ledger
+    if _ledger is None:
+        from bot import user_subscriptions
+        from persistence import get_persistence
+
+        _ledger = Ledger()
+        _ledger.rebuild(user_subscriptions)
+        get_persistence().add_listener("user_subscriptions", _ledger.on_subscription)
+    return _ledger
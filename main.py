@@ -29,9 +29,11 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from fsm_storage import get_fsm_storage
+from user_search import UserProfileMiddleware
+
 # Конфигурация
 try:
     from config import config
@@ -62,7 +64,11 @@ logger.info(f"✅ Бот инициализируется: @{config.BOT_USERNAME
 # ==============================
 
 bot = Bot(token=config.BOT_TOKEN, parse_mode="HTML")
-dp = Dispatcher(storage=MemoryStorage())
+
+# FSM-сессии хранятся на диске и переживают перезапуск
+dp = Dispatcher(storage=get_fsm_storage())
+# Username и имена отправителей попадают в индекс поиска для админки
+dp.update.outer_middleware(UserProfileMiddleware())
 router = Router()
 
 # ==============================
@@ -0,0 +1,676 @@
+# persistence.py - ИНКРЕМЕНТАЛЬНОЕ СОХРАНЕНИЕ ДАННЫХ БОТА
+#
+# Записи каждого раздела (рейтинг, активность, подписки, дуэли, темы)
+# разложены по шардам. При изменении помечается только ключ записи,
+# а при сохранении перезаписываются только шарды с изменёнными ключами.
+# Запросы на сохранение, пришедшие подряд, объединяются в одну запись.
+#
+# Если подключён журнал (journal.py), каждое изменение сразу дописывается
+# в него, а шарды переписываются фоновым компактором: при старте снимок
+# загружается из шардов и дополняется записями журнала.
+#
+# Сохранение не блокирует event loop: в нём снимаются только копии
+# изменённых записей, а кодирование JSON, запись и fsync выполняются
+# в рабочем потоке. Файлы публикуются атомарно (временный файл + rename).
+#
+# bot.py загружает состояние при старте из своего файла (BOT_DATA_FILE),
+# а get_persistence() накладывает поверх то, что новее файла (restore()):
+# пустой раздел заполняется из хранилища целиком, при шардах новее файла
+# раздел заменяется состоянием хранилища, иначе применяются только записи
+# журнала, сделанные после записи файла. Так журналированное изменение
+# переживает аварийную остановку. Состояние хранилища читается из двоичного
+# снимка (snapshot.py), если он не старше шардов, иначе из шардов, и
+# дополняется журналом. Снимок перезаписывается после компактирования
+# не чаще SNAPSHOT_INTERVAL. Полного сохранения через bot.save_data()
+# менеджер не делает: каждая объединённая запись — только изменённые шарды.
+#
+# Изменения, которые bot.py делает без mark_dirty(), приходят двумя путями.
+# Записи ActivityRecord сами сообщают о присваиваниях (compact.track_changes),
+# а горячие места bot.py могут вызывать touch_later(): ключ попадает
+# во множество затронутых и помечается один раз при ближайшем разборе
+# в event loop. sync_changes() перед чтением индексов разбирает только это
+# множество. Остальное (рейтинг, подписки, дуэли) находит фоновый обход
+# по дешёвым отпечаткам записей (change_scan.py) раз в CHANGE_SCAN_INTERVAL.
+#
+# Все записи разделов держатся в памяти, ленивой загрузки с вытеснением
+# (LRU) нет: индексы статистики, поиск и экспорты обходят словари bot.py
+# целиком и подписаны на их события, а вытесненная запись выпала бы из них.
+# Память экономит компактное представление активности (compact.py).
+
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from journal import Journal
+
+logger = logging.getLogger(__name__)
+
+# Разделы состояния бота, которые сохраняются на диск
+SECTIONS = (
+    "users_rating",
+    "user_activities",
+    "user_subscriptions",
+    "active_duels",
+    "users_completed_topics",
+    "users_available_topics",
+)
+
+
+def serialize_record(value: Any) -> Any:
+    """Приведение записи к JSON-совместимому виду"""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value
+
+
+def snapshot_record(value: Any) -> Any:
+    """Сериализованная запись, отвязанная от живых списков и словарей
+
+    to_dict() может вернуть ссылки на изменяемые поля (например,
+    transaction_history), поэтому вложенные контейнеры копируются,
+    чтобы рабочий поток кодировал неизменный снимок.
+    """
+    data = serialize_record(value)
+    if isinstance(data, dict):
+        return {
+            k: list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v
+            for k, v in data.items()
+        }
+    if isinstance(data, list):
+        return list(data)
+    return data
+
+
+def write_json_atomic(path: Path, data: Any):
+    """Запись JSON во временный файл с fsync и атомарная замена"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ==============================
+# ШАРДИРОВАННОЕ ХРАНИЛИЩЕ
+# ==============================
+
+class ShardedStore:
+    """Файловое хранилище: каждый раздел разбит на шарды по хешу ключа"""
+
+    def __init__(self, root: Path, shards: int = 64):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # Число шардов фиксируется при первом запуске, иначе ключи "переедут"
+        meta_path = self.root / "meta.json"
+        self.fresh = not meta_path.exists()
+        if not self.fresh:
+            with open(meta_path, encoding="utf-8") as f:
+                shards = json.load(f).get("shards", shards)
+        else:
+            write_json_atomic(meta_path, {"shards": shards})
+
+        self.shards = shards
+
+    def modified_at(self) -> float:
+        """Время последней записи шардов (mtime каталогов разделов)"""
+        return max((path.stat().st_mtime for path in self.root.iterdir() if path.is_dir()), default=0.0)
+
+    def shard_of(self, key: Hashable) -> int:
+        """Номер шарда для ключа"""
+        return zlib.crc32(str(key).encode("utf-8")) % self.shards
+
+    def _path(self, section: str, shard: int) -> Path:
+        return self.root / section / f"{shard:04d}.json"
+
+    def read_shard(self, section: str, shard: int) -> Dict[str, Any]:
+        """Чтение одного шарда раздела"""
+        path = self._path(section, shard)
+        if not path.exists():
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_shard(self, section: str, shard: int, records: Dict[str, Any]):
+        """Запись одного шарда раздела (пустой шард удаляется)"""
+        path = self._path(section, shard)
+        if not records:
+            path.unlink(missing_ok=True)
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(path, records)
+
+    def load_section(self, section: str) -> Dict[str, Any]:
+        """Загрузка всех записей раздела"""
+        records = {}
+        for shard in range(self.shards):
+            records.update(self.read_shard(section, shard))
+        return records
+
+    def load_record(self, section: str, key: Hashable) -> Optional[Any]:
+        """Чтение одной записи (читается только её шард)"""
+        return self.read_shard(section, self.shard_of(key)).get(str(key))
+
+    def prepare(self, section: str, keys: Set[Hashable], source) -> Dict[int, Dict[str, Any]]:
+        """Снимок изменённых записей по шардам (None — запись удалена)"""
+        snapshot: Dict[int, Dict[str, Any]] = {}
+        for key in keys:
+            value = snapshot_record(source[key]) if key in source else None
+            snapshot.setdefault(self.shard_of(key), {})[str(key)] = value
+        return snapshot
+
+    def commit(self, section: str, snapshot: Dict[int, Dict[str, Any]]) -> int:
+        """Чтение, обновление и атомарная перезапись шардов (безопасно вызывать из потока)"""
+        for shard, changes in snapshot.items():
+            records = self.read_shard(section, shard)
+            for key, value in changes.items():
+                if value is None:
+                    records.pop(key, None)
+                else:
+                    records[key] = value
+            self.write_shard(section, shard, records)
+        return len(snapshot)
+
+    def apply(self, section: str, keys: Set[Hashable], source: dict) -> int:
+        """Синхронная перезапись шардов с изменёнными ключами"""
+        return self.commit(section, self.prepare(section, keys, source))
+
+
+# ==============================
+# МЕНЕДЖЕР СОХРАНЕНИЯ
+# ==============================
+
+class PersistenceManager:
+    """Отслеживание изменённых записей и отложенная запись их шардов"""
+
+    def __init__(self, store, sources: Dict[str, dict], delay: float = 2.0,
+                 journal: Optional[Journal] = None, compact_bytes: int = 8 * 1024 * 1024,
+                 compact_interval: float = 600.0,
+                 snapshot_path: Optional[Path] = None, snapshot_interval: float = 3600.0):
+        self.store = store
+        self.sources = sources
+        self.delay = delay
+        self.journal = journal
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        # Двоичный снимок для быстрого старта (только файловое хранилище)
+        self.snapshot_path = snapshot_path if isinstance(store, ShardedStore) else None
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_at = 0.0
+
+        self._dirty: Dict[str, Set[Hashable]] = {section: set() for section in sources}
+        # Затронутые в обход mark_dirty ключи, ещё не помеченные (touch_later)
+        self._touched: Dict[str, Set[Hashable]] = {section: set() for section in sources}
+        self._drain_handle: Optional[asyncio.Handle] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._compactor: Optional[asyncio.Task] = None
+        # Одновременно идёт не больше одной записи на диск
+        self._write_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        # Подписчики на изменения записей (индексы, счётчики)
+        self._listeners: Dict[str, List[Callable[[Hashable, Any], None]]] = {}
+        # Поиск изменений, сделанных без mark_dirty (change_scan.py)
+        self.scanner = None
+        # Ключи, восстановленные из журнала при запуске (restore)
+        self.restored: Dict[str, Set[Hashable]] = {}
+
+    def add_listener(self, section: str, callback: Callable[[Hashable, Any], None]):
+        """Подписка на изменения раздела: callback(key, value), value=None при удалении"""
+        self._listeners.setdefault(section, []).append(callback)
+
+    def _notify(self, section: str, key: Hashable, value: Any):
+        for callback in self._listeners.get(section, ()):
+            try:
+                callback(key, value)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика изменений {section}: {e}")
+
+    def mark_dirty(self, section: str, key: Hashable):
+        """Пометить запись как изменённую (или удалённую)"""
+        value = self.sources[section].get(key)
+        self.mark_changed(section, key, value)
+        if self.scanner is not None:
+            self.scanner.remember(section, key, value)
+
+    def mark_changed(self, section: str, key: Hashable, value: Any):
+        """Изменение с уже прочитанным значением: в запись, журнал и подписчикам"""
+        self._dirty[section].add(key)
+        if self.journal is not None:
+            if value is not None:
+                self.journal.append(section, key, serialize_record(value))
+            else:
+                self.journal.append(section, key, deleted=True)
+        self._notify(section, key, value)
+
+    def mark_many(self, section: str, keys: Iterable[Hashable], log: bool = True):
+        """Пометить несколько записей раздела (log=False — без журнала и подписчиков)"""
+        if log:
+            for key in keys:
+                self.mark_dirty(section, key)
+        else:
+            self._dirty[section].update(keys)
+
+    def touch(self, section: str, key: Hashable):
+        """Пометить запись и запланировать сохранение"""
+        self.mark_dirty(section, key)
+        self.schedule_save()
+
+    def touch_user(self, user_id: int):
+        """Пометить рейтинг, активность и подписку пользователя"""
+        for section in ("users_rating", "user_activities", "user_subscriptions"):
+            if user_id in self.sources[section]:
+                self.mark_dirty(section, user_id)
+        self.schedule_save()
+
+    def touch_later(self, section: str, key: Hashable):
+        """Запись изменена в горячем пути: пометить один раз при разборе в event loop"""
+        touched = self._touched[section]
+        if key in touched:
+            return
+        touched.add(key)
+        if self._drain_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # Вне event loop ключи разберёт ближайший flush() или sync_changes()
+                return
+            self._drain_handle = loop.call_soon(self._drain_scheduled)
+
+    def _drain(self) -> int:
+        """Пометить затронутые ключи; возвращает их число"""
+        drained = 0
+        for section, touched in self._touched.items():
+            if not touched:
+                continue
+            keys, self._touched[section] = touched, set()
+            for key in keys:
+                self.mark_dirty(section, key)
+            drained += len(keys)
+        return drained
+
+    def _drain_scheduled(self):
+        self._drain_handle = None
+        if self._drain():
+            self.schedule_save()
+
+    @property
+    def pending(self) -> int:
+        """Количество записей, ожидающих сохранения"""
+        return sum(len(keys) for keys in self._dirty.values())
+
+    def _prepare(self) -> List[Tuple[str, Set[Hashable], Any]]:
+        """Снимок изменённых записей (быстрая часть, выполняется в event loop)"""
+        self._drain()
+        snapshot = []
+        for section, dirty in self._dirty.items():
+            if not dirty:
+                continue
+            keys, self._dirty[section] = dirty, set()
+            snapshot.append((section, keys, self.store.prepare(section, keys, self.sources[section])))
+        return snapshot
+
+    def _commit(self, snapshot: List[Tuple[str, Set[Hashable], Any]],
+                sealed: Optional[List[Path]] = None) -> int:
+        """Запись снимка и удаление перенесённых сегментов журнала (в рабочем потоке)"""
+        written = 0
+        for section, _, payload in snapshot:
+            written += self.store.commit(section, payload)
+
+        if sealed:
+            self.journal.discard(sealed)
+            self._refresh_snapshot()
+        if written:
+            logger.info(f"💾 Сохранено изменений: {written}")
+        return written
+
+    def _refresh_snapshot(self):
+        """Перезапись двоичного снимка из шардов после компактирования (в рабочем потоке)"""
+        if self.snapshot_path is None or time.monotonic() - self._snapshot_at < self.snapshot_interval:
+            return
+        from snapshot import write_snapshot
+
+        try:
+            write_snapshot(self.snapshot_path, {section: self.store.load_section(section) for section in self.sources})
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи снимка: {e}")
+            return
+        self._snapshot_at = time.monotonic()
+
+    def _finish(self, snapshot: List[Tuple[str, Set[Hashable], Any]], ok: bool):
+        """Итог записи снимка (в event loop)"""
+        if ok:
+            return
+        for section, keys, _ in snapshot:
+            # Ключи вернутся в следующую запись, сегменты журнала не удалены
+            self._dirty[section].update(keys)
+
+    def _write(self, snapshot, sealed: Optional[List[Path]] = None) -> int:
+        """Синхронная запись снимка"""
+        try:
+            written = self._commit(snapshot, sealed)
+        except Exception:
+            self._finish(snapshot, ok=False)
+            raise
+        self._finish(snapshot, ok=True)
+        return written
+
+    async def _write_async(self, snapshot, sealed: Optional[List[Path]] = None) -> int:
+        """Запись снимка в рабочем потоке"""
+        loop = asyncio.get_running_loop()
+        try:
+            written = await loop.run_in_executor(None, self._commit, snapshot, sealed)
+        except Exception:
+            self._finish(snapshot, ok=False)
+            raise
+        self._finish(snapshot, ok=True)
+        return written
+
+    def write_changes(self) -> int:
+        """Синхронная запись изменённых записей; возвращает число операций записи"""
+        return self._write(self._prepare())
+
+    def flush(self):
+        """Синхронное сохранение: сброс журнала или запись шардов"""
+        self._drain()
+        if self.journal is None:
+            self.write_changes()
+            return
+
+        self.journal.sync()
+        if self.journal.size >= self.compact_bytes:
+            self.compact()
+
+    def compact(self):
+        """Синхронный перенос журнала в шарды"""
+        if self.journal is None:
+            self.write_changes()
+            return
+
+        # Новые изменения во время переноса попадут уже в свежий журнал
+        self.journal.rotate()
+        sealed = self.journal.segments()
+        self._write(self._prepare(), sealed)
+
+    async def flush_async(self):
+        """Сохранение без блокировки event loop"""
+        async with self._write_lock:
+            if self.journal is None:
+                await self._write_async(self._prepare())
+                return
+
+            self._drain()
+            self.journal.flush_buffer()
+            await asyncio.get_running_loop().run_in_executor(None, self.journal.fsync)
+            if self.journal.size >= self.compact_bytes:
+                await self._compact_locked()
+
+    async def compact_async(self):
+        """Перенос журнала в шарды без блокировки event loop"""
+        async with self._write_lock:
+            if self.journal is None:
+                await self._write_async(self._prepare())
+            else:
+                await self._compact_locked()
+
+    async def _compact_locked(self):
+        self.journal.rotate()
+        sealed = self.journal.segments()
+        await self._write_async(self._prepare(), sealed)
+
+    def save_all(self):
+        """Полная перезапись всех разделов (миграция, завершение работы)"""
+        for section, source in self.sources.items():
+            self.mark_many(section, list(source), log=False)
+        self.compact()
+
+    def schedule_save(self):
+        """Отложенное сохранение: запросы в пределах delay объединяются в одну запись"""
+        if self._flush_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, тесты) сохраняем сразу
+            self.flush()
+            return
+
+        self._flush_handle = loop.call_later(self.delay, self._scheduled_flush)
+        self.start()
+
+    def start(self):
+        """Запуск фоновых задач (компактор журнала, поиск изменений) в текущем event loop"""
+        if self.journal is not None and self._compactor is None:
+            self._compactor = asyncio.get_running_loop().create_task(self._compactor_loop())
+        if self.scanner is not None:
+            self.scanner.start()
+
+    async def sync_changes(self) -> int:
+        """Донести до индексов затронутые записи (перед чтением); O(изменений)"""
+        return self._drain()
+
+    def _scheduled_flush(self):
+        self._flush_handle = None
+        task = asyncio.ensure_future(self._run_flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_flush(self):
+        try:
+            await self.flush_async()
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения данных: {e}")
+
+    async def _compactor_loop(self):
+        """Фоновый компактор журнала"""
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                if self.journal.size or self.journal.segments():
+                    await self.compact_async()
+            except Exception as e:
+                logger.error(f"❌ Ошибка компактирования журнала: {e}")
+
+    def _load_snapshot(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Разделы из снимка, если он есть и не старше шардов"""
+        path = self.snapshot_path
+        if path is None or not path.exists() or path.stat().st_mtime < self.store.modified_at():
+            return None
+        from snapshot import SnapshotError, load_snapshot
+
+        try:
+            state = load_snapshot(path)
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"⚠️ Снимок не прочитан, загрузка из шардов: {e}")
+            return None
+        logger.info(f"⚡ Состояние загружено из снимка {path.name}")
+        return {section: {str(key): value for key, value in state.get(section, {}).items()}
+                for section in self.sources}
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Загрузка всех разделов с диска (ключи — строки, как в JSON)
+
+        Из снимка активность приходит объектами ActivityRecord, из шардов
+        и журнала — словарями.
+        """
+        data = self._load_snapshot()
+        if data is None:
+            data = {section: self.store.load_section(section) for section in self.sources}
+
+        self._replay(data)
+        return data
+
+    def _replay(self, data: Dict[str, Dict[str, Any]], since: float = 0.0) -> Dict[str, Set[str]]:
+        """Наложить записи журнала не старше since; возвращает затронутые ключи"""
+        touched: Dict[str, Set[str]] = {section: set() for section in data}
+        if self.journal is None:
+            return touched
+
+        replayed = 0
+        for record in self.journal.replay():
+            section = data.get(record["s"])
+            if section is None or record.get("t", 0) < int(since):
+                continue
+            key = str(record["k"])
+            if record.get("d"):
+                section[key] = None
+            else:
+                section[key] = record["v"]
+            touched[record["s"]].add(key)
+            replayed += 1
+        # Удалённые ключи остаются None до конца разбора: так их видит restore()
+        for section in data.values():
+            for key in [key for key, value in section.items() if value is None]:
+                del section[key]
+        if replayed:
+            logger.info(f"📜 Восстановлено из журнала записей: {replayed}")
+        return touched
+
+    def restore(self, factories: Dict[str, Callable[[Any], Any]], saved_at: float = 0.0) -> int:
+        """Восстановление разделов с диска поверх состояния, загруженного bot.py
+
+        saved_at — время записи файла, из которого bot.py загрузил состояние
+        (0 — неизвестно). Пустой раздел заполняется из хранилища целиком.
+        Если шарды записаны позже файла, хранилище новее: раздел заменяется
+        его состоянием вместе с журналом. Иначе поверх файла накладываются
+        только записи журнала, сделанные после saved_at, — изменения,
+        не успевшие попасть в файл до остановки или сбоя.
+        Ключи, пришедшие из журнала, остаются в restored (журнал изменений
+        экспорта отмечает по ним пользователей). Возвращает число записей.
+        """
+        from snapshot import INT_KEYED
+
+        sections = [section for section in factories if section in self.sources]
+        store_newer = self.store.modified_at() > saved_at
+        full = [section for section in sections if store_newer or not self.sources[section]]
+
+        loaded = self.load() if full else {}
+        journaled = {section: {} for section in sections}
+        touched = self._replay(journaled, since=saved_at)
+
+        restored = 0
+        for section in sections:
+            factory = factories[section]
+            int_keys = section in INT_KEYED
+            source = self.sources[section]
+            convert = (lambda key: int(key)) if int_keys else (lambda key: key)
+
+            if section in full:
+                # Хранилище новее файла: пропавшие в нём ключи удалены
+                records = loaded[section]
+                for key in [key for key in source if str(key) not in records]:
+                    del source[key]
+            else:
+                records = journaled[section]
+                for key in touched[section] - set(records):
+                    source.pop(convert(key), None)
+
+            for key, value in records.items():
+                source[convert(key)] = factory(value)
+            restored += len(records)
+            self.restored[section] = {convert(key) for key in touched[section]}
+
+        if restored:
+            logger.info(f"📂 Восстановлено с диска записей: {restored}")
+        return restored
+
+
+def _factory(cls) -> Optional[Callable[[Any], Any]]:
+    """Сборка записи классом bot.py: словарь и объект другого класса — через from_dict
+
+    Из снимка активность приходит объектами ActivityRecord, из шардов
+    и журнала — словарями; после восстановления в разделе один тип.
+    """
+    from_dict = getattr(cls, "from_dict", None)
+    if from_dict is None:
+        return None
+
+    def build(value: Any) -> Any:
+        if isinstance(value, cls):
+            return value
+        return from_dict(value if isinstance(value, dict) else serialize_record(value))
+    return build
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_persistence: Optional[PersistenceManager] = None
+
+
+def get_persistence() -> PersistenceManager:
+    """Менеджер сохранения, привязанный к словарям состояния бота"""
+    global _persistence
+    if _persistence is None:
+        import bot
+        from compact import ActivityRecord, compact_activities, track_changes
+        from config import config
+
+        sources = {section: getattr(bot, section) for section in SECTIONS}
+
+        if config.STORAGE_BACKEND == "sqlite":
+            from sqlite_store import SQLiteStore
+            store = SQLiteStore(config.DATA_DIR / "state.sqlite3")
+            # У SQLite свой WAL, отдельный журнал не нужен
+            journal = None
+        else:
+            store = ShardedStore(config.DATA_DIR / "state", shards=config.PERSIST_SHARDS)
+            journal = Journal(config.DATA_DIR / "journal") if config.JOURNAL_ENABLED else None
+
+        _persistence = PersistenceManager(
+            store, sources,
+            delay=config.PERSIST_DELAY,
+            journal=journal,
+            compact_bytes=config.JOURNAL_COMPACT_BYTES,
+            compact_interval=config.JOURNAL_COMPACT_INTERVAL,
+            snapshot_path=config.SNAPSHOT_PATH if config.SNAPSHOT_INTERVAL > 0 else None,
+            snapshot_interval=config.SNAPSHOT_INTERVAL
+        )
+
+        if config.CHANGE_SCAN_INTERVAL > 0:
+            from change_scan import ChangeScanner
+            _persistence.scanner = ChangeScanner(
+                _persistence, SECTIONS,
+                interval=config.CHANGE_SCAN_INTERVAL,
+                batch=config.CHANGE_SCAN_BATCH,
+                tracked=(ActivityRecord,)
+            )
+
+        # Активность, загруженная bot.py, — в компактные записи
+        if config.COMPACT_ACTIVITIES:
+            replaced = compact_activities(sources["user_activities"])
+            if replaced:
+                logger.info(f"🗜 Активность переведена в ActivityRecord: {replaced}")
+
+        # Первый запуск с новым хранилищем: переносим туда текущее состояние
+        if store.fresh:
+            _persistence.save_all()
+        else:
+            # Поверх загруженного bot.py — то, что в хранилище и журнале новее
+            factories = {
+                "users_rating": int,
+                "user_activities": _factory(
+                    ActivityRecord if config.COMPACT_ACTIVITIES else getattr(bot, "UserActivity", None)
+                ),
+                "user_subscriptions": _factory(getattr(bot, "UserSubscription", None)),
+                "active_duels": _factory(getattr(bot, "Duel", None)),
+                "users_completed_topics": set,
+                "users_available_topics": set,
+            }
+            data_file = config.BOT_DATA_FILE
+            saved_at = data_file.stat().st_mtime if data_file and data_file.exists() else 0.0
+            _persistence.restore({section: f for section, f in factories.items() if f is not None}, saved_at)
+
+        # Записи ActivityRecord сами сообщают о правках bot.py
+        track_changes(lambda record: _persistence.touch_later("user_activities", record.user_id))
+    return _persistence
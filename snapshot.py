@@ -0,0 +1,460 @@
+# snapshot.py - ДВОИЧНЫЙ СНИМОК СОСТОЯНИЯ БОТА
+#
+# Версионированный формат для быстрого холодного старта:
+#
+#   заголовок   | magic, версия, число разделов, время создания
+#   таблица     | для каждого раздела: имя, смещение, длина, CRC32, число записей, вид
+#   разделы     | выровнены по 8 байт
+#
+# Рейтинг и активность хранятся массивами int64 фиксированной ширины
+# и читаются через mmap без разбора: memoryview.cast("q") поверх файла.
+# Подписки (с transaction_history), дуэли и темы — индекс смещений
+# и компактный JSON на запись, поэтому их можно читать выборочно.
+# Поля активности вне int64-строки (блокировка) лежат рядом в JSON-разделе
+# user_activities.extra только для тех пользователей, у кого они есть.
+#
+# Менеджер сохранения (persistence.py) перезаписывает снимок после
+# компактирования журнала не чаще SNAPSHOT_INTERVAL и при старте читает
+# его вместо шардов, если снимок не старше их.
+#
+# Использование:
+#     python snapshot.py convert --state data/state --journal data/journal --out data/state.snap
+#     python snapshot.py bench --state data/state --snapshot data/state.snap
+#     python snapshot.py bench --synthetic 100000
+
+import argparse
+import gc
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from compact import ActivityRecord
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RBSNAP\x00\x00"
+VERSION = 2  # 2: раздел user_activities.extra
+
+HEADER = struct.Struct("<8sHHIQ")  # magic, версия, разделов, флаги, создан (epoch)
+ENTRY = struct.Struct("<32sQQIIB3x")  # имя, смещение, длина, crc32, записей, вид
+
+# Виды разделов
+KIND_PAIRS = 1  # (ключ, значение) int64
+KIND_ACTIVITY = 2  # записи ActivityRecord по 11 x int64
+KIND_BLOB = 3  # индекс (смещение, длина) int64 + JSON-массив записей [ключ, значение]
+
+SECTION_KINDS = {
+    "users_rating": KIND_PAIRS,
+    "user_activities": KIND_ACTIVITY,
+    "user_subscriptions": KIND_BLOB,
+    "active_duels": KIND_BLOB,
+    "users_completed_topics": KIND_BLOB,
+    "users_available_topics": KIND_BLOB,
+}
+
+# Разделы, где ключ — id пользователя
+INT_KEYED = {"users_rating", "user_activities", "user_subscriptions",
+             "users_completed_topics", "users_available_topics"}
+
+ACTIVITY_WIDTH = 3 + len(ActivityRecord.COUNTERS)  # user_id, счётчики, две даты
+# Поля блокировки пользователей, у которых они есть
+ACTIVITY_EXTRA = "user_activities.extra"
+
+
+class SnapshotError(Exception):
+    """Повреждённый или несовместимый файл снимка"""
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+# ==============================
+# КОДИРОВАНИЕ РАЗДЕЛОВ
+# ==============================
+
+def _encode_pairs(records: Dict[Any, Any]) -> bytes:
+    values = []
+    for key, value in records.items():
+        values.append(int(key))
+        values.append(int(value))
+    return struct.pack(f"<{len(values)}q", *values)
+
+
+def _activity_record(value: Any) -> ActivityRecord:
+    if isinstance(value, ActivityRecord):
+        return value
+    if isinstance(value, dict):
+        return ActivityRecord.from_dict(value)
+    return ActivityRecord.from_activity(value)
+
+
+def _activity_extra(record: ActivityRecord) -> Dict[str, Any]:
+    """Заполненные поля блокировки записи"""
+    data = record.to_dict()
+    return {name: data[name] for name in ActivityRecord.BAN_FIELDS if name in data}
+
+
+def _activity_row(key: Any, record: ActivityRecord) -> List[int]:
+    row = [int(key)]
+    row.extend(int(getattr(record, name)) for name in ActivityRecord.COUNTERS)
+    row.append(record.first_seen_ts)
+    row.append(record.last_activity_ts)
+    return row
+
+
+def _encode_activity(records: Dict[Any, Any]) -> bytes:
+    values = []
+    for key, value in records.items():
+        values.extend(_activity_row(key, value))
+    return struct.pack(f"<{len(values)}q", *values)
+
+
+def _encode_blob(records: Dict[Any, Any]) -> bytes:
+    from persistence import serialize_record
+
+    blobs = [
+        json.dumps([key, serialize_record(value)], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for key, value in records.items()
+    ]
+    # Записи образуют один JSON-массив: целиком он разбирается одним вызовом,
+    # а по индексу можно прочитать отдельную запись
+    index = []
+    offset = 1
+    for blob in blobs:
+        index.extend((offset, len(blob)))
+        offset += len(blob) + 1
+    return struct.pack(f"<{len(index)}q", *index) + b"[" + b",".join(blobs) + b"]"
+
+
+ENCODERS = {
+    KIND_PAIRS: _encode_pairs,
+    KIND_ACTIVITY: _encode_activity,
+    KIND_BLOB: _encode_blob,
+}
+
+
+def write_snapshot(path: Path, sections: Dict[str, Dict[Any, Any]]):
+    """Запись снимка разделов атомарно (временный файл + rename)
+
+    Значения могут быть объектами (UserActivity, ActivityRecord, UserSubscription)
+    или их словарями в формате to_dict().
+    """
+    path = Path(path)
+    names = [name for name in sections if name in SECTION_KINDS]
+
+    payloads = []
+    for name in names:
+        kind = SECTION_KINDS[name]
+        records = sections[name]
+        if kind == KIND_ACTIVITY:
+            records = {key: _activity_record(value) for key, value in records.items()}
+        payloads.append((name, kind, len(records), ENCODERS[kind](records)))
+
+        if kind == KIND_ACTIVITY:
+            extra = {}
+            for key, record in records.items():
+                fields = _activity_extra(record)
+                if fields:
+                    extra[int(key)] = fields
+            if extra:
+                payloads.append((ACTIVITY_EXTRA, KIND_BLOB, len(extra), _encode_blob(extra)))
+
+    offset = _align(HEADER.size + ENTRY.size * len(payloads))
+    table = []
+    for name, kind, count, payload in payloads:
+        table.append(ENTRY.pack(name.encode("ascii"), offset, len(payload),
+                                zlib.crc32(payload), count, kind))
+        offset = _align(offset + len(payload))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(payloads), 0, int(time.time())))
+        f.write(b"".join(table))
+        for _, _, _, payload in payloads:
+            f.write(b"\x00" * (_align(f.tell()) - f.tell()))
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ==============================
+# ЧТЕНИЕ ЧЕРЕЗ MMAP
+# ==============================
+
+class SnapshotReader:
+    """Снимок, отображённый в память; разделы читаются по требованию"""
+
+    def __init__(self, path: Path, verify: bool = True):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER.size:
+            self.close()
+            raise SnapshotError(f"Файл слишком короткий: {self.path}")
+
+        magic, version, count, _, self.created_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotError(f"Не файл снимка: {self.path}")
+        if version > VERSION:
+            self.close()
+            raise SnapshotError(f"Версия снимка {version} новее поддерживаемой {VERSION}")
+        self.version = version
+
+        self.sections: Dict[str, Tuple[int, int, int, int, int]] = {}
+        for i in range(count):
+            name, offset, length, crc, records, kind = ENTRY.unpack_from(self._mm, HEADER.size + i * ENTRY.size)
+            if offset + length > len(self._mm):
+                self.close()
+                raise SnapshotError(f"Раздел выходит за конец файла: {self.path}")
+            self.sections[name.rstrip(b"\x00").decode("ascii")] = (offset, length, crc, records, kind)
+
+        if verify:
+            try:
+                self.verify()
+            except SnapshotError:
+                self.close()
+                raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _int64(self, section: str, start: int = 0, count: Optional[int] = None) -> List[int]:
+        """Массив int64 раздела, прочитанный прямо из отображения файла"""
+        offset, length, _, _, _ = self.sections[section]
+        end = offset + length if count is None else offset + start + count * 8
+        with memoryview(self._mm) as view, view[offset + start:end] as region, region.cast("q") as values:
+            return values.tolist()
+
+    def verify(self):
+        """Проверка CRC32 всех разделов"""
+        for name, (offset, length, crc, _, _) in self.sections.items():
+            if zlib.crc32(self._mm[offset:offset + length]) != crc:
+                raise SnapshotError(f"Неверная контрольная сумма раздела {name}")
+
+    def count(self, section: str) -> int:
+        return self.sections[section][3] if section in self.sections else 0
+
+    def pairs(self, section: str) -> Dict[int, int]:
+        """Раздел (ключ, значение) int64 как словарь"""
+        if section not in self.sections:
+            return {}
+        values = self._int64(section)
+        return dict(zip(values[0::2], values[1::2]))
+
+    def activities(self) -> Iterator[ActivityRecord]:
+        """Записи активности (ActivityRecord) без разбора JSON"""
+        if "user_activities" not in self.sections:
+            return
+        values = self._int64("user_activities")
+        extra = dict(self.blobs(ACTIVITY_EXTRA))
+        from_row = ActivityRecord.from_row
+        for row in zip(*[iter(values)] * ACTIVITY_WIDTH):
+            record = from_row(row)
+            if record.user_id in extra:
+                record.set_ban(extra[record.user_id])
+            yield record
+
+    def blob_record(self, section: str, index: int) -> Tuple[Any, Any]:
+        """Одна запись JSON-раздела по порядковому номеру"""
+        section_offset = self.sections[section][0]
+        offset, length = struct.unpack_from("<qq", self._mm, section_offset + index * 16)
+        start = section_offset + self.count(section) * 16 + offset
+        return tuple(json.loads(self._mm[start:start + length]))
+
+    def blobs(self, section: str) -> Iterator[Tuple[Any, Any]]:
+        """Все записи JSON-раздела"""
+        if section not in self.sections:
+            return
+        offset, length, _, count, _ = self.sections[section]
+        for key, value in json.loads(self._mm[offset + count * 16:offset + length]):
+            yield key, value
+
+    def load_state(self) -> Dict[str, Dict[Any, Any]]:
+        """Все разделы: рейтинг — int, активность — ActivityRecord, остальное — словари to_dict()"""
+        state: Dict[str, Dict[Any, Any]] = {}
+        for section, (_, _, _, _, kind) in self.sections.items():
+            if section == ACTIVITY_EXTRA:
+                continue
+            if kind == KIND_PAIRS:
+                state[section] = self.pairs(section)
+            elif kind == KIND_ACTIVITY:
+                state[section] = {record.user_id: record for record in self.activities()}
+            else:
+                int_keys = section in INT_KEYED
+                state[section] = {
+                    (int(key) if int_keys else key): value for key, value in self.blobs(section)
+                }
+        return state
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+
+def load_snapshot(path: Path, verify: bool = True) -> Dict[str, Dict[Any, Any]]:
+    """Загрузка всех разделов снимка"""
+    # Сборщик мусора на время массового создания объектов только мешает:
+    # без паузы он многократно обходит уже загруженные записи
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with SnapshotReader(path, verify=verify) as reader:
+            return reader.load_state()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+# ==============================
+# КОНВЕРТЕР И БЕНЧМАРК
+# ==============================
+
+def load_json_state(state_dir: Optional[Path] = None, journal_dir: Optional[Path] = None,
+                    json_file: Optional[Path] = None) -> Dict[str, Dict[str, Any]]:
+    """Состояние в текущем формате: шарды persistence (+ журнал) или один JSON-файл"""
+    from persistence import SECTIONS, PersistenceManager, ShardedStore
+    from journal import Journal
+
+    if json_file is not None:
+        with open(json_file, encoding="utf-8") as f:
+            data = json.load(f)
+        return {section: data.get(section, {}) for section in SECTIONS}
+
+    store = ShardedStore(state_dir)
+    journal = Journal(journal_dir) if journal_dir is not None else None
+    manager = PersistenceManager(store, {section: {} for section in SECTIONS}, journal=journal)
+    try:
+        return manager.load()
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def convert(args) -> Dict[str, Dict[str, Any]]:
+    state = load_json_state(args.state, args.journal, args.json)
+    write_snapshot(args.out, state)
+    total = sum(len(records) for records in state.values())
+    print(f"✅ Снимок записан: {args.out} ({total} записей, {args.out.stat().st_size / 1024:.0f} КБ)")
+    return state
+
+
+def _synthetic_state(users: int) -> Dict[str, Dict[str, Any]]:
+    """Синтетическое состояние для бенчмарка"""
+    now = int(time.time())
+    state: Dict[str, Dict[str, Any]] = {name: {} for name in SECTION_KINDS}
+    for user_id in range(1, users + 1):
+        key = str(user_id)
+        state["users_rating"][key] = user_id % 5000
+        record = ActivityRecord(user_id)
+        record.questions_answered = user_id % 300
+        record.correct_answers = user_id % 200
+        record.last_activity_ts = now - user_id % (30 * 86400)
+        state["user_activities"][key] = record.to_dict()
+        state["user_subscriptions"][key] = {
+            "tier": "premium" if user_id % 10 == 0 else "free",
+            "expires_at": None,
+            "transaction_history": [
+                {"product_id": "premium_month", "amount": 299, "purchased_at": "2024-01-01T00:00:00"}
+            ] if user_id % 10 == 0 else []
+        }
+        state["users_completed_topics"][key] = ["topic_1", "topic_2"]
+    return state
+
+
+def _materialize(state: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[Any, Any]]:
+    """JSON-состояние в тот же вид, что даёт load_state() (для честного сравнения)"""
+    result = {}
+    for section, records in state.items():
+        if section == "user_activities":
+            result[section] = {int(key): ActivityRecord.from_dict(value) for key, value in records.items()}
+        elif section in INT_KEYED:
+            result[section] = {int(key): value for key, value in records.items()}
+        else:
+            result[section] = records
+    return result
+
+
+def _timed(func) -> Tuple[float, Any]:
+    started = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def bench(args):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.synthetic:
+            state = _synthetic_state(args.synthetic)
+            json_file = tmp / "state.json"
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            snapshot_path = tmp / "state.snap"
+            write_snapshot(snapshot_path, state)
+
+            def load_json():
+                return _materialize(load_json_state(json_file=json_file))
+            json_size = json_file.stat().st_size
+        else:
+            snapshot_path = args.snapshot
+            if snapshot_path is None:
+                snapshot_path = tmp / "state.snap"
+                write_snapshot(snapshot_path, load_json_state(args.state, args.journal, args.json))
+
+            def load_json():
+                return _materialize(load_json_state(args.state, args.journal, args.json))
+            source = args.json or args.state
+            json_size = source.stat().st_size if source.is_file() else sum(
+                p.stat().st_size for p in source.rglob("*.json"))
+
+        json_ms = min(_timed(load_json)[0] for _ in range(args.repeat))
+        snap_ms = min(_timed(lambda: load_snapshot(snapshot_path))[0] for _ in range(args.repeat))
+        snap_raw_ms = min(_timed(lambda: load_snapshot(snapshot_path, verify=False))[0] for _ in range(args.repeat))
+        snap_size = snapshot_path.stat().st_size
+
+    print(f"JSON:              {json_ms:9.1f} мс  {json_size / 1024:9.0f} КБ")
+    print(f"Снимок:            {snap_ms:9.1f} мс  {snap_size / 1024:9.0f} КБ")
+    print(f"Снимок без CRC:    {snap_raw_ms:9.1f} мс")
+    print(f"Ускорение:         {json_ms / max(snap_ms, 1e-6):9.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Двоичный снимок состояния бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("convert", "bench"):
+        command = commands.add_parser(name)
+        command.add_argument("--state", type=Path, default=Path("data/state"), help="Каталог шардов")
+        command.add_argument("--journal", type=Path, help="Каталог журнала")
+        command.add_argument("--json", type=Path, help="Один JSON-файл с разделами вместо шардов")
+
+    commands.choices["convert"].add_argument("--out", type=Path, default=Path("data/state.snap"))
+    commands.choices["bench"].add_argument("--snapshot", type=Path, help="Готовый снимок")
+    commands.choices["bench"].add_argument("--synthetic", type=int, help="Сгенерировать N пользователей")
+    commands.choices["bench"].add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        convert(args)
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# sqlite_store.py - ХРАНИЛИЩЕ СОСТОЯНИЯ БОТА НА SQLITE
+#
+# Альтернатива шардам persistence.py: каждая запись — строка таблицы,
+# поэтому сохраняются только изменённые записи одной транзакцией.
+# База только хранит состояние: админ-запросы (топ, активные, Premium)
+# отвечают индексы в памяти (leaderboard.py, activity_index.py,
+# subscription_index.py), которые обновляются событиями persistence
+# одинаково для обоих хранилищ.
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from persistence import snapshot_record
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    rating INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS activities (
+    user_id INTEGER PRIMARY KEY,
+    last_activity REAL,
+    first_seen REAL,
+    elo_rating INTEGER,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER PRIMARY KEY,
+    tier TEXT,
+    expires_at REAL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS duels (
+    duel_id TEXT PRIMARY KEY,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS completed_topics (
+    user_id INTEGER NOT NULL,
+    topic_key TEXT NOT NULL,
+    PRIMARY KEY (user_id, topic_key)
+);
+CREATE TABLE IF NOT EXISTS available_topics (
+    user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    topic_key TEXT NOT NULL,
+    PRIMARY KEY (user_id, position)
+);
+
+-- Индексы запросов прежних версий: читателей нет, а запись они замедляют
+DROP INDEX IF EXISTS idx_users_rating;
+DROP INDEX IF EXISTS idx_activities_last_activity;
+DROP INDEX IF EXISTS idx_activities_elo;
+DROP INDEX IF EXISTS idx_subscriptions_expires;
+DROP INDEX IF EXISTS idx_completed_topic;
+"""
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """ISO-строка или datetime в epoch-секунды"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+class SQLiteStore:
+    """Хранилище записей разделов в SQLite"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fresh = not self.path.exists()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # ==============================
+    # ЗАПИСЬ (ИНТЕРФЕЙС ХРАНИЛИЩА PERSISTENCE)
+    # ==============================
+
+    def prepare(self, section: str, keys: Set[Hashable], source: dict) -> List[Tuple[Hashable, Any]]:
+        """Снимок изменённых записей (None — запись удалена)"""
+        snapshot = []
+        for key in keys:
+            value = source.get(key)
+            snapshot.append((key, None if value is None else snapshot_record(value)))
+        return snapshot
+
+    def commit(self, section: str, snapshot: List[Tuple[Hashable, Any]]) -> int:
+        """Запись снимка одной транзакцией (безопасно вызывать из потока)"""
+        writer = getattr(self, f"_write_{section}", None)
+        if writer is None:
+            return 0
+
+        with self._lock, self._conn:
+            for key, data in snapshot:
+                writer(key, data)
+        return len(snapshot)
+
+    def apply(self, section: str, keys: Set[Hashable], source: dict) -> int:
+        """Синхронная запись изменённых и удаление пропавших записей раздела"""
+        return self.commit(section, self.prepare(section, keys, source))
+
+    def _write_users_rating(self, user_id, rating):
+        if rating is None:
+            self._conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        else:
+            self._conn.execute(
+                "INSERT INTO users (user_id, rating) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET rating = excluded.rating",
+                (user_id, rating)
+            )
+
+    def _write_user_activities(self, user_id, data):
+        if data is None:
+            self._conn.execute("DELETE FROM activities WHERE user_id = ?", (user_id,))
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO activities (user_id, last_activity, first_seen, elo_rating, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                user_id,
+                _timestamp(data.get("last_activity")),
+                _timestamp(data.get("first_seen")),
+                data.get("elo_rating"),
+                json.dumps(data, ensure_ascii=False)
+            )
+        )
+
+    def _write_user_subscriptions(self, user_id, data):
+        if data is None:
+            self._conn.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO subscriptions (user_id, tier, expires_at, data) VALUES (?, ?, ?, ?)",
+            (user_id, data.get("tier"), _timestamp(data.get("expires_at")), json.dumps(data, ensure_ascii=False))
+        )
+
+    def _write_active_duels(self, duel_id, data):
+        if data is None:
+            self._conn.execute("DELETE FROM duels WHERE duel_id = ?", (str(duel_id),))
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO duels (duel_id, status, data) VALUES (?, ?, ?)",
+            (str(duel_id), data.get("status"), json.dumps(data, ensure_ascii=False))
+        )
+
+    def _write_users_completed_topics(self, user_id, topics):
+        self._conn.execute("DELETE FROM completed_topics WHERE user_id = ?", (user_id,))
+        if topics:
+            self._conn.executemany(
+                "INSERT INTO completed_topics (user_id, topic_key) VALUES (?, ?)",
+                [(user_id, topic_key) for topic_key in topics]
+            )
+
+    def _write_users_available_topics(self, user_id, topics):
+        self._conn.execute("DELETE FROM available_topics WHERE user_id = ?", (user_id,))
+        if topics:
+            self._conn.executemany(
+                "INSERT INTO available_topics (user_id, position, topic_key) VALUES (?, ?, ?)",
+                [(user_id, i, topic_key) for i, topic_key in enumerate(topics)]
+            )
+
+    # ==============================
+    # ЧТЕНИЕ
+    # ==============================
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def load_section(self, section: str) -> Dict[str, Any]:
+        """Загрузка всех записей раздела (ключи — строки, как в JSON)"""
+        if section == "users_rating":
+            rows = self._query("SELECT user_id, rating FROM users")
+            return {str(user_id): rating for user_id, rating in rows}
+        if section == "user_activities":
+            rows = self._query("SELECT user_id, data FROM activities")
+        elif section == "user_subscriptions":
+            rows = self._query("SELECT user_id, data FROM subscriptions")
+        elif section == "active_duels":
+            rows = self._query("SELECT duel_id, data FROM duels")
+        elif section == "users_completed_topics":
+            records = {}
+            for user_id, topic_key in self._query("SELECT user_id, topic_key FROM completed_topics"):
+                records.setdefault(str(user_id), []).append(topic_key)
+            return records
+        elif section == "users_available_topics":
+            records = {}
+            for user_id, topic_key in self._query(
+                    "SELECT user_id, topic_key FROM available_topics ORDER BY user_id, position"):
+                records.setdefault(str(user_id), []).append(topic_key)
+            return records
+        else:
+            return {}
+        return {str(key): json.loads(data) for key, data in rows}
+
+    def load_record(self, section: str, key: Hashable) -> Optional[Any]:
+        """Чтение одной записи раздела по ключу"""
+        if section == "users_rating":
+            rows = self._query("SELECT rating FROM users WHERE user_id = ?", (key,))
+            return rows[0][0] if rows else None
+        table, column = {
+            "user_activities": ("activities", "user_id"),
+            "user_subscriptions": ("subscriptions", "user_id"),
+            "active_duels": ("duels", "duel_id"),
+        }.get(section, (None, None))
+        if table is None:
+            return None
+        rows = self._query(f"SELECT data FROM {table} WHERE {column} = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def modified_at(self) -> float:
+        """Время последней записи базы (с учётом WAL)"""
+        paths = (self.path, self.path.with_name(self.path.name + "-wal"))
+        return max((path.stat().st_mtime for path in paths if path.exists()), default=0.0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+# stats_columns.py - КОЛОНОЧНОЕ ХРАНЕНИЕ СЧЁТЧИКОВ АКТИВНОСТИ (NUMPY)
+#
+# Счётчики активности всех пользователей зеркалируются в одну матрицу
+# int64: строка — пользователь, столбец — счётчик. Строка обновляется
+# при каждом изменении активности (подписка на persistence), а админ-экраны
+# получают все суммы и число активных за один векторный проход.
+#
+# Изменения bot.py без mark_dirty доходят до строк через отслеживание
+# ActivityRecord (compact.track_changes) и фоновый поиск изменений
+# (change_scan.py). Снимок статистики копирует матрицу в event
+# loop (frozen()) и считает суммы по копии в потоке; активные сегодня и за
+# неделю тоже берутся отсюда — точно по last_activity.
+#
+# NumPy — необязательная зависимость: без неё get_activity_columns()
+# возвращает None, и экраны считают статистику обходом словаря.
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from compact import ActivityRecord, to_epoch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Столбцы матрицы в порядке хранения
+FIELDS = (
+    "lessons_completed",
+    "questions_answered",
+    "correct_answers",
+    "elo_rating",
+    "duels_won",
+    "duels_lost",
+    "duels_drawn",
+    "last_activity",
+)
+LAST_ACTIVITY = FIELDS.index("last_activity")
+
+
+class ActivityColumns:
+    """Матрица счётчиков активности с плотной нумерацией пользователей"""
+
+    def __init__(self, capacity: int = 1024):
+        self.data = np.zeros((capacity, len(FIELDS)), dtype=np.int64)
+        self._rows: Dict[Hashable, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row_for(self, user_id: Hashable) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self.data):
+                grown = np.zeros((len(self.data) * 2, len(FIELDS)), dtype=np.int64)
+                grown[:self._size] = self.data[:self._size]
+                self.data = grown
+            row = self._size
+            self._size += 1
+        self._rows[user_id] = row
+        return row
+
+    @staticmethod
+    def _values(activity: Any) -> tuple:
+        if isinstance(activity, ActivityRecord):
+            last_activity = activity.last_activity_ts
+        else:
+            last_activity = to_epoch(activity.last_activity)
+        return (
+            activity.lessons_completed,
+            activity.questions_answered,
+            activity.correct_answers,
+            activity.elo_rating,
+            activity.duels_won,
+            activity.duels_lost,
+            activity.duels_drawn,
+            last_activity,
+        )
+
+    def update(self, user_id: Hashable, activity: Any):
+        """Обновить строку пользователя (activity=None — удалить)"""
+        if activity is None:
+            row = self._rows.pop(user_id, None)
+            if row is not None:
+                # Обнулённая строка не влияет ни на суммы, ни на число активных
+                self.data[row] = 0
+                self._free.append(row)
+            return
+
+        self.data[self._row_for(user_id)] = self._values(activity)
+
+    def rebuild(self, activities: Dict[Hashable, Any]):
+        """Полное заполнение матрицы из словаря активности"""
+        self.data = np.zeros((max(1024, len(activities)), len(FIELDS)), dtype=np.int64)
+        self._rows = {}
+        self._free = []
+        self._size = 0
+
+        rows = []
+        for user_id, activity in activities.items():
+            self._rows[user_id] = len(rows)
+            rows.append(self._values(activity))
+        if rows:
+            self.data[:len(rows)] = np.array(rows, dtype=np.int64)
+        self._size = len(rows)
+
+    def frozen(self) -> Tuple[Any, int]:
+        """Копия занятых строк и число пользователей — для подсчёта в другом потоке"""
+        return self.data[:self._size].copy(), len(self._rows)
+
+    def aggregates(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Суммы, точность, средний ELO и активные сегодня/за неделю"""
+        return aggregate(self.data[:self._size], len(self._rows), now)
+
+
+def aggregate(block, users: int, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Агрегаты по строкам матрицы (обнулённые строки удалённых не влияют)"""
+    now = now or datetime.now()
+    midnight = int(now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+    week_ago = int(now.timestamp()) - 7 * 24 * 3600
+
+    totals = block.sum(axis=0)
+    last = block[:, LAST_ACTIVITY]
+
+    questions = int(totals[1])
+    correct = int(totals[2])
+    won, lost, drawn = int(totals[4]), int(totals[5]), int(totals[6])
+    return {
+        "users": users,
+        "lessons": int(totals[0]),
+        "questions": questions,
+        "correct": correct,
+        "accuracy": (correct / questions * 100) if questions else 0.0,
+        "avg_elo": int(totals[3]) // max(1, users),
+        "duels_won": won,
+        "duels_lost": lost,
+        "duels_drawn": drawn,
+        "total_duels": (won + lost + drawn) // 2,
+        "active_today": int(np.count_nonzero(last >= midnight)),
+        "active_week": int(np.count_nonzero(last > week_ago)),
+    }
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_columns: Optional[ActivityColumns] = None
+
+
+def get_activity_columns() -> Optional[ActivityColumns]:
+    """Колонки активности, синхронизированные с user_activities (None без numpy)"""
+    global _columns
+    if np is None:
+        return None
+    if _columns is None:
+        from bot import user_activities
+        from persistence import get_persistence
+
+        started = time.perf_counter()
+        _columns = ActivityColumns()
+        _columns.rebuild(user_activities)
+        get_persistence().add_listener("user_activities", _columns.update)
+        logger.info(f"📊 Колонки активности построены: {len(_columns)} пользователей "
+                    f"за {(time.perf_counter() - started) * 1000:.0f} мс")
+    return _columns
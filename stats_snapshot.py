@@ -0,0 +1,280 @@
+# stats_snapshot.py - ОБЩИЙ СНИМОК СТАТИСТИКИ ДЛЯ АДМИН-ЭКРАНОВ
+#
+# admin_stats, admin_premium_stats, admin_duels_detailed_stats и экспорт
+# статистики читают один снимок StatsSnapshot вместо того, чтобы
+# каждый раз пересчитывать пересекающиеся агрегаты.
+#
+# Снимок пересчитывается не чаще раза в STATS_SNAPSHOT_TTL секунд или после
+# invalidate() (действия админа, изменение подписок, перезагрузка тем).
+# Пересчёт выполняется в одном экземпляре: одновременные нажатия «Обновить»
+# ждут один и тот же результат.
+#
+# Индексы меняются в event loop, поэтому читаются там же (collect_snapshot):
+# сначала sync_changes() доносит до них изменения bot.py, затем берутся
+# готовые значения за O(log n), Premium — из индекса подписок, а матрица
+# счётчиков копируется. В потоке остаются только суммы по копии.
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StatsSnapshot(NamedTuple):
+    """Агрегаты бота на момент generated_at"""
+    generated_at: datetime
+
+    # Пользователи
+    total_users: int
+    active_today: int
+    active_week: int
+    active_month: int
+    daily_active: List[Tuple[Any, int]]  # [(день, активных)] за 30 дней
+
+    # Premium
+    premium_users: List[Dict[str, Any]]  # id, tier, expires_at, rating
+    premium_count: int
+    pro_count: int
+    lifetime_count: int
+    total_revenue: int
+    transactions: int
+
+    # Обучение
+    lessons: int
+    questions: int
+    correct: int
+    accuracy: float
+
+    # Дуэли
+    total_duels: int
+    duels_won: int
+    duels_lost: int
+    duels_drawn: int
+    duels_active: int
+    duels_waiting: int
+    duels_in_memory: int
+    avg_elo: int
+    top_elo: List[Tuple[Any, int]]  # [(user_id, ELO)]
+    elo_median: Optional[int]
+    elo_p90: Optional[int]
+    elo_histogram: List[Tuple[int, int]]
+
+    # Контент
+    topics: int
+    topic_questions: int
+
+
+def _activity_totals(records: List[Any]) -> Dict[str, Any]:
+    """Агрегаты активности обходом записей (без numpy)"""
+    questions = sum(a.questions_answered for a in records)
+    correct = sum(a.correct_answers for a in records)
+    won = sum(a.duels_won for a in records)
+    lost = sum(a.duels_lost for a in records)
+    drawn = sum(a.duels_drawn for a in records)
+    return {
+        'lessons': sum(a.lessons_completed for a in records),
+        'questions': questions,
+        'correct': correct,
+        'accuracy': (correct / questions * 100) if questions else 0.0,
+        'avg_elo': sum(a.elo_rating for a in records) // max(1, len(records)),
+        'duels_won': won,
+        'duels_lost': lost,
+        'duels_drawn': drawn,
+        'total_duels': (won + lost + drawn) // 2,
+    }
+
+
+def collect_snapshot(sources: Dict[str, Any]) -> Dict[str, Any]:
+    """Чтение индексов в event loop: готовые значения и копии для потока"""
+    from bot import users_rating, user_activities, active_duels, waiting_duels, TOPICS, SubscriptionTier, DuelStatus
+
+    now = datetime.now()
+    activity_index = sources['activity_index']
+    elo_index = sources['elo_index']
+    ledger = sources['ledger']
+    columns = sources['columns']
+
+    # Только действующие платные подписки, уже упорядоченные по сроку
+    premium_users = []
+    premium_count = pro_count = lifetime_count = 0
+    for user_id, tier, expires_at in sources['subscriptions'].by_expiry(now=now):
+        if tier == SubscriptionTier.PREMIUM:
+            premium_count += 1
+        elif tier == SubscriptionTier.PRO:
+            pro_count += 1
+            if expires_at and (expires_at - now).days > 365:
+                lifetime_count += 1
+        premium_users.append({
+            'id': user_id,
+            'tier': tier.value,
+            'expires_at': expires_at,
+            'rating': users_rating.get(user_id, 0)
+        })
+
+    duels = list(active_duels.values())
+    topics = list(TOPICS.values())
+
+    return {
+        'now': now,
+        # Матрица копируется целиком, без numpy — список живых записей
+        'columns': columns.frozen() if columns else None,
+        'activities': None if columns else list(user_activities.values()),
+        'total_users': len(users_rating),
+        'active_today': activity_index.dau,
+        'active_week': activity_index.wau,
+        'active_month': activity_index.mau,
+        'daily_active': activity_index.daily(30),
+        'premium_users': premium_users,
+        'premium_count': premium_count,
+        'pro_count': pro_count,
+        'lifetime_count': lifetime_count,
+        'total_revenue': ledger.total_revenue,
+        'transactions': ledger.total_count,
+        'duels_active': sum(1 for d in duels if d.status == DuelStatus.IN_PROGRESS),
+        'duels_waiting': len(waiting_duels),
+        'duels_in_memory': len(duels),
+        'top_elo': elo_index.top(5),
+        'elo_median': elo_index.elo_at(50),
+        'elo_p90': elo_index.elo_at(90),
+        'elo_histogram': elo_index.histogram(),
+        'topics': len(topics),
+        'topic_questions': sum(len(t.get('questions', [])) for t in topics),
+    }
+
+
+def compute_snapshot(data: Dict[str, Any]) -> StatsSnapshot:
+    """Суммы по собранным данным; выполняется в потоке и не трогает индексы"""
+    from stats_columns import aggregate
+
+    now = data['now']
+    if data['columns'] is not None:
+        totals = aggregate(*data['columns'], now=now)
+    else:
+        totals = _activity_totals(data['activities'])
+
+    # Матрица даёт точные активные по last_activity, без неё — индекс по дням
+    active_today = totals.get('active_today', data['active_today'])
+    active_week = totals.get('active_week', data['active_week'])
+
+    return StatsSnapshot(
+        generated_at=now,
+        total_users=data['total_users'],
+        active_today=active_today,
+        active_week=active_week,
+        active_month=data['active_month'],
+        daily_active=data['daily_active'],
+        premium_users=data['premium_users'],
+        premium_count=data['premium_count'],
+        pro_count=data['pro_count'],
+        lifetime_count=data['lifetime_count'],
+        total_revenue=data['total_revenue'],
+        transactions=data['transactions'],
+        lessons=totals['lessons'],
+        questions=totals['questions'],
+        correct=totals['correct'],
+        accuracy=totals['accuracy'],
+        total_duels=totals['total_duels'],
+        duels_won=totals['duels_won'],
+        duels_lost=totals['duels_lost'],
+        duels_drawn=totals['duels_drawn'],
+        duels_active=data['duels_active'],
+        duels_waiting=data['duels_waiting'],
+        duels_in_memory=data['duels_in_memory'],
+        avg_elo=totals['avg_elo'],
+        top_elo=data['top_elo'],
+        elo_median=data['elo_median'],
+        elo_p90=data['elo_p90'],
+        elo_histogram=data['elo_histogram'],
+        topics=data['topics'],
+        topic_questions=data['topic_questions'],
+    )
+
+
+class StatsCache:
+    """Снимок статистики с TTL, инвалидацией и однократным пересчётом"""
+
+    def __init__(self, collect: Callable[[], Awaitable[Dict[str, Any]]],
+                 compute: Callable[[Dict[str, Any]], StatsSnapshot], ttl: float = 60.0):
+        self.collect = collect
+        self.compute = compute
+        self.ttl = ttl
+        self._snapshot: Optional[StatsSnapshot] = None
+        self._expires = 0.0
+        self._generation = 0
+        self._pending: Optional[asyncio.Future] = None
+
+    def invalidate(self):
+        """Данные изменились: следующий запрос пересчитает снимок"""
+        self._generation += 1
+        self._expires = 0.0
+
+    @property
+    def fresh(self) -> bool:
+        return self._snapshot is not None and time.monotonic() < self._expires
+
+    async def get(self) -> StatsSnapshot:
+        """Актуальный снимок; пересчёт общий для всех одновременных запросов"""
+        if self.fresh:
+            return self._snapshot
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh())
+        # shield: отмена одного запроса не прерывает общий пересчёт
+        return await asyncio.shield(self._pending)
+
+    async def _refresh(self) -> StatsSnapshot:
+        generation = self._generation
+        started = time.perf_counter()
+        try:
+            data = await self.collect()
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, self.compute, data)
+        finally:
+            self._pending = None
+
+        self._snapshot = snapshot
+        # Если во время пересчёта была инвалидация, снимок отдаём, но не кешируем
+        if generation == self._generation:
+            self._expires = time.monotonic() + self.ttl
+        logger.debug(f"📊 Снимок статистики пересчитан за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return snapshot
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_cache: Optional[StatsCache] = None
+
+
+def get_stats_cache() -> StatsCache:
+    """Кеш снимка статистики, сбрасываемый при изменении подписок"""
+    global _cache
+    if _cache is None:
+        from config import config
+        from activity_index import get_activity_index
+        from elo_index import get_elo_index
+        from ledger import get_ledger
+        from persistence import get_persistence
+        from stats_columns import get_activity_columns
+        from subscription_index import get_subscription_index
+
+        # Индексы создаются и подписываются здесь, в потоке цикла событий
+        sources = {
+            'columns': get_activity_columns(),
+            'activity_index': get_activity_index(),
+            'ledger': get_ledger(),
+            'elo_index': get_elo_index(),
+            'subscriptions': get_subscription_index(),
+        }
+
+        async def collect() -> Dict[str, Any]:
+            # Изменения bot.py без mark_dirty — в индексы до чтения
+            await get_persistence().sync_changes()
+            return collect_snapshot(sources)
+
+        _cache = StatsCache(collect, compute_snapshot, ttl=config.STATS_SNAPSHOT_TTL)
+        get_persistence().add_listener("user_subscriptions", lambda key, value: _cache.invalidate())
+        get_subscription_index().add_expiry_listener(lambda user_ids: _cache.invalidate())
+    return _cache
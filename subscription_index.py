@@ -0,0 +1,272 @@
+# subscription_index.py - ИНДЕКС СРОКОВ ПЛАТНЫХ ПОДПИСОК
+#
+# Действующие платные подписки хранятся в отсортированном по сроку списке
+# (срок, user_id) и во множестве user_id. Индекс обновляется событиями
+# user_subscriptions, поэтому:
+#   • «все Premium-пользователи» — чтение множества, а не обход подписок,
+#   • проверка истечения снимает только подписки с наступившим сроком
+#     (начало списка), не проверяя остальные,
+#   • напоминания о скором окончании — срез списка по диапазону сроков.
+# Бессрочные подписки (expires_at = None) стоят в конце списка.
+#
+# Оплаты в bot.py приходят в индекс через поиск изменений persistence
+# (change_scan.py), поэтому перед рассылкой и экраном Premium вызывается
+# sync_changes(). Фоновая проверка раз в SUBSCRIPTION_SWEEP_INTERVAL:
+#   • переводит подписки с наступившим сроком на бесплатный тариф
+#     (mark_dirty) и сообщает о них подписчикам на истечение — админка
+#     уведомляет пользователей,
+#   • берёт подписки, истекающие в ближайшие SUBSCRIPTION_REMIND_DAYS дней
+#     (expiring_between), и сообщает подписчикам на напоминания. Кому уже
+#     напомнили о текущем сроке, запоминается в файле и после перезапуска
+#     не получает напоминание повторно; продление подписки даёт новый срок
+#     и новое напоминание.
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from sortedcontainers import SortedList
+
+from persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+NEVER = float("inf")
+
+
+class SubscriptionIndex:
+    """Действующие платные подписки, упорядоченные по сроку окончания"""
+
+    def __init__(self, free_tier: Any, subscriptions: Optional[Dict[Hashable, Any]] = None,
+                 touch: Optional[Callable[[Hashable], None]] = None, reminders_path: Optional[Path] = None):
+        self.free_tier = free_tier
+        # Словарь подписок и отметка изменения — для снятия истёкших тарифов
+        self.subscriptions = subscriptions
+        self.touch = touch
+        self.reminders_path = Path(reminders_path) if reminders_path else None
+        self._order = SortedList()  # (срок, user_id)
+        self._expires: Dict[Hashable, float] = {}
+        self._tiers: Dict[Hashable, Any] = {}
+        # Истёкшие, но ещё не обработанные проверкой подписок
+        self._lapsed: Set[Hashable] = set()
+        self._expiry_listeners: List[Callable[[List[Hashable]], None]] = []
+        # Напоминания: срок, о котором уже напомнили, по пользователю
+        self._reminded: Dict[Hashable, float] = {}
+        self._reminder_listeners: List[Callable[[List[Tuple[Hashable, datetime]]], None]] = []
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        self._advance()
+        return len(self._expires)
+
+    def _remove(self, user_id: Hashable):
+        expires = self._expires.pop(user_id, None)
+        if expires is not None:
+            self._order.remove((expires, user_id))
+            del self._tiers[user_id]
+
+    def on_subscription(self, user_id: Hashable, sub: Any):
+        """Обработчик изменений user_subscriptions (None — подписка удалена)"""
+        self._remove(user_id)
+        self._lapsed.discard(user_id)
+
+        if sub is not None and sub.is_active() and sub.tier != self.free_tier:
+            expires = sub.expires_at.timestamp() if sub.expires_at else NEVER
+            self._expires[user_id] = expires
+            self._tiers[user_id] = sub.tier
+            self._order.add((expires, user_id))
+        elif sub is not None and sub.tier != self.free_tier:
+            # Срок прошёл, а тариф ещё не снят (например, бот был выключен)
+            self._lapsed.add(user_id)
+
+    def rebuild(self, subscriptions: Dict[Hashable, Any]):
+        """Полная сборка из user_subscriptions"""
+        self._order = SortedList()
+        self._expires = {}
+        self._tiers = {}
+        self._lapsed = set()
+        for user_id, sub in subscriptions.items():
+            self.on_subscription(user_id, sub)
+
+    def _advance(self, now: Optional[datetime] = None):
+        """Перенести подписки с наступившим сроком в истёкшие"""
+        now_ts = (now or datetime.now()).timestamp()
+        while self._order and self._order[0][0] <= now_ts:
+            expires, user_id = self._order.pop(0)
+            del self._expires[user_id]
+            del self._tiers[user_id]
+            self._lapsed.add(user_id)
+
+    # ==============================
+    # ПРОВЕРКА СРОКОВ
+    # ==============================
+
+    def add_expiry_listener(self, callback: Callable[[List[Hashable]], None]):
+        """Подписка на истечение подписок: callback(user_ids)"""
+        self._expiry_listeners.append(callback)
+
+    def add_reminder_listener(self, callback: Callable[[List[Tuple[Hashable, datetime]]], None]):
+        """Подписка на напоминания о скором окончании: callback([(user_id, срок)])"""
+        self._reminder_listeners.append(callback)
+
+    def _emit(self, listeners: List[Callable[[Any], None]], items: List[Any]):
+        for callback in listeners:
+            try:
+                callback(items)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика подписок: {e}")
+
+    def _downgrade(self, user_id: Hashable) -> bool:
+        """Перевести истёкшую подписку на бесплатный тариф"""
+        sub = self.subscriptions.get(user_id)
+        if sub is None or sub.tier == self.free_tier or sub.is_active():
+            return False
+        sub.tier = self.free_tier
+        if self.touch:
+            self.touch(user_id)
+        return True
+
+    def sweep(self, now: Optional[datetime] = None) -> List[Hashable]:
+        """Снять истёкшие подписки и сообщить о них подписчикам"""
+        now = now or datetime.now()
+        expired = self.take_expired(now)
+        if self.subscriptions is not None:
+            expired = [user_id for user_id in expired if self._downgrade(user_id)]
+        if expired:
+            logger.info(f"⌛ Истекло подписок: {len(expired)}")
+            self._emit(self._expiry_listeners, expired)
+        return expired
+
+    def remind(self, ahead: timedelta, now: Optional[datetime] = None) -> List[Tuple[Hashable, datetime]]:
+        """Подписки, истекающие в ближайшие ahead, о которых ещё не напоминали"""
+        now = now or datetime.now()
+        self._advance(now)
+        due = [
+            (user_id, expires) for user_id, expires in self.expiring_between(now, now + ahead)
+            if self._reminded.get(user_id) != expires.timestamp()
+        ]
+        # Прошедшие сроки больше не нужны
+        now_ts = now.timestamp()
+        stale = [user_id for user_id, expires in self._reminded.items() if expires <= now_ts]
+        for user_id in stale:
+            del self._reminded[user_id]
+        for user_id, expires in due:
+            self._reminded[user_id] = expires.timestamp()
+
+        if due or stale:
+            self.save_reminders()
+        if due:
+            logger.info(f"🔔 Напоминаний об окончании подписки: {len(due)}")
+            self._emit(self._reminder_listeners, due)
+        return due
+
+    def start_sweeper(self, interval: float, remind_ahead: Optional[timedelta] = None):
+        """Фоновая проверка сроков в текущем event loop"""
+        if self._sweeper is None and interval > 0:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop(interval, remind_ahead))
+
+    async def _sweep_loop(self, interval: float, remind_ahead: Optional[timedelta]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sweep()
+                if remind_ahead:
+                    self.remind(remind_ahead)
+            except Exception as e:
+                logger.error(f"❌ Ошибка проверки сроков подписок: {e}")
+
+    # ==============================
+    # СОХРАНЕНИЕ НАПОМИНАНИЙ
+    # ==============================
+
+    def load_reminders(self) -> bool:
+        if self.reminders_path is None or not self.reminders_path.exists():
+            return False
+        with open(self.reminders_path, encoding="utf-8") as f:
+            self._reminded = {user_id: expires for user_id, expires in json.load(f)}
+        return True
+
+    def save_reminders(self):
+        if self.reminders_path is None:
+            return
+        try:
+            write_json_atomic(self.reminders_path, [[user_id, expires] for user_id, expires in self._reminded.items()])
+        except OSError as e:
+            logger.error(f"❌ Ошибка сохранения напоминаний о подписках: {e}")
+
+    # ==============================
+    # ЗАПРОСЫ
+    # ==============================
+
+    def take_expired(self, now: Optional[datetime] = None) -> List[Hashable]:
+        """Подписки, истёкшие с прошлого вызова (для проверки по расписанию)"""
+        self._advance(now)
+        expired = list(self._lapsed)
+        self._lapsed.clear()
+        return expired
+
+    def premium_ids(self, now: Optional[datetime] = None) -> Set[Hashable]:
+        """Пользователи с действующей платной подпиской"""
+        self._advance(now)
+        return set(self._expires)
+
+    def is_premium(self, user_id: Hashable, now: Optional[datetime] = None) -> bool:
+        self._advance(now)
+        return user_id in self._expires
+
+    def tier_of(self, user_id: Hashable) -> Optional[Any]:
+        return self._tiers.get(user_id)
+
+    def by_expiry(self, limit: Optional[int] = None,
+                  now: Optional[datetime] = None) -> List[Tuple[Hashable, Any, Optional[datetime]]]:
+        """Подписки по возрастанию срока: [(user_id, тариф, срок или None)]"""
+        self._advance(now)
+        return [
+            (user_id, self._tiers[user_id], datetime.fromtimestamp(expires) if expires != NEVER else None)
+            for expires, user_id in self._order.islice(0, limit)
+        ]
+
+    def expiring_between(self, start: datetime, end: datetime) -> List[Tuple[Hashable, datetime]]:
+        """Подписки со сроком в полуинтервале [start, end) — для напоминаний"""
+        return [
+            (user_id, datetime.fromtimestamp(expires))
+            for expires, user_id in self._order.irange(
+                (start.timestamp(), float("-inf")), (end.timestamp(), float("-inf")), inclusive=(True, False)
+            )
+        ]
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_index: Optional[SubscriptionIndex] = None
+
+
+def get_subscription_index() -> SubscriptionIndex:
+    """Индекс подписок, подписанный на изменения user_subscriptions"""
+    global _index
+    if _index is None:
+        from bot import SubscriptionTier, user_subscriptions
+        from config import config
+        from persistence import get_persistence
+
+        persistence = get_persistence()
+        _index = SubscriptionIndex(
+            SubscriptionTier.FREE,
+            user_subscriptions,
+            touch=lambda user_id: persistence.mark_dirty("user_subscriptions", user_id),
+            reminders_path=config.DATA_DIR / "subscription_reminders.json"
+        )
+        _index.rebuild(user_subscriptions)
+        _index.load_reminders()
+        persistence.add_listener("user_subscriptions", _index.on_subscription)
+        try:
+            _index.start_sweeper(config.SUBSCRIPTION_SWEEP_INTERVAL, timedelta(days=config.SUBSCRIPTION_REMIND_DAYS))
+        except RuntimeError:
+            # Вне event loop (скрипты) сроки проверяются только при чтении
+            pass
+    return _index
@@ -0,0 +1,10 @@
+# conftest.py - ОБЩИЕ НАСТРОЙКИ ТЕСТОВ
+#
+# Модули бота лежат в корне репозитория, тесты импортируют их напрямую.
+# bot.py в тестах не нужен: проверяются классы модулей без глобальных
+# экземпляров get_xxx().
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,53 @@
+# test_activity_index.py - ИНДЕКС АКТИВНОСТИ ПО ДНЯМ
+
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from activity_index import ActivityIndex
+
+TODAY = date.today()
+
+
+def at(days_ago):
+    return datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time()).replace(hour=12)
+
+
+def activity(first_seen, last_activity):
+    return SimpleNamespace(first_seen=first_seen, last_activity=last_activity)
+
+
+def test_seed_marks_first_seen_and_last_activity():
+    index = ActivityIndex()
+    index.seed({
+        1: activity(at(20), at(0)),
+        2: activity(at(3), at(3)),
+        3: activity(None, None),
+    })
+
+    assert index.users_between(TODAY - timedelta(days=20), TODAY - timedelta(days=20)) == [1]
+    assert index.active_last(1, TODAY) == 1
+    assert index.active_last(7, TODAY) == 2
+    assert index.active_last(30, TODAY) == 2
+    # Дни между first_seen и last_activity неизвестны
+    assert index.active_between(TODAY - timedelta(days=19), TODAY - timedelta(days=4)) == 0
+
+
+def test_new_user_event_marks_first_seen_day():
+    index = ActivityIndex()
+    index.on_activity(1, activity(at(2), at(0)))
+    # У известного пользователя first_seen больше не отмечается
+    index.on_activity(1, activity(at(5), at(1)))
+
+    assert [TODAY - day for day, count in index.daily(6, TODAY) if count] == [timedelta(days=d) for d in (2, 1, 0)]
+
+
+def test_daily_and_persistence(tmp_path):
+    index = ActivityIndex(tmp_path / "activity.json")
+    for user_id in range(5):
+        index.record(user_id, at(user_id % 2))
+    index.save()
+
+    loaded = ActivityIndex(tmp_path / "activity.json")
+    assert loaded.load()
+    assert loaded.daily(3, TODAY) == [(TODAY - timedelta(days=2), 0), (TODAY - timedelta(days=1), 2), (TODAY, 3)]
+    assert sorted(loaded.users_between(TODAY, TODAY)) == [0, 2, 4]
@@ -0,0 +1,83 @@
+# test_change_log.py - ЖУРНАЛ ИЗМЕНЕНИЙ ДЛЯ ДЕЛЬТА-ЭКСПОРТА
+
+from change_log import KEEP_MARKS, ChangeLog
+
+
+def test_delta_after_mark():
+    log = ChangeLog()
+    full = log.mark("full")
+
+    log.on_rating(2, 25)
+    log.on_change("user_activities", 3, object())
+
+    assert log.changed_since(full.seq) == [2, 3]
+    assert log.count_since(full.seq) == 2
+    assert log.last_change(1) == 0
+
+    delta = log.mark("delta")
+    log.on_rating(2, 26)
+    assert log.changed_since(delta.seq) == [2]
+    assert log.changed_since(full.seq) == [3, 2]
+
+
+def test_deleted_user():
+    log = ChangeLog()
+    mark = log.mark("full")
+
+    log.on_rating(1, 11)
+    log.on_rating(1, None)
+    # Удаление записи активности — не удаление пользователя
+    log.on_change("user_activities", 2, None)
+
+    assert log.changed_since(mark.seq) == []
+    assert log.deleted_since(mark.seq) == [1]
+
+
+def test_reconcile_marks_restored_users(tmp_path):
+    path = tmp_path / "change_log.json"
+    log = ChangeLog(path)
+    mark = log.mark("full")
+    log.save()
+
+    # После сбоя persistence восстановил из журнала записи пользователей 1 и 2;
+    # пользователя 1 в рейтинге уже нет
+    restarted = ChangeLog(path)
+    assert restarted.load()
+    assert restarted.reconcile({1, 2}, {2: 20, 3: 30}) == 2
+    assert restarted.changed_since(mark.seq) == [2]
+    assert restarted.deleted_since(mark.seq) == [1]
+
+
+def test_changes_older_than_oldest_mark_are_pruned():
+    log = ChangeLog()
+    log.on_rating(1, 10)
+    log.on_rating(2, None)
+    first = log.mark("full")
+    log.on_rating(3, 30)
+
+    for _ in range(KEEP_MARKS - 1):
+        log.mark("delta")
+    # first ещё хранится: всё, что до неё, уже не нужно
+    assert log.marks[0] == first
+    assert log.last_change(1) == 0 and log.deleted_since(0) == []
+    assert log.changed_since(first.seq) == [3]
+
+    log.mark("delta")
+    assert log.get_mark(first.number) is None
+    assert log.changed_since(0) == []
+
+
+def test_marks_and_changes_survive_restart(tmp_path):
+    path = tmp_path / "change_log.json"
+    log = ChangeLog(path)
+    first = log.mark("full")
+    log.on_rating(5, 50)
+    log.on_rating(6, None)
+    log.save()
+
+    restarted = ChangeLog(path)
+    restarted.load()
+    assert restarted.get_mark(first.number) == first
+    assert restarted.changed_since(first.seq) == [5]
+    assert restarted.deleted_since(first.seq) == [6]
+    assert restarted.mark("delta").number == first.number + 1
@@ -0,0 +1,126 @@
+# test_change_scan.py - ИЗМЕНЕНИЯ В ОБХОД MARK_DIRTY: ОТСЛЕЖИВАНИЕ И ФОНОВЫЙ ОБХОД
+
+import asyncio
+
+import pytest
+
+from change_scan import ChangeScanner, fingerprint
+from compact import ActivityRecord, track_changes, untrack_changes
+from persistence import PersistenceManager, ShardedStore
+
+
+class Subscription:
+    def __init__(self, tier, history=None):
+        self.tier = tier
+        self.transaction_history = history or []
+
+    def to_dict(self):
+        return {"tier": self.tier, "transaction_history": list(self.transaction_history)}
+
+
+def make_manager(tmp_path, **sources):
+    for section in ("users_rating", "user_activities", "user_subscriptions"):
+        sources.setdefault(section, {})
+    return PersistenceManager(ShardedStore(tmp_path / "state", shards=4), sources)
+
+
+@pytest.fixture
+def tracking():
+    yield
+    untrack_changes()
+
+
+def test_fingerprint_sees_fields_and_container_length():
+    sub = Subscription("free")
+    before = fingerprint(sub)
+    assert fingerprint(sub) == before
+
+    sub.transaction_history.append({"amount": 100})
+    after = fingerprint(sub)
+    assert after != before
+
+    sub.tier = "premium"
+    assert fingerprint(sub) != after
+    assert fingerprint(["a", "b"]) != fingerprint(["a", "c"])
+
+
+def test_scan_finds_changed_and_deleted_records(tmp_path):
+    ratings = {1: 10, 2: 20}
+    subs = {1: Subscription("free")}
+    manager = make_manager(tmp_path, users_rating=ratings, user_subscriptions=subs)
+    scanner = manager.scanner = ChangeScanner(manager, ["users_rating", "user_subscriptions"], batch=1)
+
+    events = []
+    manager.add_listener("users_rating", lambda key, value: events.append((key, value)))
+
+    async def run():
+        assert await scanner.scan() == 0  # первый обход только запоминает
+        ratings[1] = 15
+        del ratings[2]
+        ratings[3] = 30
+        subs[1].tier = "premium"
+        return await scanner.scan()
+
+    assert asyncio.run(run()) == 4
+    assert sorted(events, key=lambda e: e[0]) == [(1, 15), (2, None), (3, 30)]
+    assert manager.pending == 4
+
+
+def test_mark_dirty_updates_fingerprint(tmp_path):
+    ratings = {1: 10}
+    manager = make_manager(tmp_path, users_rating=ratings)
+    scanner = manager.scanner = ChangeScanner(manager, ["users_rating"])
+
+    async def run():
+        await scanner.scan()
+        ratings[1] = 11
+        manager.mark_dirty("users_rating", 1)
+        return await scanner.scan()
+
+    # Изменение уже помечено — обход не находит его повторно
+    assert asyncio.run(run()) == 0
+
+
+def test_tracked_record_reports_itself_once(tmp_path, tracking):
+    record = ActivityRecord(7)
+    activities = {7: record}
+    manager = make_manager(tmp_path, user_activities=activities)
+    events = []
+    manager.add_listener("user_activities", lambda key, value: events.append(key))
+    track_changes(lambda r: manager.touch_later("user_activities", r.user_id))
+
+    async def run():
+        record.questions_answered += 1
+        record.correct_answers += 1
+        record.touch()
+        await asyncio.sleep(0)  # разбор затронутых ключей в event loop
+        return await manager.sync_changes()
+
+    assert asyncio.run(run()) == 0
+    assert events == [7]
+    assert manager.pending == 1
+
+
+def test_sync_changes_drains_outside_loop(tmp_path, tracking):
+    record = ActivityRecord(3)
+    manager = make_manager(tmp_path, user_activities={3: record})
+    track_changes(lambda r: manager.touch_later("user_activities", r.user_id))
+
+    record.elo_rating = 1100
+    assert asyncio.run(manager.sync_changes()) == 1
+    assert asyncio.run(manager.sync_changes()) == 0
+
+
+def test_scanner_skips_tracked_records_but_sees_deletion(tmp_path):
+    activities = {1: ActivityRecord(1), 2: ActivityRecord(2)}
+    manager = make_manager(tmp_path, user_activities=activities)
+    scanner = manager.scanner = ChangeScanner(manager, ["user_activities"], tracked=(ActivityRecord,))
+
+    async def run():
+        await scanner.scan()
+        activities[1].lessons_completed = 5  # без отслеживания обход его не ищет
+        del activities[2]
+        return await scanner.scan()
+
+    assert asyncio.run(run()) == 1
+    assert manager.pending == 1
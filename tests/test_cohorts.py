@@ -0,0 +1,72 @@
+# test_cohorts.py - КОГОРТЫ ПО НЕДЕЛЕ ПРИХОДА
+
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from activity_index import ActivityIndex
+from cohorts import CohortEngine
+
+TODAY = date(2024, 3, 20)  # Среда, неделя с 18 марта
+
+
+def activity(first_seen, lessons=0, duels=0):
+    return SimpleNamespace(first_seen=datetime.combine(first_seen, datetime.min.time()),
+                           lessons_completed=lessons, duels_won=duels, duels_lost=0, duels_drawn=0)
+
+
+def paid(amount):
+    return SimpleNamespace(transaction_history=[{"amount": amount}])
+
+
+def make_engine():
+    index = ActivityIndex()
+    for user_id, days in {1: (5, 12, 19), 2: (4,), 3: (11, 19)}.items():
+        for day in days:
+            index.record(user_id, datetime(2024, 3, day, 12))
+
+    engine = CohortEngine(index)
+    engine.rebuild(
+        {1: activity(date(2024, 3, 4), lessons=2), 2: activity(date(2024, 3, 6), duels=1),
+         3: activity(date(2024, 3, 11), lessons=1)},
+        {1: paid(100), 3: paid(0)}
+    )
+    return index, engine
+
+
+def test_report_retention_and_conversions():
+    _, engine = make_engine()
+    first, second = engine.report(today=TODAY)
+
+    assert (first.week, first.size) == (date(2024, 3, 4), 2)
+    assert first.retention == [100.0, 50.0, 50.0]
+    assert (first.lessons, first.duels, first.premium) == (50.0, 50.0, 50.0)
+    assert (second.week, second.size, second.retention) == (date(2024, 3, 11), 1, [100.0, 100.0])
+    assert second.premium == 0.0
+    assert [row.week for row in engine.report(limit=1, today=TODAY)] == [date(2024, 3, 11)]
+
+
+def test_current_week_is_live_and_finished_weeks_are_cached():
+    index, engine = make_engine()
+    engine.report(today=TODAY)
+
+    # Активность текущей недели видна сразу
+    index.record(2, datetime(2024, 3, 20, 12))
+    assert engine.report(today=TODAY)[0].retention == [100.0, 50.0, 100.0]
+
+    # Неделя завершилась: её столбец берётся из кеша
+    first, _ = engine.report(today=date(2024, 3, 27))
+    assert first.retention == [100.0, 50.0, 100.0, 0.0]
+
+
+def test_events_move_users_and_flags():
+    _, engine = make_engine()
+    engine.on_activity(4, activity(date(2024, 3, 19), duels=1))
+    engine.on_subscription(3, paid(50))
+    engine.on_activity(2, None)
+
+    rows = engine.report(today=TODAY)
+    assert [(row.week, row.size) for row in rows] == [
+        (date(2024, 3, 4), 1), (date(2024, 3, 11), 1), (date(2024, 3, 18), 1)
+    ]
+    assert rows[1].premium == 100.0 and rows[2].duels == 100.0
+    assert engine.to_csv(today=TODAY).splitlines()[0].endswith("Week 0,Week 1,Week 2")
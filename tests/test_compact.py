@@ -0,0 +1,66 @@
+# test_compact.py - КОМПАКТНАЯ ЗАПИСЬ АКТИВНОСТИ
+
+from datetime import datetime
+
+from compact import ActivityRecord, compact_activities
+
+
+def make_record(user_id, elo=1000, banned=False):
+    record = ActivityRecord(user_id, elo_rating=elo)
+    record.lessons_completed = 3
+    record.correct_answers = 7
+    record.first_seen = datetime(2024, 1, 2, 3, 4, 5)
+    record.last_activity = datetime(2024, 2, 3, 4, 5, 6)
+    if banned:
+        record.is_banned = True
+        record.ban_reason = "спам"
+        record.banned_at = datetime(2024, 3, 1, 12, 0)
+    return record
+
+
+def test_activity_record_dict_round_trip_with_ban():
+    record = make_record(5, banned=True)
+    restored = ActivityRecord.from_dict(record.to_dict())
+
+    assert restored.to_dict() == record.to_dict()
+    assert restored.is_banned is True
+    assert restored.ban_reason == "спам"
+    assert restored.banned_at == datetime(2024, 3, 1, 12, 0)
+
+
+def test_activity_record_without_ban_has_no_ban_attributes():
+    restored = ActivityRecord.from_dict(make_record(5).to_dict())
+
+    assert not hasattr(restored, "is_banned")
+    assert not hasattr(restored, "banned_at")
+    assert "is_banned" not in restored.to_dict()
+
+
+def test_activity_record_none_dates():
+    data = make_record(5).to_dict()
+    data["first_seen"] = None
+
+    restored = ActivityRecord.from_dict(data)
+    assert restored.first_seen is None
+    assert restored.to_dict()["first_seen"] is None
+
+
+class UserActivity:
+    def __init__(self, lessons):
+        self.lessons_completed = lessons
+        self.elo_rating = 1100
+        self.first_seen = datetime(2024, 1, 1)
+        self.last_activity = datetime(2024, 1, 5)
+
+
+def test_compact_activities_replaces_objects_in_place():
+    kept = make_record(0)
+    activities = {1: UserActivity(4), 2: kept}
+
+    assert compact_activities(activities) == 1
+    assert isinstance(activities[1], ActivityRecord)
+    assert activities[1].lessons_completed == 4
+    assert activities[1].last_activity == datetime(2024, 1, 5)
+    # Запись с неверным user_id исправлена, но не заменена
+    assert activities[2] is kept and kept.user_id == 2
+    assert compact_activities(activities) == 0
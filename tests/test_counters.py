@@ -0,0 +1,68 @@
+# test_counters.py - СЧЁТЧИКИ АДМИН-ПАНЕЛИ
+
+from datetime import date, datetime, timedelta
+
+from compact import ActivityRecord
+from counters import DashboardCounters
+
+
+class Clock:
+    def __init__(self, today):
+        self.today = today
+
+    def __call__(self):
+        return self.today
+
+
+class Duel:
+    def __init__(self, status):
+        self.status = status
+
+
+def active_on(day, user_id=1):
+    record = ActivityRecord(user_id)
+    record.last_activity = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    return record
+
+
+def test_active_counts_follow_events():
+    today = date(2024, 5, 10)
+    counters = DashboardCounters("in_progress", clock=Clock(today))
+    counters.rebuild({
+        1: active_on(today, 1),
+        2: active_on(today - timedelta(days=3), 2),
+        3: active_on(today - timedelta(days=30), 3),
+    }, {})
+
+    assert (counters.active_today, counters.active_week) == (1, 2)
+
+    counters.on_activity(2, active_on(today, 2))
+    counters.on_activity(3, active_on(today, 3))
+    counters.on_activity(1, None)
+    assert (counters.active_today, counters.active_week) == (2, 2)
+
+
+def test_daily_rollover_drops_old_days():
+    clock = Clock(date(2024, 5, 10))
+    counters = DashboardCounters("in_progress", clock=clock)
+    counters.rebuild({1: active_on(clock.today, 1), 2: active_on(clock.today - timedelta(days=6), 2)}, {})
+    assert (counters.active_today, counters.active_week) == (1, 2)
+
+    clock.today += timedelta(days=1)
+    assert (counters.active_today, counters.active_week) == (0, 1)
+    # Пользователь выпавшего дня снова активен — считается один раз
+    counters.on_activity(2, active_on(clock.today, 2))
+    assert (counters.active_today, counters.active_week) == (1, 2)
+
+    clock.today += timedelta(days=7)
+    assert (counters.active_today, counters.active_week) == (0, 0)
+
+
+def test_duel_status_counter():
+    counters = DashboardCounters("in_progress")
+    counters.rebuild({}, {"a": Duel("waiting"), "b": Duel("in_progress")})
+    assert counters.active_duels == 1
+
+    counters.on_duel("a", Duel("in_progress"))
+    counters.on_duel("b", None)
+    assert counters.active_duels == 1
@@ -0,0 +1,42 @@
+# test_elo_index.py - ИНДЕКС ELO
+
+from types import SimpleNamespace
+
+from elo_index import BUCKET, EloIndex
+
+
+def make_elo_index():
+    index = EloIndex()
+    index.rebuild({user_id: SimpleNamespace(elo_rating=elo) for user_id, elo in
+                   {1: 1000, 2: 1100, 3: 1200, 4: 1300, 5: 1500}.items()})
+    return index
+
+
+def test_elo_top_and_percentiles():
+    index = make_elo_index()
+
+    assert index.top(2) == [(5, 1500), (4, 1300)]
+    assert index.top(0) == []
+    assert index.percentile(1200) == 40.0
+    assert index.percentile_of(1) == 0.0
+    assert index.percentile_of(99) is None
+    assert index.elo_at(50) == 1200
+    assert index.elo_at(100) == 1500
+
+
+def test_elo_opponents_closest_first():
+    index = make_elo_index()
+
+    assert index.opponents_for(3, 150) == [(2, 1100), (4, 1300)]
+    assert index.within(1250, 40) == []
+    assert index.opponents_for(99, 100) == []
+
+
+def test_elo_updates_and_histogram():
+    index = make_elo_index()
+    index.on_activity(5, SimpleNamespace(elo_rating=1010))
+    index.on_activity(1, None)
+
+    assert len(index) == 4
+    assert index.top(1) == [(4, 1300)]
+    assert index.histogram() == [(elo // BUCKET * BUCKET, 1) for elo in (1010, 1100, 1200, 1300)]
@@ -0,0 +1,81 @@
+# test_export_jobs.py - ОЧЕРЕДЬ ЗАДАНИЙ ЭКСПОРТА
+
+import asyncio
+from types import SimpleNamespace
+
+from export_jobs import DONE, FAILED, ExportQueue
+from exports import write_csv
+
+
+class FakeBot:
+    def __init__(self, fail_send=False):
+        self.fail_send = fail_send
+        self.documents = []
+        self.next_id = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.fail_send:
+            raise RuntimeError("chat not found")
+        self.next_id += 1
+        return SimpleNamespace(message_id=self.next_id)
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.documents.append(document)
+        return SimpleNamespace(document=SimpleNamespace(file_id=f"file{len(self.documents)}"))
+
+
+async def finish(queue):
+    await queue._queue.join()
+    for task in queue._tasks:
+        task.cancel()
+
+
+def test_failed_status_message_fails_job_without_raising():
+    async def run():
+        queue = ExportQueue(workers=1)
+        built = []
+        job = await queue.submit(FakeBot(fail_send=True), 1, "Тест", "t.csv", lambda export, job: built.append(1))
+        await finish(queue)
+        return job, built
+
+    job, built = asyncio.run(run())
+    assert job.status == FAILED and job.error == "chat not found"
+    assert built == []
+
+
+def test_full_queue_returns_none():
+    async def run():
+        queue = ExportQueue(queue_size=2)
+        # Очередь без воркеров: задания не забираются
+        queue._queue = asyncio.Queue(maxsize=2)
+        bot = FakeBot()
+        jobs = await asyncio.gather(*(queue.submit(bot, 1, "Тест", "t.csv", None) for _ in range(3)))
+        return [job and job.id for job in jobs]
+
+    assert asyncio.run(run()) == [1, 2, None]
+
+
+def test_builder_fetches_chunks_on_loop():
+    async def run():
+        queue = ExportQueue(workers=1)
+        loop_thread = []
+
+        def chunk(ids):
+            loop_thread.append(asyncio.get_running_loop() is not None)
+            return [[i, i * 10] for i in ids]
+
+        def build(export, job):
+            rows = (row for start in range(0, 5, 2) for row in job.call_in_loop(chunk, range(start, min(start + 2, 5))))
+            write_csv(export, ["id", "value"], rows)
+
+        bot = FakeBot()
+        job = await queue.submit(bot, 1, "Тест", "t.csv", build)
+        await finish(queue)
+        return job, loop_thread
+
+    job, loop_thread = asyncio.run(run())
+    assert job.status == DONE and job.rows == 5
+    assert loop_thread == [True, True, True]
@@ -0,0 +1,132 @@
+# test_exports.py - ПОТОКОВЫЙ ЭКСПОРТ: ЧАСТИ, GZIP И КУРСОР NDJSON
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+
+from exports import CONCAT, SpooledExport, write_csv, write_json, write_json_items, write_ndjson
+
+
+def read_part(part) -> bytes:
+    part.rewind()
+    data = part.read()
+    return gzip.decompress(data) if part.compressed else data
+
+
+def records(count, start=1):
+    for key in range(start, start + count):
+        yield key, {"id": key, "name": f"user{key}" * 5}
+
+
+def test_small_csv_is_single_plain_part():
+    with SpooledExport("users.csv") as export:
+        write_csv(export, ["id", "name"], [[1, "Анна"], [2, "Пётр"]])
+        export.finish()
+
+        assert export.filename == "users.csv"
+        assert export.rows == 2 and export.complete
+        assert read_part(export.part).decode("utf-8").splitlines() == ["id,name", "1,Анна", "2,Пётр"]
+
+
+def test_csv_rows_from_generator_with_empty_dates():
+    rows = ([i, ""] for i in range(25))
+
+    with SpooledExport("users.csv") as export:
+        write_csv(export, ["id", "last_activity"], rows, chunk_rows=10)
+        export.finish()
+
+        lines = read_part(export.part).decode("utf-8").splitlines()
+        assert export.rows == 25 and len(lines) == 26
+        # Пустая дата (None у ActivityRecord) — пустая ячейка
+        assert lines[1] == "0,"
+
+
+def test_json_items_match_whole_document():
+    data = {str(i): {"rating": i, "topics": ["a", "b"]} for i in range(300)}
+    with SpooledExport("users.json", part_size=4096) as export:
+        write_json_items(export, data.items(), chunk_rows=10)
+        export.finish()
+
+        assert len(export.parts) > 1 and export.rows == 300
+        text = b"".join(read_part(part) for part in export.parts).decode("utf-8")
+        assert text == json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def test_ndjson_limit_sets_cursor_and_resumes():
+    with SpooledExport("users.ndjson") as export:
+        write_ndjson(export, records(25), batch_size=4, limit=10)
+        assert export.rows == 10 and export.cursor == 10
+        assert not export.complete
+
+    with SpooledExport("users.ndjson") as export:
+        write_ndjson(export, records(15, start=11), batch_size=4, limit=10)
+        assert (export.rows, export.cursor, export.complete) == (10, 20, False)
+
+    with SpooledExport("users.ndjson") as export:
+        write_ndjson(export, records(5, start=21), batch_size=4, limit=10)
+        export.finish()
+        assert (export.rows, export.cursor, export.complete) == (5, 25, True)
+        assert [json.loads(line)["id"] for line in read_part(export.part).decode("utf-8").splitlines()] == [
+            21, 22, 23, 24, 25
+        ]
+
+
+def test_ndjson_exactly_limit_is_complete():
+    with SpooledExport("users.ndjson") as export:
+        write_ndjson(export, records(10), batch_size=4, limit=10)
+        assert (export.rows, export.cursor, export.complete) == (10, 10, True)
+
+
+def test_csv_parts_each_have_header():
+    rows = [[i, "x" * 50] for i in range(200)]
+    with SpooledExport("users.csv", part_size=2000) as export:
+        write_csv(export, ["id", "name"], rows, chunk_rows=10)
+        export.finish()
+
+        assert len(export.parts) > 1
+        assert export.parts[0].filename == "users_part01.csv"
+
+        collected = []
+        for part in export.parts:
+            lines = list(csv.reader(io.StringIO(read_part(part).decode("utf-8"))))
+            assert lines[0] == ["id", "name"]
+            assert part.rows == len(lines) - 1
+            collected.extend(int(line[0]) for line in lines[1:])
+        assert collected == list(range(200))
+        assert sum(part.rows for part in export.parts) == export.rows == 200
+
+
+def test_part_switches_to_gzip_after_compress_size():
+    with SpooledExport("users.ndjson", compress_size=1000) as export:
+        write_ndjson(export, records(100), batch_size=5)
+        export.finish()
+
+        part = export.part
+        assert part.compressed and export.filename == "users.ndjson.gz"
+        lines = read_part(part).decode("utf-8").splitlines()
+        assert [json.loads(line)["id"] for line in lines] == list(range(1, 101))
+
+
+def test_manifest_checksums_match_parts():
+    with SpooledExport("users.ndjson", part_size=1500) as export:
+        write_ndjson(export, records(100), batch_size=5)
+        export.finish()
+        manifest = export.manifest()
+
+        assert manifest["rows"] == 100 and len(manifest["parts"]) == len(export.parts) > 1
+        for item, part in zip(manifest["parts"], export.parts):
+            part.rewind()
+            assert item["sha256"] == hashlib.sha256(part.read()).hexdigest()
+            assert item["rows"] == part.rows
+
+
+def test_json_parts_concatenate_to_document():
+    data = {str(i): {"rating": i, "topics": ["a", "b"]} for i in range(3000)}
+    with SpooledExport("users.json", part_size=4096) as export:
+        write_json(export, data)
+        export.finish()
+
+        assert export.join == CONCAT and len(export.parts) > 1
+        assert json.loads(b"".join(read_part(part) for part in export.parts)) == data
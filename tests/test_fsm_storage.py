@@ -0,0 +1,60 @@
+# test_fsm_storage.py - ХРАНИЛИЩЕ FSM НА SQLITE
+
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def test_state_and_data_survive_reopen(tmp_path):
+    path = tmp_path / "fsm.sqlite3"
+
+    async def write():
+        storage = SQLiteStorage(path, sweep_interval=0)
+        await storage.set_state(KEY, "DemoStates:quiz")
+        await storage.set_data(KEY, {"topic": "грамматика"})
+        assert await storage.update_data(KEY, {"question": 2}) == {"topic": "грамматика", "question": 2}
+        await storage.close()
+
+    async def read():
+        storage = SQLiteStorage(path, sweep_interval=0)
+        result = await storage.get_state(KEY), await storage.get_data(KEY)
+        await storage.close()
+        return result
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ("DemoStates:quiz", {"topic": "грамматика", "question": 2})
+
+
+def test_ttl_by_state_group_and_clear(tmp_path):
+    async def run():
+        storage = SQLiteStorage(tmp_path / "fsm.sqlite3", ttl=100, state_ttls={"DemoStates": 5}, sweep_interval=0)
+        assert storage.ttl_for("DemoStates:quiz") == 5
+        assert storage.ttl_for("Other:state") == 100
+
+        await storage.set_state(KEY, "DemoStates:quiz")
+        await storage.set_state(KEY, None)
+        # Пустое состояние без данных удаляет строку
+        rows = storage._conn.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+        await storage.close()
+        return rows
+
+    assert asyncio.run(run()) == 0
+
+
+def test_expired_rows_are_not_read_and_swept(tmp_path):
+    async def run():
+        storage = SQLiteStorage(tmp_path / "fsm.sqlite3", state_ttls={"DemoStates": 0.05}, sweep_interval=0)
+        other = StorageKey(bot_id=1, chat_id=20, user_id=20)
+        await storage.set_state(KEY, "DemoStates:quiz")
+        await storage.set_state(other, "Main:menu")
+        time.sleep(0.1)
+        result = await storage.get_state(KEY), await storage.get_state(other), storage.sweep()
+        await storage.close()
+        return result
+
+    assert asyncio.run(run()) == (None, "Main:menu", 1)
@@ -0,0 +1,28 @@
+# test_leaderboard.py - ТАБЛИЦА ЛИДЕРОВ ПО БАЛЛАМ
+
+from leaderboard import Leaderboard
+
+
+def test_rank_page_and_count_above():
+    leaderboard = Leaderboard()
+    leaderboard.rebuild({1: 50, 2: 70, 3: 70, 4: 10})
+
+    assert leaderboard.top(3) == [(2, 70), (3, 70), (1, 50)]
+    assert leaderboard.rank_of(1) == 3
+    assert leaderboard.rank_of(99) is None
+    assert leaderboard.page(2, 5) == [(1, 50), (4, 10)]
+    assert leaderboard.count_above(50) == 2
+
+
+def test_updates_from_rating_events():
+    leaderboard = Leaderboard()
+    leaderboard.rebuild({1: 50, 2: 70, 3: 70, 4: 10})
+
+    # События users_rating: новые баллы и удаление пользователя
+    leaderboard.update(1, 80)
+    leaderboard.update(4, None)
+    leaderboard.update(5, 60)
+
+    assert leaderboard.rank_of(1) == 1
+    assert leaderboard.top(4) == [(1, 80), (2, 70), (3, 70), (5, 60)]
+    assert len(leaderboard) == 4
@@ -0,0 +1,62 @@
+# test_ledger.py - ЖУРНАЛ ТРАНЗАКЦИЙ
+
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from ledger import Ledger
+
+
+def purchase(product_id, amount, when):
+    return {"product_id": product_id, "amount": amount, "purchased_at": when.isoformat()}
+
+
+def subscription(*history):
+    return SimpleNamespace(transaction_history=list(history))
+
+
+def make_ledger():
+    ledger = Ledger()
+    ledger.rebuild({
+        1: subscription(purchase("premium", 100, datetime(2024, 1, 1, 10)),
+                        purchase("pro", 300, datetime(2024, 1, 3, 10))),
+        2: subscription(purchase("premium", 100, datetime(2024, 1, 2, 10))),
+    })
+    return ledger
+
+
+def test_ledger_totals_and_periods():
+    ledger = make_ledger()
+
+    assert (ledger.total_revenue, ledger.total_count) == (500, 3)
+    assert ledger.revenue_between(date(2024, 1, 2), date(2024, 1, 3)) == (400, 2)
+    assert ledger.revenue_between(date(2024, 2, 1), date(2024, 2, 28)) == (0, 0)
+    assert ledger.daily_totals(date(2024, 1, 1), date(2024, 1, 2)) == [
+        (date(2024, 1, 1), 100, 1), (date(2024, 1, 2), 100, 1)
+    ]
+    assert ledger.products() == ["premium", "pro"]
+    assert ledger.product_totals() == {"premium": (200, 2), "pro": (300, 1)}
+
+
+def test_ledger_entries_are_ordered_slices():
+    ledger = make_ledger()
+
+    assert [entry.user_id for entry in ledger.entries()] == [1, 2, 1]
+    assert [entry.amount for entry in ledger.entries(start=datetime(2024, 1, 2))] == [100, 300]
+    assert [entry.user_id for entry in ledger.entries(product_id="premium")] == [1, 2]
+    assert ledger.count_between(end=datetime(2024, 1, 3)) == 2
+    assert ledger.count_between(product_id="missing") == 0
+
+
+def test_ledger_follows_subscription_changes():
+    ledger = make_ledger()
+    sub = subscription(purchase("premium", 100, datetime(2024, 1, 2, 10)),
+                       purchase("premium", 150, datetime(2023, 12, 31, 10)))
+    ledger.on_subscription(2, sub)
+
+    # Запись задним числом встаёт на своё место в порядке дат
+    assert [entry.amount for entry in ledger.entries()] == [150, 100, 100, 300]
+    assert ledger.revenue_between(date(2023, 12, 31), date(2024, 1, 1)) == (250, 2)
+
+    ledger.on_subscription(1, None)
+    assert (ledger.total_revenue, ledger.total_count) == (250, 2)
+    assert ledger.products() == ["premium"]
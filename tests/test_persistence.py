@@ -0,0 +1,205 @@
+# test_persistence.py - ЖУРНАЛ, ШАРДЫ И ВОССТАНОВЛЕНИЕ ПОСЛЕ СБОЯ
+
+import asyncio
+import os
+import time
+
+from journal import Journal
+from persistence import PersistenceManager, ShardedStore
+
+
+def test_replay_segments_then_current(tmp_path):
+    journal = Journal(tmp_path, fsync=False)
+    journal.append("users_rating", 1, 10)
+    journal.rotate()
+    journal.append("users_rating", 1, 20)
+    journal.append("users_rating", 2, deleted=True)
+
+    records = list(journal.replay())
+    journal.close()
+
+    assert [(r["s"], r["k"], r.get("v"), r.get("d")) for r in records] == [
+        ("users_rating", 1, 10, None),
+        ("users_rating", 1, 20, None),
+        ("users_rating", 2, None, 1),
+    ]
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    journal = Journal(tmp_path, fsync=False)
+    journal.append("users_rating", 1, 10)
+    journal.close()
+
+    # Запись оборвана посередине (сбой во время write)
+    with open(tmp_path / Journal.CURRENT, "a", encoding="utf-8") as f:
+        f.write('{"t":1,"s":"users_rating","k":2,"v":')
+
+    journal = Journal(tmp_path, fsync=False)
+    journal.append("users_rating", 3, 30)
+    records = list(journal.replay())
+    journal.close()
+
+    # Оборванная запись отрезана, новая начинается с новой строки
+    assert [(r["k"], r["v"]) for r in records] == [(1, 10), (3, 30)]
+
+
+def test_torn_tail_without_newline_empties_file(tmp_path):
+    (tmp_path / Journal.CURRENT).write_text('{"t":1,"s":"users_r', encoding="utf-8")
+
+    journal = Journal(tmp_path, fsync=False)
+    assert journal.size == 0
+    assert list(journal.replay()) == []
+    journal.close()
+
+
+def test_load_applies_journal_over_shards(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    ratings = {1: 10, 2: 20}
+    store.apply("users_rating", {1, 2}, ratings)
+
+    journal = Journal(tmp_path / "journal", fsync=False)
+    journal.append("users_rating", 1, 15)
+    journal.append("users_rating", 2, deleted=True)
+    journal.append("users_rating", 3, 30)
+
+    manager = PersistenceManager(store, {"users_rating": {}}, journal=journal)
+    data = manager.load()
+    journal.close()
+
+    assert data["users_rating"] == {"1": 15, "3": 30}
+
+
+def test_touch_outside_loop_writes_shard_and_notifies(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    ratings = {1: 10}
+    manager = PersistenceManager(store, {"users_rating": ratings})
+    events = []
+    manager.add_listener("users_rating", lambda key, value: events.append((key, value)))
+
+    manager.touch("users_rating", 1)
+    del ratings[1]
+    ratings[2] = 20
+    manager.mark_dirty("users_rating", 1)
+    manager.touch("users_rating", 2)
+
+    assert store.load_section("users_rating") == {"2": 20}
+    assert events == [(1, 10), (1, None), (2, 20)]
+
+
+def _age_shards(store, seconds):
+    """Сдвинуть время записи шардов в прошлое"""
+    past = time.time() - seconds
+    for path in store.root.iterdir():
+        if path.is_dir():
+            os.utime(path, (past, past))
+
+
+def test_journaled_write_survives_crash(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    ratings = {1: 10, 2: 20}
+    manager = PersistenceManager(store, {"users_rating": ratings},
+                                 journal=Journal(tmp_path / "journal", fsync=False))
+    manager.save_all()
+    _age_shards(store, 100)
+
+    # bot.py сохранил свой файл, затем изменение попало только в журнал
+    saved_at = time.time() - 50
+    ratings[1] = 15
+    del ratings[2]
+    ratings[3] = 30
+    for key in (1, 2, 3):
+        manager.mark_dirty("users_rating", key)
+    manager.journal.flush_buffer()  # сбой: шарды не переписаны, журнал не закрыт
+
+    # Перезапуск: bot.py загрузил состояние из своего (старого) файла
+    restarted = {1: 10, 2: 20}
+    manager = PersistenceManager(ShardedStore(tmp_path / "state"), {"users_rating": restarted},
+                                 journal=Journal(tmp_path / "journal", fsync=False))
+    manager.restore({"users_rating": int}, saved_at=saved_at)
+    manager.journal.close()
+
+    assert restarted == {1: 15, 3: 30}
+    assert manager.restored["users_rating"] == {1, 2, 3}
+
+
+def test_restore_skips_journal_older_than_file(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    journal = Journal(tmp_path / "journal", fsync=False)
+    journal.append("users_rating", 1, 15)
+    journal.flush_buffer()
+    _age_shards(store, 100)
+
+    # Файл bot.py записан позже журнала и уже содержит более новое значение
+    ratings = {1: 16}
+    manager = PersistenceManager(store, {"users_rating": ratings}, journal=journal)
+    manager.restore({"users_rating": int}, saved_at=time.time() + 10)
+    journal.close()
+
+    assert ratings == {1: 16}
+
+
+def test_restore_prefers_newer_store_and_fills_empty_sections(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    PersistenceManager(store, {
+        "users_rating": {1: 10},
+        "users_completed_topics": {1: {"a"}},
+    }).save_all()
+
+    ratings = {1: 5, 2: 7}  # старый файл: пользователь 2 с тех пор удалён
+    topics = {}
+    manager = PersistenceManager(store, {"users_rating": ratings, "users_completed_topics": topics})
+    restored = manager.restore({"users_rating": int, "users_completed_topics": set}, saved_at=0.0)
+
+    assert restored == 2
+    assert ratings == {1: 10}
+    assert topics == {1: {"a"}}
+
+
+class CountingStore(ShardedStore):
+    """Хранилище, запоминающее перезаписанные шарды"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written = []
+
+    def write_shard(self, section, shard, records):
+        self.written.append((section, shard))
+        super().write_shard(section, shard, records)
+
+
+def test_only_dirty_shards_are_rewritten(tmp_path):
+    store = CountingStore(tmp_path / "state", shards=8)
+    ratings = {user_id: user_id for user_id in range(100)}
+    manager = PersistenceManager(store, {"users_rating": ratings, "user_activities": {}})
+    manager.save_all()
+    assert len(store.written) == 8
+
+    store.written.clear()
+    ratings[5] = 500
+    del ratings[7]
+    manager.mark_dirty("users_rating", 5)
+    manager.mark_dirty("users_rating", 7)
+    manager.write_changes()
+
+    assert sorted(store.written) == sorted({("users_rating", store.shard_of(key)) for key in (5, 7)})
+    assert manager.pending == 0
+    assert store.load_record("users_rating", 5) == 500
+    assert store.load_record("users_rating", 7) is None
+
+
+def test_saves_within_delay_are_coalesced(tmp_path):
+    store = CountingStore(tmp_path / "state", shards=1)
+    ratings = {1: 10, 2: 20}
+    manager = PersistenceManager(store, {"users_rating": ratings}, delay=0.05)
+
+    async def run():
+        for value in range(3):
+            ratings[1] = value
+            manager.touch("users_rating", 1)
+        manager.touch("users_rating", 2)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    # Четыре изменения — одна перезапись шарда
+    assert store.written == [("users_rating", 0)]
+    assert store.load_section("users_rating") == {"1": 2, "2": 20}
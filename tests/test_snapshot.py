@@ -0,0 +1,99 @@
+# test_snapshot.py - ДВОИЧНЫЙ СНИМОК СОСТОЯНИЯ
+
+from datetime import datetime
+
+import pytest
+
+from compact import ActivityRecord
+from journal import Journal
+from persistence import PersistenceManager, ShardedStore, _factory
+from snapshot import SnapshotError, SnapshotReader, load_snapshot, write_snapshot
+
+
+def make_record(user_id, elo=1000, banned=False):
+    record = ActivityRecord(user_id, elo_rating=elo)
+    record.lessons_completed = 3
+    record.correct_answers = 7
+    record.first_seen = datetime(2024, 1, 2, 3, 4, 5)
+    record.last_activity = datetime(2024, 2, 3, 4, 5, 6)
+    if banned:
+        record.is_banned = True
+        record.ban_reason = "спам"
+        record.banned_at = datetime(2024, 3, 1, 12, 0)
+    return record
+
+
+def test_snapshot_round_trip_keeps_ban_fields(tmp_path):
+    path = tmp_path / "state.snap"
+    activities = {1: make_record(1, elo=1200), 2: make_record(2, elo=900, banned=True)}
+    subscriptions = {1: {"tier": "premium", "transaction_history": [{"amount": 100}]}}
+    write_snapshot(path, {
+        "users_rating": {1: 50, 2: 70},
+        "user_activities": activities,
+        "user_subscriptions": subscriptions,
+        "users_completed_topics": {2: ["basics"]},
+    })
+
+    state = load_snapshot(path)
+
+    assert state["users_rating"] == {1: 50, 2: 70}
+    assert state["user_subscriptions"] == subscriptions
+    assert state["users_completed_topics"] == {2: ["basics"]}
+    assert {key: value.to_dict() for key, value in state["user_activities"].items()} == {
+        key: value.to_dict() for key, value in activities.items()
+    }
+    assert not hasattr(state["user_activities"][1], "is_banned")
+    assert state["user_activities"][2].ban_reason == "спам"
+
+
+def test_snapshot_accepts_dicts_and_skips_unknown_sections(tmp_path):
+    path = tmp_path / "state.snap"
+    write_snapshot(path, {"user_activities": {7: make_record(7).to_dict()}, "unknown": {1: 1}})
+
+    with SnapshotReader(path) as reader:
+        assert reader.count("user_activities") == 1
+        assert "unknown" not in reader.sections
+        assert [record.user_id for record in reader.activities()] == [7]
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "state.snap"
+    write_snapshot(path, {"users_rating": {1: 50}})
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+
+class Activity:
+    """Класс активности bot.py"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict(data))
+
+
+def test_restore_gives_one_type_for_snapshot_and_journal(tmp_path):
+    store = ShardedStore(tmp_path / "state", shards=4)
+    PersistenceManager(store, {"user_activities": {1: make_record(1).to_dict()}}).save_all()
+    write_snapshot(tmp_path / "state.snap", {"user_activities": {1: make_record(1, elo=1300)}})
+
+    journal = Journal(tmp_path / "journal", fsync=False)
+    journal.append("user_activities", 2, make_record(2).to_dict())
+    activities = {}
+    manager = PersistenceManager(store, {"user_activities": activities}, journal=journal,
+                                 snapshot_path=tmp_path / "state.snap")
+    manager.restore({"user_activities": _factory(Activity)})
+    journal.close()
+
+    assert sorted(activities) == [1, 2]
+    assert all(type(activity) is Activity for activity in activities.values())
+    assert activities[1].data["elo_rating"] == 1300
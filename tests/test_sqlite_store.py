@@ -0,0 +1,67 @@
+# test_sqlite_store.py - ХРАНИЛИЩЕ СОСТОЯНИЯ НА SQLITE
+
+from datetime import datetime
+
+from persistence import PersistenceManager
+from sqlite_store import SQLiteStore
+
+
+class Subscription:
+    def __init__(self, tier, expires_at=None):
+        self.tier = tier
+        self.expires_at = expires_at
+
+    def to_dict(self):
+        return {"tier": self.tier, "expires_at": self.expires_at.isoformat() if self.expires_at else None}
+
+
+def make_sources():
+    return {
+        "users_rating": {1: 10, 2: 20},
+        "user_activities": {1: {"user_id": 1, "elo_rating": 1050, "last_activity": "2024-05-01T10:00:00"}},
+        "user_subscriptions": {2: Subscription("premium", datetime(2030, 1, 1))},
+        "active_duels": {"d1": {"status": "waiting"}},
+        "users_completed_topics": {1: {"b", "a"}},
+        "users_available_topics": {1: ["c", "a", "b"]},
+    }
+
+
+def test_round_trip_all_sections(tmp_path):
+    path = tmp_path / "state.sqlite3"
+    store = SQLiteStore(path)
+    assert store.fresh
+    sources = make_sources()
+    PersistenceManager(store, sources).save_all()
+    store.close()
+
+    store = SQLiteStore(path)
+    assert not store.fresh
+    assert store.load_section("users_rating") == {"1": 10, "2": 20}
+    assert store.load_section("user_activities")["1"]["elo_rating"] == 1050
+    assert store.load_section("user_subscriptions") == {"2": {"tier": "premium", "expires_at": "2030-01-01T00:00:00"}}
+    assert store.load_section("active_duels") == {"d1": {"status": "waiting"}}
+    assert store.load_section("users_completed_topics") == {"1": ["a", "b"]}
+    # Порядок доступных тем сохраняется
+    assert store.load_section("users_available_topics") == {"1": ["c", "a", "b"]}
+    assert store.load_record("users_rating", 2) == 20
+    assert store.load_record("user_subscriptions", 1) is None
+    store.close()
+
+
+def test_only_dirty_records_written_and_deletions_applied(tmp_path):
+    store = SQLiteStore(tmp_path / "state.sqlite3")
+    sources = make_sources()
+    manager = PersistenceManager(store, sources)
+    manager.save_all()
+
+    sources["users_rating"][1] = 11
+    del sources["users_rating"][2]
+    sources["users_available_topics"][1] = ["a"]
+    manager.touch("users_rating", 1)
+    manager.touch("users_rating", 2)
+    manager.touch("users_available_topics", 1)
+
+    assert store.load_section("users_rating") == {"1": 11}
+    assert store.load_section("users_available_topics") == {"1": ["a"]}
+    assert store.modified_at() > 0
+    store.close()
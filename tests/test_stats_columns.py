@@ -0,0 +1,57 @@
+# test_stats_columns.py - КОЛОНОЧНЫЕ СЧЁТЧИКИ АКТИВНОСТИ
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from compact import ActivityRecord
+
+pytest.importorskip("numpy")
+
+from stats_columns import ActivityColumns, aggregate  # noqa: E402
+
+NOW = datetime(2024, 3, 15, 18, 0)
+
+
+def record(user_id, questions, correct, elo, won, last_activity):
+    activity = ActivityRecord(user_id, elo_rating=elo)
+    activity.questions_answered = questions
+    activity.correct_answers = correct
+    activity.duels_won = won
+    activity.last_activity = last_activity
+    return activity
+
+
+def make_columns():
+    columns = ActivityColumns(capacity=2)
+    columns.rebuild({
+        1: record(1, 10, 8, 1200, 1, NOW - timedelta(hours=1)),
+        2: record(2, 30, 12, 1000, 0, NOW - timedelta(days=3)),
+        3: record(3, 0, 0, 1100, 1, NOW - timedelta(days=10)),
+    })
+    return columns
+
+
+def test_aggregates_sums_and_active_counts():
+    stats = make_columns().aggregates(NOW)
+
+    assert (stats["users"], stats["questions"], stats["correct"]) == (3, 40, 20)
+    assert stats["accuracy"] == 50.0
+    assert stats["avg_elo"] == 1100
+    assert stats["total_duels"] == 1
+    assert (stats["active_today"], stats["active_week"]) == (1, 2)
+
+
+def test_update_reuses_rows_and_grows():
+    columns = make_columns()
+    columns.update(2, None)
+    assert len(columns) == 2
+    assert columns.aggregates(NOW)["questions"] == 10
+
+    # Освобождённая строка занимается снова, затем матрица растёт
+    columns.update(4, record(4, 5, 5, 1300, 0, NOW))
+    columns.update(5, record(5, 5, 0, 1000, 0, NOW))
+    block, users = columns.frozen()
+    assert users == 4 and len(block) == 4
+    stats = aggregate(block, users, NOW)
+    assert (stats["questions"], stats["correct"], stats["active_today"]) == (20, 13, 3)
@@ -0,0 +1,88 @@
+# test_stats_snapshot.py - СНИМОК СТАТИСТИКИ И ЕГО КЕШ
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from stats_snapshot import StatsCache, compute_snapshot
+
+
+def collected(activities):
+    """Данные collect_snapshot() без numpy: список записей активности"""
+    return {
+        'now': datetime(2024, 3, 15, 12, 0),
+        'columns': None,
+        'activities': activities,
+        'total_users': len(activities),
+        'active_today': 1,
+        'active_week': 2,
+        'active_month': 3,
+        'daily_active': [],
+        'premium_users': [],
+        'premium_count': 0,
+        'pro_count': 0,
+        'lifetime_count': 0,
+        'total_revenue': 0,
+        'transactions': 0,
+        'duels_active': 0,
+        'duels_waiting': 0,
+        'duels_in_memory': 0,
+        'top_elo': [],
+        'elo_median': None,
+        'elo_p90': None,
+        'elo_histogram': [],
+        'topics': 0,
+        'topic_questions': 0,
+    }
+
+
+def activity(questions, correct, elo, won=0, lost=0):
+    return SimpleNamespace(lessons_completed=1, questions_answered=questions, correct_answers=correct,
+                           elo_rating=elo, duels_won=won, duels_lost=lost, duels_drawn=0)
+
+
+def test_compute_without_columns_uses_records_and_day_index():
+    snapshot = compute_snapshot(collected([activity(10, 5, 1000, won=1), activity(30, 15, 1200, lost=1)]))
+
+    assert (snapshot.lessons, snapshot.questions, snapshot.correct) == (2, 40, 20)
+    assert snapshot.accuracy == 50.0 and snapshot.avg_elo == 1100
+    assert snapshot.total_duels == 1
+    # Без матрицы активные берутся из индекса по дням
+    assert (snapshot.active_today, snapshot.active_week, snapshot.active_month) == (1, 2, 3)
+
+
+def test_cache_shares_refresh_and_respects_ttl():
+    calls = []
+
+    async def collect():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return collected([activity(len(calls), 0, 1000)])
+
+    async def run():
+        cache = StatsCache(collect, compute_snapshot, ttl=60)
+        first, second = await asyncio.gather(cache.get(), cache.get())
+        cached = await cache.get()
+        cache.invalidate()
+        refreshed = await cache.get()
+        return first, second, cached, refreshed
+
+    first, second, cached, refreshed = asyncio.run(run())
+    assert first is second is cached
+    assert refreshed.questions == 2 and len(calls) == 2
+
+
+def test_invalidate_during_refresh_is_not_cached():
+    async def run():
+        cache = StatsCache(None, compute_snapshot, ttl=60)
+
+        async def collect():
+            # Админ изменил данные, пока снимок собирался
+            cache.invalidate()
+            return collected([])
+
+        cache.collect = collect
+        await cache.get()
+        return cache.fresh
+
+    assert asyncio.run(run()) is False
@@ -0,0 +1,92 @@
+# test_subscription_index.py - ИНДЕКС СРОКОВ ПОДПИСОК
+
+from datetime import datetime, timedelta
+
+from subscription_index import SubscriptionIndex
+
+FREE, PREMIUM = "free", "premium"
+
+
+class Sub:
+    def __init__(self, tier, expires_at):
+        self.tier = tier
+        self.expires_at = expires_at
+
+    def is_active(self):
+        return self.expires_at is None or self.expires_at > datetime.now()
+
+
+def test_premium_and_expiring_between():
+    now = datetime.now()
+    subs = {
+        1: Sub(PREMIUM, now + timedelta(days=1)),
+        2: Sub(PREMIUM, now + timedelta(days=10)),
+        3: Sub(PREMIUM, None),
+        4: Sub(FREE, None),
+    }
+    index = SubscriptionIndex(FREE)
+    index.rebuild(subs)
+
+    assert index.premium_ids() == {1, 2, 3}
+    assert [user_id for user_id, _ in index.expiring_between(now, now + timedelta(days=3))] == [1]
+    assert [user_id for user_id, _, _ in index.by_expiry()] == [1, 2, 3]
+
+
+def test_sweep_downgrades_expired_and_notifies():
+    now = datetime.now()
+    subs = {1: Sub(PREMIUM, now + timedelta(hours=1)), 2: Sub(PREMIUM, now + timedelta(days=5))}
+    touched, notified = [], []
+
+    def touch(user_id):
+        # Как mark_dirty: изменение приходит в индекс событием
+        touched.append(user_id)
+        index.on_subscription(user_id, subs[user_id])
+
+    index = SubscriptionIndex(FREE, subs, touch=touch)
+    index.rebuild(subs)
+    index.add_expiry_listener(notified.append)
+
+    # Срок первой подписки наступил
+    subs[1].expires_at = now - timedelta(seconds=1)
+    assert index.sweep(now + timedelta(hours=2)) == [1]
+
+    assert subs[1].tier == FREE and subs[2].tier == PREMIUM
+    assert touched == [1] and notified == [[1]]
+    assert index.premium_ids() == {2}
+    assert index.sweep(now + timedelta(hours=2)) == []
+
+
+def test_sweep_skips_renewed_subscription():
+    now = datetime.now()
+    subs = {1: Sub(PREMIUM, now + timedelta(hours=1))}
+    index = SubscriptionIndex(FREE, subs)
+    index.rebuild(subs)
+
+    # Продлена в bot.py, а индекс ещё не получил изменение
+    subs[1].expires_at = now + timedelta(days=30)
+    assert index.sweep(now + timedelta(hours=2)) == []
+    assert subs[1].tier == PREMIUM
+
+
+def test_reminders_sent_once_and_survive_restart(tmp_path):
+    now = datetime.now()
+    subs = {1: Sub(PREMIUM, now + timedelta(days=2)), 2: Sub(PREMIUM, now + timedelta(days=20))}
+    path = tmp_path / "reminders.json"
+    index = SubscriptionIndex(FREE, subs, reminders_path=path)
+    index.rebuild(subs)
+    reminded = []
+    index.add_reminder_listener(reminded.append)
+
+    assert [user_id for user_id, _ in index.remind(timedelta(days=3), now)] == [1]
+    assert index.remind(timedelta(days=3), now) == []
+    assert len(reminded) == 1
+
+    restarted = SubscriptionIndex(FREE, subs, reminders_path=path)
+    restarted.rebuild(subs)
+    assert restarted.load_reminders()
+    assert restarted.remind(timedelta(days=3), now) == []
+
+    # Продление даёт новый срок и новое напоминание
+    subs[1].expires_at = now + timedelta(days=2, hours=12)
+    restarted.on_subscription(1, subs[1])
+    assert [user_id for user_id, _ in restarted.remind(timedelta(days=3), now)] == [1]
@@ -0,0 +1,45 @@
+# test_topic_index.py - ОБРАТНЫЙ ИНДЕКС ТЕМА → ПОЛЬЗОВАТЕЛИ
+
+from topic_index import TopicIndex
+
+
+def make_index():
+    index = TopicIndex()
+    index.rebuild(
+        completed={1: {"a", "b"}, 2: {"a"}, 3: set()},
+        available={1: ["a", "b", "c"], 2: ["a", "c"]},
+    )
+    return index
+
+
+def test_counts_and_users_after_rebuild():
+    index = make_index()
+
+    assert index.completed_count("a") == 2
+    assert index.completed_count("b") == 1
+    assert index.completed_count("missing") == 0
+    assert index.available_users("c") == {1, 2}
+
+
+def test_events_move_users_between_topics():
+    index = make_index()
+
+    index.on_completed(2, {"b"})
+    index.on_completed(1, None)
+    index.on_available(2, ["a"])
+
+    assert index.completed_users("a") == set()
+    assert index.completed_users("b") == {2}
+    assert index.available_users("c") == {1}
+
+
+def test_users_are_a_copy_safe_to_change_while_iterating():
+    index = make_index()
+    progress = {1: {"a", "b"}, 2: {"a"}}
+
+    for user_id in index.completed_users("a"):
+        progress[user_id].discard("a")
+        index.on_completed(user_id, progress[user_id])
+
+    assert index.completed_count("a") == 0
+    assert index.completed_count("b") == 1
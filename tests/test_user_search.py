@@ -0,0 +1,85 @@
+# test_user_search.py - НОРМАЛИЗАЦИЯ И РАНЖИРОВАНИЕ ПОИСКА ПОЛЬЗОВАТЕЛЕЙ
+
+from user_search import (
+    SCORE_NAME_EXACT, SCORE_NAME_PREFIX, SCORE_USERNAME_EXACT, SCORE_USERNAME_PREFIX,
+    UserSearchIndex, normalize, trigrams, words
+)
+
+
+def make_index():
+    index = UserSearchIndex()
+    index.update(1, "alex", "Алексей", "Иванов")
+    index.update(2, "alexander_k", "Александр", None)
+    index.update(3, None, "Пётр", "Семёнов")
+    index.update(4, "maria", "Мария", "Alexeeva")
+    return index
+
+
+def test_normalize():
+    assert normalize("ЁЛКА") == "елка"
+    assert normalize("Семёнов") == "семенов"
+    assert normalize("Ａｌｅｘ") == "alex"  # Полноширинные символы
+    assert normalize(None) == ""
+    assert words("@Alex_K Пётр") == ["alex_k", "петр"]
+
+
+def test_trigrams_are_padded():
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_yo_matches_e_both_ways():
+    index = make_index()
+    assert [user_id for user_id, _ in index.search("семенов")] == [3]
+    assert [user_id for user_id, _ in index.search("Пётр")] == [3]
+
+
+def test_exact_username_ranks_above_prefix():
+    index = make_index()
+    results = index.search("alex")
+
+    assert results[0] == (1, SCORE_USERNAME_EXACT)
+    assert results[1] == (2, SCORE_USERNAME_PREFIX)
+    assert 4 in [user_id for user_id, _ in results]  # Префикс фамилии
+    assert dict(results)[4] < SCORE_USERNAME_PREFIX
+
+
+def test_all_query_words_must_match():
+    index = make_index()
+    assert index.search("алексей иванов") == [(1, SCORE_NAME_EXACT * 2)]
+    assert index.search("алексей петров") == []
+
+
+def test_trigram_match_with_typo_ranks_below_prefix():
+    index = make_index()
+    results = index.search("алексндр")
+
+    assert results[0][0] == 2
+    assert all(0 < score < SCORE_NAME_PREFIX for _, score in results)
+
+    # Префикс имени выше нечёткого совпадения
+    results = index.search("алекс")
+    assert {user_id for user_id, _ in results[:2]} == {1, 2}
+    assert results[0][1] == SCORE_NAME_PREFIX
+
+
+def test_update_reindexes_and_remove_unindexes():
+    index = make_index()
+    index.update(1, "sasha", "Алексей", "Иванов")
+    assert 1 not in dict(index.search("alex"))
+    assert index.search("sasha")[0][0] == 1
+
+    index.remove(1)
+    assert index.search("sasha") == []
+    assert index.label(1) == "ID: 1"
+    assert index.label(3) == "Пётр Семёнов"
+    assert index.label(4) == "@maria"
+
+
+def test_among_limits_results_to_registered_users():
+    index = make_index()
+    for user_id in range(10, 30):
+        index.update(user_id, f"alex{user_id}", None, None)
+
+    # Незарегистрированные профили не вытесняют зарегистрированных из выдачи
+    found = [user_id for user_id, _ in index.search("alex", limit=3, among={1, 2, 4})]
+    assert found == [1, 2, 4]
@@ -0,0 +1,113 @@
+# topic_index.py - ОБРАТНЫЙ ИНДЕКС ТЕМА → ПОЛЬЗОВАТЕЛИ
+#
+# Для каждой темы хранится множество пользователей, которые её изучили,
+# и множество тех, кому она доступна. Индекс обновляется событиями
+# users_completed_topics и users_available_topics (persistence), поэтому
+# число изучивших тему читается за O(1), а удаление темы
+# (admin_confirm_delete) обходит только completed_users()/available_users()
+# вместо всех пользователей.
+#
+# Темы, выданные bot.py без mark_dirty, приходят в индекс через фоновый
+# поиск изменений (change_scan.py) с задержкой до CHANGE_SCAN_INTERVAL;
+# экраны удаления перед чтением вызывают sync_changes().
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Inverted:
+    """Обратный индекс одного раздела: тема -> пользователи"""
+
+    def __init__(self):
+        self.users: Dict[str, Set[Hashable]] = defaultdict(set)
+        # Последние известные темы пользователя: по ним считается разница
+        self.topics: Dict[Hashable, FrozenSet[str]] = {}
+
+    def update(self, user_id: Hashable, topics: Optional[Iterable[str]]):
+        new = frozenset(topics) if topics else frozenset()
+        old = self.topics.get(user_id, frozenset())
+        if new == old:
+            return
+
+        for topic_key in old - new:
+            users = self.users[topic_key]
+            users.discard(user_id)
+            if not users:
+                del self.users[topic_key]
+        for topic_key in new - old:
+            self.users[topic_key].add(user_id)
+
+        if new:
+            self.topics[user_id] = new
+        else:
+            self.topics.pop(user_id, None)
+
+    def rebuild(self, records: Dict[Hashable, Iterable[str]]):
+        self.users = defaultdict(set)
+        self.topics = {}
+        for user_id, topics in records.items():
+            self.update(user_id, topics)
+
+
+class TopicIndex:
+    """Кто изучил тему и кому она доступна"""
+
+    def __init__(self):
+        self.completed = _Inverted()
+        self.available = _Inverted()
+
+    def on_completed(self, user_id: Hashable, topics: Any):
+        """Обработчик изменений users_completed_topics"""
+        self.completed.update(user_id, topics)
+
+    def on_available(self, user_id: Hashable, topics: Any):
+        """Обработчик изменений users_available_topics"""
+        self.available.update(user_id, topics)
+
+    def completed_count(self, topic_key: str) -> int:
+        """Сколько пользователей изучили тему"""
+        users = self.completed.users.get(topic_key)
+        return len(users) if users else 0
+
+    def available_count(self, topic_key: str) -> int:
+        """Скольким пользователям тема доступна"""
+        users = self.available.users.get(topic_key)
+        return len(users) if users else 0
+
+    def completed_users(self, topic_key: str) -> Set[Hashable]:
+        """Копия множества изучивших тему (безопасно менять прогресс при обходе)"""
+        return set(self.completed.users.get(topic_key, ()))
+
+    def available_users(self, topic_key: str) -> Set[Hashable]:
+        return set(self.available.users.get(topic_key, ()))
+
+    def rebuild(self, completed: Dict[Hashable, Iterable[str]], available: Dict[Hashable, Iterable[str]]):
+        """Полная сборка из словарей прогресса"""
+        self.completed.rebuild(completed)
+        self.available.rebuild(available)
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_index: Optional[TopicIndex] = None
+
+
+def get_topic_index() -> TopicIndex:
+    """Индекс тем, подписанный на изменения прогресса пользователей"""
+    global _index
+    if _index is None:
+        from bot import users_completed_topics, users_available_topics
+        from persistence import get_persistence
+
+        _index = TopicIndex()
+        _index.rebuild(users_completed_topics, users_available_topics)
+
+        persistence = get_persistence()
+        persistence.add_listener("users_completed_topics", _index.on_completed)
+        persistence.add_listener("users_available_topics", _index.on_available)
+    return _index
@@ -0,0 +1,290 @@
+# user_search.py - ПОИСК ПОЛЬЗОВАТЕЛЕЙ ПО USERNAME И ИМЕНИ
+#
+# Username, имя и фамилия пользователя берутся из входящих апдейтов
+# (UserProfileMiddleware) и раскладываются на нормализованные слова:
+# нижний регистр, «ё» → «е», без «@». По словам строятся два индекса:
+#   • отсортированный список (слово, user_id) — поиск по префиксу
+#     двоичным поиском,
+#   • триграммы слов → пользователи — поиск по фрагменту и с опечатками.
+# Результаты ранжируются: точное совпадение username выше префикса,
+# префикс выше совпадения по фрагменту.
+#
+# Профили хранятся на диске, чтобы индекс не пустел после перезапуска.
+#
+# Middleware должно стоять на апдейтах того диспетчера, который
+# обслуживает admin_router. Запуск admin_router вызывает
+# setup_user_search(dispatcher) сам; явное подключение в bot.py:
+#     from user_search import UserProfileMiddleware
+#     dp.update.outer_middleware(UserProfileMiddleware())
+
+import asyncio
+import heapq
+import json
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Container, Dict, Hashable, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from sortedcontainers import SortedList
+
+from persistence import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+# Веса совпадений при ранжировании
+SCORE_USERNAME_EXACT = 100
+SCORE_USERNAME_PREFIX = 70
+SCORE_NAME_EXACT = 60
+SCORE_NAME_PREFIX = 40
+SCORE_TRIGRAM = 30  # Умножается на долю общих триграмм
+MIN_SIMILARITY = 0.5
+
+
+def normalize(text: Optional[str]) -> str:
+    """Нижний регистр, «ё» → «е», совместимые формы Unicode"""
+    if not text:
+        return ""
+    return unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+
+
+def words(text: Optional[str]) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class UserSearchIndex:
+    """Префиксный и триграммный индекс профилей пользователей"""
+
+    def __init__(self, path: Optional[Path] = None, delay: float = 30.0):
+        self.path = Path(path) if path else None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.delay = delay
+
+        # user_id -> (username, first_name, last_name) как в Telegram
+        self.profiles: Dict[Hashable, Tuple[str, str, str]] = {}
+        # user_id -> слова username и слова имени
+        self._words: Dict[Hashable, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+        self._prefix = SortedList()  # (слово, признак username, user_id)
+        self._trigrams: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    # ==============================
+    # ОБНОВЛЕНИЕ
+    # ==============================
+
+    def _unindex(self, user_id: Hashable):
+        old = self._words.pop(user_id, None)
+        if old is None:
+            return
+        username_words, name_words = old
+        for is_username, group in ((1, username_words), (0, name_words)):
+            for word in group:
+                self._prefix.discard((word, is_username, user_id))
+        for word in set(username_words + name_words):
+            for gram in trigrams(word):
+                users = self._trigrams.get(gram)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self._trigrams[gram]
+
+    def _index(self, user_id: Hashable, profile: Tuple[str, str, str]):
+        username, first_name, last_name = profile
+        username_words = tuple(words(username))
+        name_words = tuple(words(first_name) + words(last_name))
+        self._words[user_id] = (username_words, name_words)
+        for is_username, group in ((1, username_words), (0, name_words)):
+            for word in group:
+                self._prefix.add((word, is_username, user_id))
+        for word in set(username_words + name_words):
+            for gram in trigrams(word):
+                self._trigrams[gram].add(user_id)
+
+    def update(self, user_id: Hashable, username: Optional[str], first_name: Optional[str],
+               last_name: Optional[str]) -> bool:
+        """Обновить профиль; True, если что-то изменилось"""
+        profile = (username or "", first_name or "", last_name or "")
+        if self.profiles.get(user_id) == profile:
+            return False
+        self._unindex(user_id)
+        self.profiles[user_id] = profile
+        self._index(user_id, profile)
+        self._schedule_save()
+        return True
+
+    def remove(self, user_id: Hashable):
+        self._unindex(user_id)
+        if self.profiles.pop(user_id, None) is not None:
+            self._schedule_save()
+
+    # ==============================
+    # ПОИСК
+    # ==============================
+
+    def _match_word(self, word: str, enough: int,
+                    among: Optional[Container[Hashable]] = None) -> Dict[Hashable, float]:
+        """Лучшая оценка каждого пользователя для одного слова запроса"""
+        scores: Dict[Hashable, float] = {}
+
+        for token, is_username, user_id in self._prefix.irange((word,), (word + "\uffff",)):
+            if among is not None and user_id not in among:
+                continue
+            if token == word:
+                score = SCORE_USERNAME_EXACT if is_username else SCORE_NAME_EXACT
+            else:
+                score = SCORE_USERNAME_PREFIX if is_username else SCORE_NAME_PREFIX
+            if score > scores.get(user_id, 0):
+                scores[user_id] = score
+
+        # Нечёткий поиск нужен, только если по префиксу нашлось мало:
+        # его оценки всегда ниже префиксных и не меняют верх выдачи
+        if len(word) >= 3 and len(scores) < enough:
+            grams = trigrams(word)
+            shared: Dict[Hashable, int] = defaultdict(int)
+            for gram in grams:
+                for user_id in self._trigrams.get(gram, ()):
+                    if among is None or user_id in among:
+                        shared[user_id] += 1
+            for user_id, count in shared.items():
+                similarity = count / len(grams)
+                if similarity >= MIN_SIMILARITY:
+                    score = SCORE_TRIGRAM * similarity
+                    if score > scores.get(user_id, 0):
+                        scores[user_id] = score
+        return scores
+
+    def search(self, query: str, limit: int = 10,
+               among: Optional[Container[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        """Пользователи по запросу: [(user_id, оценка)], лучшие первыми
+
+        among — только эти пользователи (например, users_rating: профили
+        есть и у тех, кто писал боту, но не зарегистрирован).
+        """
+        query_words = words(query)
+        if not query_words:
+            return []
+
+        # Каждое слово запроса должно совпасть; оценки слов складываются
+        total: Optional[Dict[Hashable, float]] = None
+        for word in query_words:
+            scores = self._match_word(word, limit, among)
+            if total is None:
+                total = scores
+            else:
+                total = {user_id: total[user_id] + score for user_id, score in scores.items() if user_id in total}
+            if not total:
+                return []
+
+        return heapq.nsmallest(limit, total.items(), key=lambda item: (-item[1], item[0]))
+
+    def label(self, user_id: Hashable) -> str:
+        """Подпись пользователя: @username, имя или ID"""
+        username, first_name, last_name = self.profiles.get(user_id, ("", "", ""))
+        if username:
+            return f"@{username}"
+        name = " ".join(part for part in (first_name, last_name) if part)
+        return name or f"ID: {user_id}"
+
+    # ==============================
+    # ХРАНЕНИЕ
+    # ==============================
+
+    def load(self) -> bool:
+        """Загрузка профилей с диска; False, если файла нет"""
+        if self.path is None or not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        for user_id, profile in data.items():
+            user_id = int(user_id)
+            self.profiles[user_id] = tuple(profile)
+            self._index(user_id, self.profiles[user_id])
+        return True
+
+    def save(self):
+        """Синхронная запись профилей"""
+        if self.path is not None:
+            write_json_atomic(self.path, {str(user_id): list(profile) for user_id, profile in self.profiles.items()})
+
+    def _schedule_save(self):
+        if self.path is None or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.delay, self._scheduled_save)
+
+    def _scheduled_save(self):
+        self._save_handle = None
+        payload = {str(user_id): list(profile) for user_id, profile in self.profiles.items()}
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, write_json_atomic, self.path, payload)
+        future.add_done_callback(self._saved)
+
+    def _saved(self, future):
+        if future.exception() is not None:
+            logger.error(f"❌ Ошибка сохранения профилей пользователей: {future.exception()}")
+
+
+# ==============================
+# MIDDLEWARE
+# ==============================
+
+class UserProfileMiddleware(BaseMiddleware):
+    """Запоминает username и имя отправителя каждого апдейта"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            try:
+                get_user_search().update(user.id, user.username, user.first_name, user.last_name)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления профиля {user.id}: {e}")
+        return await handler(event, data)
+
+
+def setup_user_search(dispatcher) -> bool:
+    """Подключить UserProfileMiddleware к апдейтам диспетчера (один раз)"""
+    middlewares = dispatcher.update.outer_middleware
+    if any(isinstance(middleware, UserProfileMiddleware) for middleware in middlewares):
+        return False
+    middlewares.register(UserProfileMiddleware())
+    return True
+
+
+# ==============================
+# ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
+# ==============================
+
+_index: Optional[UserSearchIndex] = None
+
+
+def get_user_search() -> UserSearchIndex:
+    """Индекс поиска пользователей, загруженный с диска"""
+    global _index
+    if _index is None:
+        from config import config
+
+        _index = UserSearchIndex(config.DATA_DIR / "user_profiles.json")
+        _index.load()
+    return _index